@@ -0,0 +1 @@
+"""Benchmarks for the pysmartapp package."""
@@ -0,0 +1,74 @@
+"""Benchmark filtering events in Python against the EventBatch columns.
+
+Run from the repository root with ``python -m benchmarks.bench_batch``.
+"""
+
+from pysmartapp import event
+from pysmartapp.event import EventBatch, EventRequest
+
+from .bench_events import get_payload
+from .utilities import measure, report
+
+SIZES = [10, 100, 1000]
+
+
+def get_mixed_payload(size: int) -> dict:
+    """Get an event request where every other event is a temperature."""
+    data = get_payload(size)
+    for index, item in enumerate(data['eventData']['events']):
+        if index % 2:
+            item['deviceEvent'].update({
+                'capability': 'temperatureMeasurement',
+                'attribute': 'temperature', 'value': 20 + index % 7,
+                'stateChange': index % 3 == 0})
+    return data
+
+
+def main():
+    """Compare looping over events with masking the batch columns."""
+    for size in SIZES:
+        data = get_mixed_payload(size)
+
+        def loop(data=data):
+            req = EventRequest(data)
+            return [evt.value for evt in req.events
+                    if evt.capability == 'temperatureMeasurement'
+                    and evt.state_change]
+
+        def batch(data=data):
+            batch = EventRequest(data).batch
+            return batch.values(batch.mask(
+                capability='temperatureMeasurement', state_change=True))
+
+        def second_query(data=data):
+            req = EventRequest(data)
+            batch = req.batch
+            batch.mask(capability='temperatureMeasurement')
+            return batch.values(batch.mask(
+                capability='temperatureMeasurement', state_change=True))
+
+        def second_loop(data=data):
+            req = EventRequest(data)
+            temperatures = [evt for evt in req.events
+                            if evt.capability == 'temperatureMeasurement']
+            return temperatures, [evt.value for evt in req.events
+                                  if evt.capability == 'temperatureMeasurement'
+                                  and evt.state_change]
+
+        baseline = measure(loop, number=100)
+        report(F"{size} events: event loop", baseline)
+        report(F"{size} events: batch, lists",
+               measure(batch, number=100), baseline)
+        if event.numpy is not None:
+            EventBatch.use_numpy = True
+            report(F"{size} events: batch, numpy",
+                   measure(batch, number=100), baseline)
+            EventBatch.use_numpy = False
+        baseline = measure(second_loop, number=100)
+        report(F"{size} events: event loop, two queries", baseline)
+        report(F"{size} events: batch, two queries",
+               measure(second_query, number=100), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark sending a signal to many connected targets.
+
+Run from the repository root with ``python -m benchmarks.bench_dispatch``.
+"""
+
+import asyncio
+import functools
+import time
+
+from pysmartapp.dispatch import Dispatcher
+
+from .utilities import report
+
+SIZES = [1, 10, 100]
+
+
+class ClassifyingDispatcher(Dispatcher):
+    """Classifies each target on every send like the dispatcher used to."""
+
+    def _default_send(self, signal, *args):
+        """Fire a signal, unwrapping and checking each target."""
+        futures = []
+        for invoker in self._signals[signal]:
+            func = check_target = invoker.target
+            while isinstance(check_target, functools.partial):
+                check_target = check_target.func
+            if asyncio.iscoroutinefunction(check_target):
+                futures.append(self._loop.create_task(func(*args)))
+        return futures
+
+
+async def handler(*args):
+    """Do nothing when the signal is sent."""
+    return args
+
+
+async def time_send(dispatcher: Dispatcher, size: int,
+                    repeat: int = 7) -> float:
+    """Get the best time of send alone, excluding running the tasks."""
+    number = max(2000 // size, 10)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        batches = [dispatcher.send('EVENT', None, None)
+                   for _ in range(number)]
+        timings.append(time.perf_counter() - start)
+        for futures in batches:
+            await asyncio.gather(*futures)
+    return min(timings) / number * 1e6
+
+
+def main():
+    """Compare classifying targets per send with pre-bound invokers."""
+    loop = asyncio.new_event_loop()
+    for size in SIZES:
+        timings = {}
+        for dispatcher_type in (ClassifyingDispatcher, Dispatcher):
+            dispatcher = dispatcher_type(loop=loop)
+            for _ in range(size):
+                dispatcher.connect('EVENT', functools.partial(handler))
+            loop.run_until_complete(time_send(dispatcher, size))
+            timings[dispatcher_type] = loop.run_until_complete(
+                time_send(dispatcher, size))
+        baseline = timings[ClassifyingDispatcher]
+        report(F"{size} targets: classify per send", baseline)
+        report(F"{size} targets: pre-bound invokers",
+               timings[Dispatcher], baseline)
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark creating event requests with many events.
+
+Run from the repository root with ``python -m benchmarks.bench_events``.
+"""
+
+import copy
+import tracemalloc
+
+from pysmartapp.event import EventRequest
+
+from .utilities import get_fixture, measure, report
+
+SIZES = [1, 50, 500]
+DEVICE_FIELDS = [
+    'subscriptionName', 'eventId', 'locationId', 'deviceId', 'componentId',
+    'capability', 'attribute', 'value', 'valueType', 'stateChange']
+
+
+class EagerEvent:
+    """Copies every field up front like Event did before it was a view."""
+
+    def __init__(self, data: dict):
+        """Copy the fields of the raw event."""
+        self.event_type = data['eventType']
+        device_event = data['deviceEvent']
+        for field in DEVICE_FIELDS:
+            setattr(self, field, device_event[field])
+        self.data = device_event.get('data')
+        self.timer_name = self.timer_type = self.timer_time = \
+            self.timer_expression = None
+
+
+def get_payload(size: int) -> dict:
+    """Get an event request fixture with the given number of events."""
+    data = get_fixture('event_request')
+    event = data['eventData']['events'][0]
+    data['eventData']['events'] = [copy.deepcopy(event) for _ in range(size)]
+    return data
+
+
+def peak_memory(func) -> int:
+    """Get the peak bytes allocated while calling the function."""
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    """Compare eagerly and lazily materialized events."""
+    for size in SIZES:
+        data = get_payload(size)
+
+        def eager(data=data):
+            req = EventRequest(data)
+            return req, [EagerEvent(item)
+                         for item in data['eventData']['events']]
+
+        def eager_all(data=data, eager=eager):
+            req, events = eager(data)
+            return req, [evt.capability for evt in events]
+
+        def lazy(data=data):
+            return EventRequest(data)
+
+        def lazy_first(data=data):
+            req = EventRequest(data)
+            return req, req.events[0].capability
+
+        def lazy_all(data=data):
+            req = EventRequest(data)
+            return req, [evt.capability for evt in req.events]
+
+        baseline = measure(eager, number=200)
+        report(F"{size} events: eager", baseline)
+        report(F"{size} events: lazy, untouched",
+               measure(lazy, number=200), baseline)
+        report(F"{size} events: lazy, first read",
+               measure(lazy_first, number=200), baseline)
+        baseline_all = measure(eager_all, number=200)
+        report(F"{size} events: eager, all read", baseline_all)
+        report(F"{size} events: lazy, all read",
+               measure(lazy_all, number=200), baseline_all)
+        print(F"{size} events: peak bytes eager {peak_memory(eager)}, "
+              F"lazy {peak_memory(lazy)}, "
+              F"lazy all read {peak_memory(lazy_all)}")
+
+
+if __name__ == '__main__':
+    main()
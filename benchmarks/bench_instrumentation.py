@@ -0,0 +1,45 @@
+"""Benchmark the overhead of recording stage timings.
+
+Run from the repository root with
+``python -m benchmarks.bench_instrumentation``.
+"""
+
+import asyncio
+
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.instrumentation import Instrumentation
+from pysmartapp.smartapp import SmartApp
+
+from .utilities import get_fixture, measure_async, report
+
+
+def main():
+    """Compare handling requests with and without instrumentation."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    instrumentation = Instrumentation()
+    plain = SmartApp(dispatcher=Dispatcher(loop=loop))
+    timed = SmartApp(dispatcher=Dispatcher(loop=loop),
+                     instrumentation=instrumentation)
+    for name in ('ping_request', 'event_request'):
+        data = get_fixture(name)
+
+        async def handle_plain(data=data):
+            await plain.handle_request(data, None, False)
+
+        async def handle_timed(data=data):
+            await timed.handle_request(data, None, False)
+
+        baseline = measure_async(loop, handle_plain, number=2000)
+        report(F"{name}: disabled", baseline)
+        report(F"{name}: enabled", measure_async(
+            loop, handle_timed, number=2000), baseline)
+    for lifecycle, stages in instrumentation.snapshot().items():
+        for stage, timing in stages.items():
+            print(F"{lifecycle:<8} {stage:<10} p50 {timing.p50_ns:>8} ns "
+                  F"p99 {timing.p99_ns:>8} ns")
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
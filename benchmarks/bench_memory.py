@@ -0,0 +1,54 @@
+"""Benchmark the memory and construction time of requests and events.
+
+Run from the repository root with ``python -m benchmarks.bench_memory``.
+"""
+
+import tracemalloc
+
+from pysmartapp.event import Event
+from pysmartapp.utilities import create_request
+
+from .bench_events import get_payload
+from .utilities import get_fixture, measure, report
+
+INSTANCES = 10000
+FIXTURES = ['config_init_request', 'install_request', 'event_request',
+            'uninstall_request']
+
+
+def bytes_per_instance(factory) -> float:
+    """Get the average bytes allocated per instance created."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [factory() for _ in range(INSTANCES)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del instances
+    return (after - before) / INSTANCES
+
+
+def main():
+    """Report per-instance memory and construction time."""
+    raw_event = get_fixture('event_request')['eventData']['events'][0]
+    size = bytes_per_instance(lambda: Event(raw_event))
+    print(F"{'Event':<40} {size:>10.1f} bytes")
+    for fixture in FIXTURES:
+        data = get_fixture(fixture)
+        size = bytes_per_instance(lambda data=data: create_request(data))
+        print(F"{fixture:<40} {size:>10.1f} bytes")
+    data = get_payload(500)
+    events = data['eventData']['events']
+
+    def materialize():
+        return list(create_request(data).events)
+
+    report('500 events: construct request', measure(
+        lambda: create_request(data), number=200))
+    report('500 events: construct and materialize',
+           measure(materialize, number=200))
+    report('500 events: Event() each', measure(
+        lambda: [Event(item) for item in events], number=200))
+
+
+if __name__ == '__main__':
+    main()
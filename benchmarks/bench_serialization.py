@@ -0,0 +1,42 @@
+"""Benchmark the dict and raw bytes request entry points.
+
+Run from the repository root with
+``python -m benchmarks.bench_serialization``.
+"""
+
+import asyncio
+import json
+
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.smartapp import SmartApp
+
+from .utilities import get_fixture, measure_async, report
+
+FIXTURES = ['ping_request', 'config_init_request', 'install_request',
+            'event_request', 'uninstall_request']
+
+
+def main():
+    """Compare decoding with json and handle_request_bytes."""
+    loop = asyncio.new_event_loop()
+    app = SmartApp(dispatcher=Dispatcher(loop=loop))
+    for fixture in FIXTURES:
+        body = json.dumps(get_fixture(fixture)).encode()
+
+        async def dict_path(body=body):
+            data = json.loads(body)
+            resp = await app.handle_request(data, None, False)
+            return json.dumps(resp).encode()
+
+        async def bytes_path(body=body):
+            return await app.handle_request_bytes(body, None, False)
+
+        baseline = measure_async(loop, dict_path)
+        report(F"{fixture} json + handle_request", baseline)
+        report(F"{fixture} handle_request_bytes",
+               measure_async(loop, bytes_path), baseline)
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark serving lifecycle requests over HTTP on localhost.
+
+Run from the repository root with ``python -m benchmarks.bench_server``.
+"""
+
+import asyncio
+import json
+import time
+
+from pysmartapp.server import start_server
+from pysmartapp.smartapp import SmartApp
+
+from .utilities import get_fixture, report
+
+CONNECTIONS = 16
+REQUESTS = 500
+
+
+async def start_framework_server(app: SmartApp, host: str, port: int):
+    """Serve the app the way a web framework hosting it would.
+
+    Each request is read through stream readers into a header mapping,
+    the body is decoded with json and the response dict is encoded again,
+    which is what a framework route calling handle_request does.
+    """
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        while True:
+            try:
+                request_line = await reader.readline()
+            except ConnectionError:
+                break
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line == '\r\n':
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().title()] = value.strip()
+            body = await reader.readexactly(int(headers['Content-Length']))
+            data = await app.handle_request(json.loads(body), headers, False)
+            content = json.dumps(data).encode('utf-8')
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                b'Content-Length: ' + str(len(content)).encode('ascii') +
+                b'\r\n\r\n' + content)
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+async def client(port: int, request: bytes, number: int):
+    """Send the requests one after another on a kept-alive connection."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for _ in range(number):
+        writer.write(request)
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = int(head.lower().split(b'content-length:')[1]
+                     .split(b'\r\n')[0])
+        await reader.readexactly(length)
+    writer.close()
+
+
+async def time_server(server, body: bytes, repeat: int = 3) -> float:
+    """Get the best time per request with concurrent clients."""
+    port = server.sockets[0].getsockname()[1]
+    request = (F"POST / HTTP/1.1\r\nHost: localhost\r\n"
+               F"Content-Type: application/json\r\n"
+               F"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await asyncio.gather(*(client(port, request, REQUESTS)
+                               for _ in range(CONNECTIONS)))
+        timings.append(time.perf_counter() - start)
+    server.close()
+    await server.wait_closed()
+    return min(timings) / (CONNECTIONS * REQUESTS) * 1e6
+
+
+async def run():
+    """Compare the built-in server with a framework-style server."""
+    app = SmartApp()
+    app.connect_event(lambda *args: None)
+    for name in ('ping_request', 'event_request'):
+        body = json.dumps(get_fixture(name)).encode('utf-8')
+        baseline = await time_server(
+            await start_framework_server(app, '127.0.0.1', 0), body)
+        report(F"{name}: framework-style", baseline)
+        report(F"{name}: HttpProtocol", await time_server(
+            await start_server(app, '127.0.0.1', 0,
+                               validate_signature=False), body), baseline)
+
+
+def main():
+    """Run the benchmark."""
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Benchmark signature verification.
+
+Run from the repository root with ``python -m benchmarks.bench_signature``.
+"""
+
+from httpsig.verify import HeaderVerifier
+
+from pysmartapp.signature import CryptographyVerifier, HttpSigVerifier
+
+from .utilities import get_fixture, measure, report
+
+
+def main():
+    """Compare the verification engines on the signed fixture."""
+    public_key = get_fixture('public_key', 'pem')
+    headers = get_fixture('config_init_sig_pass_request')['headers']
+
+    def per_request():
+        HeaderVerifier(headers=headers, secret=public_key, method='POST',
+                       path='/').verify()
+
+    baseline = measure(per_request)
+    report('HeaderVerifier per request', baseline)
+    for factory in (HttpSigVerifier, CryptographyVerifier):
+        verifier = factory(public_key, '/')
+        report(factory.__name__, measure(
+            lambda v=verifier: v.verify(headers)), baseline)
+
+
+if __name__ == '__main__':
+    main()
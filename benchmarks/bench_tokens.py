@@ -0,0 +1,74 @@
+"""Benchmark storing the tokens of an EVENT storm.
+
+Run from the repository root with ``python -m benchmarks.bench_tokens``.
+"""
+
+import asyncio
+import os
+import tempfile
+
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.smartapp import SmartApp
+from pysmartapp.tokens import SQLiteTokenBackend, TokenStore
+
+from .utilities import get_fixture, measure_async, report
+
+APPS = 10
+
+
+def build_requests() -> list:
+    """Build EVENT requests for several installed apps."""
+    requests = []
+    for index in range(APPS):
+        request = get_fixture('event_request')
+        request['eventData']['installedApp']['installedAppId'] = str(index)
+        requests.append(request)
+    return requests
+
+
+def connect_writer(app: SmartApp, backend: SQLiteTokenBackend):
+    """Write the tokens of every EVENT, the way apps do by hand."""
+    loop = asyncio.get_event_loop()
+
+    async def store(request, *args):
+        await loop.run_in_executor(None, backend.save_many, [(
+            request.installed_app_id, request.location_id,
+            request.auth_token, None, 0.0)])
+    app.connect_event(store)
+
+
+def main():
+    """Run the benchmark."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    requests = build_requests()
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteTokenBackend(os.path.join(directory, 'handler.db'))
+        app = SmartApp(dispatcher=Dispatcher(loop=loop),
+                       wait_for_handlers=True)
+        connect_writer(app, backend)
+        position = [0]
+
+        async def handle():
+            position[0] += 1
+            await app.handle_request(
+                requests[position[0] % APPS], None, False)
+
+        baseline = measure_async(loop, handle)
+        report('event: write in handler', baseline)
+        backend.close()
+
+        backend = SQLiteTokenBackend(os.path.join(directory, 'store.db'))
+        store = TokenStore(backend)
+        app = SmartApp(dispatcher=Dispatcher(loop=loop),
+                       wait_for_handlers=True, token_store=store)
+        app.connect_event(lambda *args: None)
+        report('event: TokenStore', measure_async(loop, handle), baseline)
+        loop.run_until_complete(store.flush())
+        print(F"{'batches written':<40} {store.writes:>10}")
+        backend.close()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Benchmark utilities."""
+import json
+import time
+import timeit
+
+
+def get_fixture(file: str, ext: str = 'json'):
+    """Load a fixtures file shared with the tests."""
+    file_name = F"tests/fixtures/{file}.{ext}"
+    with open(file_name, encoding="utf-8") as open_file:
+        if ext == 'json':
+            return json.load(open_file)
+        return open_file.read()
+
+
+def measure(func, number: int = 1000, repeat: int = 5) -> float:
+    """Get the best time per call of the function in microseconds."""
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    return min(timings) / number * 1e6
+
+
+def report(name: str, micros: float, baseline: float = None):
+    """Print a line of benchmark results."""
+    line = F"{name:<40} {micros:>10.2f} us"
+    if baseline:
+        line += F" {baseline / micros:>8.2f}x"
+    print(line)
+
+
+def measure_async(loop, coro_func, number: int = 1000,
+                  repeat: int = 5) -> float:
+    """Get the best time per await of the coroutine in microseconds."""
+    async def run():
+        start = time.perf_counter()
+        for _ in range(number):
+            await coro_func()
+        return time.perf_counter() - start
+    timings = [loop.run_until_complete(run()) for _ in range(repeat)]
+    return min(timings) / number * 1e6
@@ -1,47 +1,88 @@
 """Define the pysmartapp package."""
 
+from pysmartapp.admission import AdmissionController
+from pysmartapp.asgi import ASGIApp
 from pysmartapp.config import (
     ConfigInitResponse, ConfigPageResponse, ConfigRequest)
 from pysmartapp.const import __title__, __version__  # noqa
-from pysmartapp.dispatch import Dispatcher
+from pysmartapp.dispatch import Dispatcher, DrainResult
 from pysmartapp.errors import (
-    SignatureVerificationError, SmartAppNotRegisteredError)
-from pysmartapp.event import Event, EventRequest
+    SignatureVerificationError, SmartAppNotRegisteredError,
+    SmartAppOverloadedError)
+from pysmartapp.event import (
+    Event, EventBatch, EventRequest, EventRequestSnapshot, EventSnapshot)
 from pysmartapp.install import InstallRequest
+from pysmartapp.instrumentation import Instrumentation
+from pysmartapp.metrics import DispatchMetrics, render_metrics
 from pysmartapp.oauthcallback import OAuthCallbackRequest
 from pysmartapp.ping import PingRequest, PingResponse
+from pysmartapp.replay import ReplayCache
 from pysmartapp.request import EmptyDataResponse, Request, Response
+from pysmartapp.server import HttpProtocol, start_server
+from pysmartapp.signature import (
+    CryptographyVerifier, HttpSigVerifier, SignatureVerifier, VerificationPool)
 from pysmartapp.smartapp import SmartApp, SmartAppManager
+from pysmartapp.tokens import (
+    InstalledAppTokens, SQLiteTokenBackend, TokenBackend, TokenStore)
 from pysmartapp.uninstall import UninstallRequest
 from pysmartapp.update import UpdateRequest
 
 __all__ = [
+    # admission
+    'AdmissionController',
+    # asgi
+    'ASGIApp',
     # config
     'ConfigInitResponse',
     'ConfigPageResponse',
     'ConfigRequest',
     # dispatch
     'Dispatcher',
+    'DrainResult',
     # errors
     'SignatureVerificationError',
     'SmartAppNotRegisteredError',
+    'SmartAppOverloadedError',
     # event
     'Event',
+    'EventBatch',
     'EventRequest',
+    'EventRequestSnapshot',
+    'EventSnapshot',
     # install
     'InstallRequest',
+    # instrumentation
+    'Instrumentation',
+    # metrics
+    'DispatchMetrics',
+    'render_metrics',
     # oauthcallback
     'OAuthCallbackRequest',
     # ping
     'PingRequest',
     'PingResponse',
+    # replay
+    'ReplayCache',
     # request
     'EmptyDataResponse',
     'Request',
     'Response',
+    # server
+    'HttpProtocol',
+    'start_server',
+    # signature
+    'CryptographyVerifier',
+    'HttpSigVerifier',
+    'SignatureVerifier',
+    'VerificationPool',
     # smartapp
     'SmartApp',
     'SmartAppManager',
+    # tokens
+    'InstalledAppTokens',
+    'SQLiteTokenBackend',
+    'TokenBackend',
+    'TokenStore',
     # unisntall
     'UninstallRequest',
     'UpdateRequest'
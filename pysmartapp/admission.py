@@ -0,0 +1,136 @@
+"""Define the admission module."""
+
+import asyncio
+from collections import Counter
+import functools
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from .const import (
+    LIFECYCLE_CONFIG, LIFECYCLE_PING, SHED_APP_HANDLERS, SHED_APP_REQUESTS,
+    SHED_HANDLERS, SHED_REQUESTS)
+from .errors import SmartAppOverloadedError
+
+
+class AdmissionController:
+    """Limits the requests and handler tasks in flight at once.
+
+    Requests beyond a limit are shed with SmartAppOverloadedError before
+    they're verified or dispatched. Each limit is optional and applies
+    globally or to each app id. PING and CONFIGURATION requests are always
+    admitted, so apps stay reachable and configurable during a storm.
+    """
+
+    priority_lifecycles: FrozenSet[str] = frozenset(
+        (LIFECYCLE_PING, LIFECYCLE_CONFIG))
+
+    def __init__(self, *, max_requests: int = None,
+                 max_app_requests: int = None, max_handlers: int = None,
+                 max_app_handlers: int = None):
+        """Create a new instance of the AdmissionController class."""
+        self._max_requests = max_requests
+        self._max_app_requests = max_app_requests
+        self._max_handlers = max_handlers
+        self._max_app_handlers = max_app_handlers
+        self._requests = 0
+        self._app_requests: Dict[str, int] = {}
+        self._handlers = 0
+        self._app_handlers: Dict[str, int] = {}
+        self._shed = Counter()
+
+    def admit(self, app_id: str, lifecycle: str):
+        """Admit a request for the app or shed it if a limit is reached."""
+        if lifecycle not in self.priority_lifecycles:
+            reason = self._get_limit_reached(app_id)
+            if reason is not None:
+                self._shed[app_id, reason] += 1
+                raise SmartAppOverloadedError(app_id, reason)
+        self._requests += 1
+        self._app_requests[app_id] = self._app_requests.get(app_id, 0) + 1
+
+    def release(self, app_id: str):
+        """Release a request admitted for the app once it's handled."""
+        self._requests -= 1
+        _decrement(self._app_requests, app_id)
+
+    def track(self, app_id: str, futures: Iterable[asyncio.Future]):
+        """Count the handler tasks of the app until they're done."""
+        for future in futures:
+            if future.done():
+                continue
+            self._handlers += 1
+            self._app_handlers[app_id] = \
+                self._app_handlers.get(app_id, 0) + 1
+            future.add_done_callback(
+                functools.partial(self._handler_done, app_id))
+
+    def _handler_done(self, app_id: str, future: asyncio.Future):
+        self._handlers -= 1
+        _decrement(self._app_handlers, app_id)
+
+    def _get_limit_reached(self, app_id: str) -> str:
+        if self._max_app_requests is not None and self._app_requests.get(
+                app_id, 0) >= self._max_app_requests:
+            return SHED_APP_REQUESTS
+        if self._max_app_handlers is not None and self._app_handlers.get(
+                app_id, 0) >= self._max_app_handlers:
+            return SHED_APP_HANDLERS
+        if self._max_requests is not None \
+                and self._requests >= self._max_requests:
+            return SHED_REQUESTS
+        if self._max_handlers is not None \
+                and self._handlers >= self._max_handlers:
+            return SHED_HANDLERS
+        return None
+
+    @property
+    def max_requests(self) -> int:
+        """Get the maximum requests in flight, if limited."""
+        return self._max_requests
+
+    @property
+    def max_app_requests(self) -> int:
+        """Get the maximum requests in flight for each app, if limited."""
+        return self._max_app_requests
+
+    @property
+    def max_handlers(self) -> int:
+        """Get the maximum handler tasks in flight, if limited."""
+        return self._max_handlers
+
+    @property
+    def max_app_handlers(self) -> int:
+        """Get the maximum handler tasks in flight for each app, if limited."""
+        return self._max_app_handlers
+
+    @property
+    def requests(self) -> int:
+        """Get the number of requests in flight."""
+        return self._requests
+
+    @property
+    def app_requests(self) -> Dict[str, int]:
+        """Get the number of requests in flight by app id."""
+        return self._app_requests
+
+    @property
+    def handlers(self) -> int:
+        """Get the number of handler tasks in flight."""
+        return self._handlers
+
+    @property
+    def app_handlers(self) -> Dict[str, int]:
+        """Get the number of handler tasks in flight by app id."""
+        return self._app_handlers
+
+    @property
+    def shed(self) -> Dict[Tuple[str, str], int]:
+        """Get the number of requests shed by app id and reason."""
+        return self._shed
+
+
+def _decrement(counts: Dict[str, int], key: str):
+    count = counts[key] - 1
+    if count:
+        counts[key] = count
+    else:
+        del counts[key]
@@ -0,0 +1,159 @@
+"""Define the asgi module."""
+
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from .errors import SignatureVerificationError
+from .server import DEFAULT_MAX_BODY_SIZE, parse_content_length, serve_request
+from .signature import SignatureVerifier
+
+# PING requests are processed without verifying a signature, so a request
+# without one is only read when it's small enough to be a PING.
+MAX_UNSIGNED_BODY_SIZE = 4 * 1024
+DEFAULT_DRAIN_TIMEOUT = 30.0
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_JSON_HEADERS = [(b'content-type', b'application/json')]
+
+
+class ASGIApp:
+    """Serves a SmartApp or SmartAppManager as an ASGI application.
+
+    The request is checked before its body is read: the path and method,
+    the declared length and the signature headers. The body is then read
+    into a single buffer, up to max_body_size, and only decoded once
+    complete. On lifespan shutdown the app is drained for up to
+    drain_timeout seconds.
+    """
+
+    def __init__(self, app, *, validate_signature: bool = True,
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+                 max_unsigned_body_size: int = MAX_UNSIGNED_BODY_SIZE,
+                 drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Create a new instance of the ASGIApp class."""
+        self._app = app
+        self._drain_timeout = drain_timeout
+        self._validate_signature = validate_signature
+        self._max_body_size = max_body_size
+        self._max_unsigned_body_size = max_unsigned_body_size
+        self._header_verifier = None
+        self._rejected = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Handle an ASGI connection."""
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(F'"{scope["type"]}" connections are not served.')
+        status, headers, limit = self._check_request(scope)
+        if status is not None:
+            self._rejected += 1
+            await _respond(send, status)
+            return
+        body = await _read_body(receive, limit)
+        if body is None:
+            return
+        if len(body) > limit:
+            self._rejected += 1
+            await _respond(send, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return
+        status, content = await serve_request(
+            self._app, body, headers, self._validate_signature)
+        await _respond(send, status, content)
+
+    def _check_request(self, scope: Scope) \
+            -> Tuple[HTTPStatus, List[Tuple[str, str]], int]:
+        if scope['path'] != self._app.path:
+            return HTTPStatus.NOT_FOUND, None, 0
+        if scope['method'] != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, None, 0
+        headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                   for name, value in scope['headers']]
+        limit = self._max_body_size
+        if self._validate_signature:
+            signed = any(name == 'authorization' for name, _ in headers)
+            if not signed:
+                limit = min(limit, self._max_unsigned_body_size)
+            else:
+                try:
+                    self.header_verifier.parse(headers)
+                except SignatureVerificationError:
+                    return HTTPStatus.UNAUTHORIZED, None, 0
+        length = None
+        for name, value in headers:
+            if name == 'content-length':
+                length = parse_content_length(value, length)
+                if length is None:
+                    return HTTPStatus.BAD_REQUEST, None, 0
+        if length is not None and length > limit:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, None, 0
+        return None, headers, limit
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._app.drain(self._drain_timeout)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @property
+    def header_verifier(self) -> SignatureVerifier:
+        """Get the verifier that checks signature headers before the body.
+
+        The public key isn't needed to check the headers, so one verifier
+        serves every app of a manager.
+        """
+        verifier = getattr(self._app, 'verifier', None)
+        if verifier is not None:
+            return verifier
+        if self._header_verifier is None:
+            self._header_verifier = self._app.verifier_factory(
+                None, self._app.path)
+        return self._header_verifier
+
+    @property
+    def app(self):
+        """Get the SmartApp or SmartAppManager served."""
+        return self._app
+
+    @property
+    def rejected(self) -> int:
+        """Get the number of requests rejected before they were decoded."""
+        return self._rejected
+
+
+async def _read_body(receive: Receive, limit: int):
+    message = await receive()
+    if message['type'] == 'http.disconnect':
+        return None
+    chunk = message.get('body', b'')
+    if not message.get('more_body', False):
+        # The body usually arrives in one message, which is used as is.
+        return chunk
+    body = bytearray(chunk)
+    while len(body) <= limit:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            break
+    return body
+
+
+async def _respond(send: Send, status: HTTPStatus, content: bytes = b''):
+    headers = _JSON_HEADERS if content else []
+    await send({
+        'type': 'http.response.start',
+        'status': status.value,
+        'headers': headers + [
+            (b'content-length', str(len(content)).encode('ascii'))]
+    })
+    await send({'type': 'http.response.body', 'body': content})
@@ -9,6 +9,9 @@ from .request import Request, Response
 class ConfigRequest(Request):
     """Defines a ConfigRequest."""
 
+    __slots__ = (
+        '_config_data_raw', '_phase', '_page_id', '_previous_page_id')
+
     def __init__(self, data: dict):
         """Create a new instance of the ConfigRequest."""
         super().__init__(data)
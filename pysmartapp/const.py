@@ -15,3 +15,15 @@ LIFECYCLE_UNINSTALL = 'UNINSTALL'
 EVENT_TYPE_DEVICE = 'DEVICE_EVENT'
 EVENT_TYPE_TIMER = 'TIMER_EVENT'
 SETTINGS_APP_ID = 'appId'
+REJECTED_MISSING_SIGNATURE = 'missing_signature'
+REJECTED_MALFORMED_SIGNATURE = 'malformed_signature'
+REJECTED_UNSUPPORTED_ALGORITHM = 'unsupported_algorithm'
+REJECTED_KEY_ID = 'key_id_mismatch'
+REJECTED_MISSING_HEADER = 'missing_header'
+REJECTED_CLOCK_SKEW = 'clock_skew'
+REJECTED_DIGEST = 'digest_mismatch'
+SHED_REQUESTS = 'requests'
+SHED_APP_REQUESTS = 'app_requests'
+SHED_HANDLERS = 'handlers'
+SHED_APP_HANDLERS = 'app_handlers'
+SHED_DRAINING = 'draining'
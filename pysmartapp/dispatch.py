@@ -1,88 +1,664 @@
 """Defines the dispatch component for notifying others of signals."""
 
 import asyncio
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import (
+    Executor, ProcessPoolExecutor, ThreadPoolExecutor)
 import functools
-from typing import Any, Callable, Dict, List, Sequence
+import logging
+import os
+import threading
+from typing import (
+    Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set,
+    Tuple, Union)
+
+from .metrics import DispatchMetrics
+from .subscription import EventSubscriptions
+
+_LOGGER = logging.getLogger(__name__)
 
 TargetType = Callable[..., Any]
 DisconnectType = Callable[[], None]
 ConnectType = Callable[[str, TargetType], DisconnectType]
 SendType = Callable[..., Sequence[asyncio.Future]]
+OrderKeyType = Union[str, Callable[[Any], Optional[Hashable]]]
+
+DEFAULT_POOL = 'default'
+PROCESS_POOL = 'process'
+
+
+class TargetPool:
+    """Runs synchronous targets in an executor with a bounded queue."""
+
+    def __init__(self, name: str, executor: Executor = None, *,
+                 max_workers: int = None, max_queue: int = None,
+                 processes: bool = False):
+        """Create a new instance of the TargetPool class.
+
+        Without an executor the pool creates its own thread pool, or
+        process pool when processes is set, when the first target runs and
+        shuts it down with the pool.
+        """
+        self._name = name
+        self._executor = executor
+        self._owned = executor is None
+        self._processes = processes or isinstance(
+            executor, ProcessPoolExecutor)
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        self._outstanding = 0
+        self._rejected = 0
+
+    def submit(self, loop, target: TargetType, *args) \
+            -> Optional[asyncio.Future]:
+        """Run the target in the executor unless the queue is full."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._max_workers) if self._processes \
+                else ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix=F"pysmartapp-{self._name}")
+        # Targets submitted while workers are idle don't count against the
+        # queue, even before a worker thread has picked them up.
+        with self._lock:
+            if self._max_queue is not None \
+                    and self.queued >= self._max_queue:
+                self._rejected += 1
+                _LOGGER.warning("Target %s was rejected because pool %s "
+                                "is full.", target, self._name)
+                return None
+            self._outstanding += 1
+        if self._processes:
+            # Workers in other processes can't update the counts, so
+            # targets are counted until their result is back on the loop.
+            future = loop.run_in_executor(self._executor, target, *args)
+            future.add_done_callback(self._process_done)
+            return future
+        # A job cancelled before a worker picks it up never runs, so the
+        # done callback takes it off the count unless it has started.
+        started = [False]
+        future = loop.run_in_executor(
+            self._executor, self._run, target, args, started)
+        future.add_done_callback(
+            functools.partial(self._thread_done, started))
+        return future
+
+    def _process_done(self, _):
+        with self._lock:
+            self._outstanding -= 1
+
+    def _thread_done(self, started: List[bool], _):
+        with self._lock:
+            if not started[0]:
+                started[0] = True
+                self._outstanding -= 1
+
+    def _run(self, target: TargetType, args, started: List[bool]):
+        with self._lock:
+            if started[0]:
+                # Cancelled as it started, so it was already taken off.
+                self._outstanding += 1
+            started[0] = True
+            self._active += 1
+        try:
+            return target(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._outstanding -= 1
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the executor if the pool created it."""
+        executor = self._executor
+        if self._owned and executor is not None:
+            self._executor = None
+            executor.shutdown(wait=wait)
+
+    @property
+    def name(self) -> str:
+        """Get the name of the pool."""
+        return self._name
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        """Get the executor targets run in, if created."""
+        return self._executor
+
+    @property
+    def processes(self) -> bool:
+        """Get whether targets run in other processes."""
+        return self._processes
+
+    @property
+    def max_queue(self) -> Optional[int]:
+        """Get the number of targets that may wait for a worker."""
+        return self._max_queue
+
+    @property
+    def active(self) -> int:
+        """Get the number of targets running."""
+        if self._processes:
+            return min(self._outstanding, self._workers)
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Get the number of targets beyond the workers to run them."""
+        return max(self._outstanding - self._workers, 0)
+
+    @property
+    def _workers(self) -> int:
+        # pylint: disable=protected-access
+        return self._max_workers or getattr(
+            self._executor, '_max_workers', None) or os.cpu_count() or 1
+
+    @property
+    def rejected(self) -> int:
+        """Get the number of targets rejected because the queue was full."""
+        return self._rejected
+
+
+class DispatchStats:
+    """Define counts and latency of the targets the dispatcher ran."""
+
+    __slots__ = ('completed', 'failed', 'cancelled', 'timed_out',
+                 'total_time', 'max_time')
+
+    def __init__(self):
+        """Create a new instance of the DispatchStats class."""
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed: float):
+        """Record the seconds a finished target took."""
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    @property
+    def finished(self) -> int:
+        """Get the number of targets that completed or failed."""
+        return self.completed + self.failed
+
+    @property
+    def mean_time(self) -> float:
+        """Get the mean seconds finished targets took."""
+        finished = self.finished
+        return self.total_time / finished if finished else 0.0
+
+
+class DrainResult(NamedTuple):
+    """Define the targets that finished or were cancelled while draining."""
+
+    finished: int
+    cancelled: Dict[str, int]
+
+    @property
+    def drained(self) -> bool:
+        """Get whether every target finished before the timeout."""
+        return not self.cancelled
+
+
+class Invoker:
+    """Define a connected target and the way it's called.
+
+    Targets are classified once when connected, so sending a signal only
+    calls the pre-bound function of each invoker.
+    """
+
+    __slots__ = ('signal', 'target', 'pool', 'is_coroutine', 'call')
+
+    def __init__(self, signal: str, target: TargetType, pool: str,
+                 call: Callable[..., Optional[asyncio.Future]]):
+        """Create a new instance of the Invoker class."""
+        self.signal = signal
+        self.target = target
+        self.pool = pool
+        self.is_coroutine = is_coroutine_target(target)
+        self.call = call
+
+
+def is_coroutine_target(target: TargetType) -> bool:
+    """Get whether the target, or the function it wraps, is a coroutine."""
+    while isinstance(target, functools.partial):
+        target = target.func
+    return asyncio.iscoroutinefunction(target)
+
+
+class Connection:
+    """Define the handle of a connected target.
+
+    Calling the handle, or its disconnect method, removes the target. It
+    can be called more than once.
+    """
+
+    __slots__ = ('_disconnects', '_remove')
+
+    def __init__(self, disconnects: Dict['Connection', None],
+                 remove: DisconnectType):
+        """Create a new instance of the Connection class."""
+        self._disconnects = disconnects
+        self._remove = remove
+        disconnects[self] = None
+
+    def __call__(self) -> None:
+        """Disconnect the target."""
+        self.disconnect()
+
+    def disconnect(self) -> None:
+        """Disconnect the target."""
+        remove = self._remove
+        if remove is None:
+            return
+        self._remove = None
+        self._disconnects.pop(self, None)
+        remove()
+
+    @property
+    def connected(self) -> bool:
+        """Get whether the target is still connected."""
+        return self._remove is not None
 
 
 class Dispatcher:
     """Define the dispatch class."""
 
     def __init__(self, *, connect: ConnectType = None, send: SendType = None,
-                 signal_prefix: str = '', loop=None):
-        """Create a new instance of the dispatch component."""
+                 signal_prefix: str = '', loop=None, executor: Executor = None,
+                 max_workers: int = None, max_queue: int = None,
+                 order_key: OrderKeyType = None,
+                 metrics: DispatchMetrics = None):
+        """Create a new instance of the dispatch component.
+
+        Synchronous targets run in the default pool, which uses the
+        executor or a thread pool of its own limited to max_workers.
+
+        With an order key, the name of a request attribute such as
+        installed_app_id or a function of the first argument, signals
+        with the same key run their targets one send after another, while
+        different keys run in parallel.
+
+        With metrics, the calls of each target connected afterwards are
+        counted and timed.
+        """
         self._signal_prefix = signal_prefix
-        self._signals = defaultdict(list)
+        self._signals = {}
+        self._snapshots = {}
         self._loop = loop or asyncio.get_event_loop()
         self._connect = connect or self._default_connect
+        self._custom_connect = connect is not None
         self._send = send or self._default_send
+        self._custom_send = send is not None
         self._last_sent = []
-        self._disconnects = []
+        self._disconnects = {}
+        self._subscriptions = {}
+        self._pools = {
+            DEFAULT_POOL: TargetPool(
+                DEFAULT_POOL, executor, max_workers=max_workers,
+                max_queue=max_queue),
+            PROCESS_POOL: TargetPool(PROCESS_POOL, processes=True)
+        }
+        self._signal_pools = {}
+        self._in_flight = {}
+        self._stats = DispatchStats()
+        if isinstance(order_key, str):
+            order_key = functools.partial(_get_attribute, name=order_key)
+        self._order_key = order_key
+        self._queues = {}
+        self._metrics = metrics
 
-    def connect(self, signal: str, target: TargetType) \
-            -> DisconnectType:
-        """Connect function to signal.  Must be ran in the event loop."""
-        disconnect = self._connect(self._signal_prefix + signal, target)
-        self._disconnects.append(disconnect)
-        return disconnect
+    def add_pool(self, name: str, executor: Executor = None, *,
+                 max_workers: int = None, max_queue: int = None,
+                 processes: bool = False) -> TargetPool:
+        """Add a named pool that signals or targets can be assigned to.
+
+        Targets in a pool of processes are called with a picklable
+        snapshot of the first argument sent with the signal.
+        """
+        if name in self._pools:
+            raise ValueError(F'A pool named "{name}" already exists.')
+        pool = self._pools[name] = TargetPool(
+            name, executor, max_workers=max_workers, max_queue=max_queue,
+            processes=processes)
+        return pool
+
+    def assign_pool(self, signal: str, pool: str):
+        """Run the synchronous targets of the signal in the named pool."""
+        if pool not in self._pools:
+            raise ValueError(F'A pool named "{pool}" does not exist.')
+        self._signal_pools[self._signal_prefix + signal] = pool
+
+    def connect(self, signal: str, target: TargetType, *,
+                filters: Dict[str, Any] = None, pool: str = None) \
+            -> Connection:
+        """Connect function to signal.  Must be ran in the event loop.
+
+        When filters are given the signal must be sent with an event
+        request, and the target is only called with the events matching
+        all of them. A synchronous target runs in the named pool when
+        given, instead of the pool of the signal.
+        """
+        signal = self._signal_prefix + signal
+        if pool is not None and pool not in self._pools:
+            raise ValueError(F'A pool named "{pool}" does not exist.')
+        if pool is not None and self._pools[pool].processes \
+                and is_coroutine_target(target):
+            raise ValueError('Coroutine targets can\'t run in a process.')
+        if filters:
+            disconnect = self._connect_filtered(
+                self._create_invoker(signal, target, pool), filters)
+        elif self._custom_connect:
+            disconnect = self._connect(signal, target)
+        else:
+            disconnect = self._connect_invoker(
+                self._create_invoker(signal, target, pool))
+        return Connection(self._disconnects, disconnect)
 
     def send(self, signal: str, *args: Any) -> Sequence[asyncio.Future]:
         """Fire a signal.  Must be ran in the event loop."""
-        sent = self._last_sent = self._send(
-            self._signal_prefix + signal, *args)
+        signal = self._signal_prefix + signal
+        if self._metrics is not None:
+            self._metrics.signal_sent(signal)
+        if self._order_key is not None and args \
+                and not self._custom_send:
+            key = self._order_key(args[0])
+            if key is not None:
+                sent = self._send_ordered(key, self._get_calls(signal, args))
+                if sent:
+                    self._track(signal, sent)
+                self._last_sent = sent
+                return sent
+        sent = self._send(signal, *args)
+        subscriptions = self._subscriptions.get(signal)
+        if subscriptions and args:
+            sent = list(sent or ())
+            for invoker, req in subscriptions.match(args[0]):
+                future = invoker.call(req, *args[1:])
+                if future is not None:
+                    sent.append(future)
+        if sent:
+            self._track(signal, sent)
+        self._last_sent = sent
         return sent
 
-    def disconnect_all(self):
-        """Disconnect all connected."""
-        disconnects = self._disconnects.copy()
-        self._disconnects.clear()
-        for disconnect in disconnects:
-            disconnect()
+    async def asend(self, signal: str, *args: Any,
+                    timeout: float = None) -> List[Any]:
+        """Fire a signal and wait for the targets to finish.
+
+        Targets that don't finish within the timeout are cancelled. The
+        result of each target, or the exception it raised, is returned.
+        """
+        futures = self.send(signal, *args)
+        if not futures:
+            return []
+        if timeout is None:
+            return await asyncio.gather(*futures, return_exceptions=True)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(future, timeout) for future in futures),
+            return_exceptions=True)
+        self._stats.timed_out += sum(
+            isinstance(result, asyncio.TimeoutError) for result in results)
+        return results
+
+    def _get_calls(self, signal: str, args: Tuple[Any, ...]) \
+            -> List[Tuple[Invoker, Tuple[Any, ...]]]:
+        calls = [(invoker, args) for invoker in self._signals.get(signal, ())]
+        subscriptions = self._subscriptions.get(signal)
+        if subscriptions:
+            calls.extend((invoker, (req,) + args[1:])
+                         for invoker, req in subscriptions.match(args[0]))
+        return calls
+
+    def _send_ordered(self, key: Hashable,
+                      calls: List[Tuple[Invoker, Tuple[Any, ...]]]) \
+            -> List[asyncio.Future]:
+        # Each send for the key becomes a task that waits for the send
+        # before it. The futures returned stand in for the targets, which
+        # aren't called until the task runs.
+        if not calls:
+            return []
+        futures = [self._loop.create_future() for _ in calls]
+        task = self._loop.create_task(
+            self._run_ordered(self._queues.get(key), calls, futures))
+        self._queues[key] = task
+        task.add_done_callback(functools.partial(self._release_queue, key))
+        return futures
+
+    async def _run_ordered(self, previous: Optional[asyncio.Future],
+                           calls: List[Tuple[Invoker, Tuple[Any, ...]]],
+                           futures: List[asyncio.Future]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        running = []
+        for (invoker, args), future in zip(calls, futures):
+            if future.done():
+                continue
+            # An error calling the target, like an executor that was shut
+            # down, fails only its own future so the rest still run.
+            try:
+                target_future = invoker.call(*args)
+            except Exception as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+                continue
+            if target_future is None:
+                future.cancel()
+                continue
+            _chain_future(target_future, future)
+            running.append(target_future)
+        if running:
+            await asyncio.wait(running)
+
+    def _release_queue(self, key: Hashable, task: asyncio.Future):
+        if self._queues.get(key) is task:
+            del self._queues[key]
+
+    def _track(self, signal: str, futures: Sequence[asyncio.Future]):
+        sent = (signal, self._loop.time())
+        done = functools.partial(self._target_done, signal)
+        for future in futures:
+            self._in_flight[future] = sent
+            future.add_done_callback(done)
+
+    def _target_done(self, signal: str, future: asyncio.Future):
+        sent = self._in_flight.pop(future, None)
+        if sent is None:
+            return
+        stats = self._stats
+        if future.cancelled():
+            stats.cancelled += 1
+            return
+        stats.record(self._loop.time() - sent[1])
+        error = future.exception()
+        if error is None:
+            stats.completed += 1
+            return
+        stats.failed += 1
+        _LOGGER.error("A target of signal %s raised an exception.", signal,
+                      exc_info=error)
+
+    async def drain(self, timeout: float = None) -> DrainResult:
+        """Wait for the targets in flight, cancelling any left at timeout.
+
+        Targets started while draining, by requests already being handled,
+        are waited on too. Synchronous targets already running in a pool
+        can't be stopped, but their futures are cancelled and reported.
+        """
+        finished = self._stats.finished
+        deadline = None if timeout is None else self._loop.time() + timeout
+        while self._in_flight:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+            await asyncio.wait(list(self._in_flight), timeout=remaining)
+        cancelled = Counter()
+        for future, (signal, _) in list(self._in_flight.items()):
+            if future.cancel():
+                cancelled[signal] += 1
+        if cancelled:
+            _LOGGER.warning(
+                "Cancelled %d targets that were still running after "
+                "draining: %s", sum(cancelled.values()), dict(cancelled))
+        return DrainResult(self._stats.finished - finished, dict(cancelled))
+
+    def disconnect_all(self, wait: bool = False):
+        """Disconnect all connected and shut down the pools."""
+        for connection in list(self._disconnects):
+            connection.disconnect()
+        self.shutdown(wait)
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the executors the pools created.
+
+        Pools create a new executor if a target runs afterwards.
+        """
+        for pool in self._pools.values():
+            pool.shutdown(wait)
 
     def _default_connect(self, signal: str, target: TargetType) \
             -> DisconnectType:
         """Connect function to signal.  Must be ran in the event loop."""
-        self._signals[signal].append(target)
+        return self._connect_invoker(
+            self._create_invoker(signal, target, None))
 
-        def remove_dispatcher() -> None:
-            """Remove signal listener."""
-            try:
-                self._signals[signal].remove(target)
-            except ValueError:
-                # signal was already removed
-                pass
-        return remove_dispatcher
+    def _create_invoker(self, signal: str, target: TargetType,
+                        pool: Optional[str]) -> Invoker:
+        invoker = Invoker(signal, target, pool, None)
+        if invoker.is_coroutine:
+            create_task = self._loop.create_task
+
+            def call(*args: Any) -> asyncio.Future:
+                return create_task(target(*args))
+            invoker.call = call
+        else:
+            invoker.call = functools.partial(self._submit, invoker)
+        if self._metrics is not None:
+            invoker.call = self._metrics.meter(signal, target, invoker.call)
+        return invoker
+
+    def _connect_invoker(self, invoker: Invoker) -> DisconnectType:
+        self._signals.setdefault(invoker.signal, {})[invoker] = None
+        self._snapshots.pop(invoker.signal, None)
+        return functools.partial(self._remove_invoker, invoker)
+
+    def _remove_invoker(self, invoker: Invoker) -> None:
+        invokers = self._signals.get(invoker.signal)
+        if invokers is None or invoker not in invokers:
+            # signal was already removed
+            return
+        del invokers[invoker]
+        if not invokers:
+            del self._signals[invoker.signal]
+        self._snapshots.pop(invoker.signal, None)
+
+    def _connect_filtered(self, invoker: Invoker,
+                          filters: Dict[str, Any]) -> DisconnectType:
+        subscriptions = self._subscriptions.get(invoker.signal)
+        if subscriptions is None:
+            subscriptions = self._subscriptions[invoker.signal] = \
+                EventSubscriptions()
+        subscription = subscriptions.add(invoker, filters)
+
+        def remove_subscription() -> None:
+            """Remove the filtered signal listener."""
+            subscriptions.remove(subscription)
+        return remove_subscription
 
     def _default_send(self, signal: str, *args: Any) -> \
             Sequence[asyncio.Future]:
         """Fire a signal.  Must be ran in the event loop."""
-        targets = self._signals[signal]
+        # Targets may disconnect while the signal is being sent, so sending
+        # iterates a snapshot that's only rebuilt after the targets change.
+        snapshot = self._snapshots.get(signal)
+        if snapshot is None:
+            invokers = self._signals.get(signal)
+            if not invokers:
+                return []
+            snapshot = self._snapshots[signal] = tuple(invokers)
         futures = []
-        for target in targets:
-            task = self._call_target(target, *args)
-            futures.append(task)
+        for invoker in snapshot:
+            future = invoker.call(*args)
+            if future is not None:
+                futures.append(future)
         return futures
 
-    def _call_target(self, target, *args) -> asyncio.Future:
-        check_target = target
-        while isinstance(check_target, functools.partial):
-            check_target = check_target.func
-        if asyncio.iscoroutinefunction(check_target):
-            return self._loop.create_task(target(*args))
-        return self._loop.run_in_executor(None, target, *args)
+    def _submit(self, invoker: Invoker, *args: Any) \
+            -> Optional[asyncio.Future]:
+        # The pool is looked up when called so signals can be assigned a
+        # pool after their targets are connected.
+        pool = self._pools[invoker.pool or self._signal_pools.get(
+            invoker.signal, DEFAULT_POOL)]
+        if pool.processes:
+            if not args or not hasattr(args[0], 'snapshot'):
+                future = self._loop.create_future()
+                future.set_exception(TypeError(
+                    F"Signal {invoker.signal} was not sent with an argument "
+                    "that can be snapshot for another process."))
+                return future
+            args = (args[0].snapshot(),)
+        return pool.submit(self._loop, invoker.target, *args)
 
     @property
     def signals(self) -> Dict[str, List[TargetType]]:
         """Get the dictionary of registered signals and callbaks."""
-        return self._signals
+        return defaultdict(list, {
+            signal: [invoker.target for invoker in invokers]
+            for signal, invokers in self._signals.items()})
+
+    @property
+    def pools(self) -> Dict[str, TargetPool]:
+        """Get the pools synchronous targets run in by name."""
+        return self._pools
+
+    @property
+    def metrics(self) -> Optional[DispatchMetrics]:
+        """Get the metrics of the signals and targets, if collected."""
+        return self._metrics
+
+    @property
+    def queues(self) -> int:
+        """Get the number of keys with ordered sends waiting or running."""
+        return len(self._queues)
+
+    @property
+    def in_flight(self) -> Set[asyncio.Future]:
+        """Get the futures of the targets that haven't finished."""
+        return set(self._in_flight)
+
+    @property
+    def stats(self) -> DispatchStats:
+        """Get the counts and latency of the targets that were run."""
+        return self._stats
 
     @property
     def last_sent(self) -> Sequence[asyncio.Future]:
         """Get the last sent asyncio tasks."""
         return self._last_sent
+
+
+def _get_attribute(obj: Any, name: str) -> Optional[Hashable]:
+    return getattr(obj, name, None)
+
+
+def _chain_future(source: asyncio.Future, destination: asyncio.Future):
+    def copy_result(_):
+        if destination.done():
+            return
+        if source.cancelled():
+            destination.cancel()
+        elif source.exception() is not None:
+            destination.set_exception(source.exception())
+        else:
+            destination.set_result(source.result())
+
+    def cancel_source(_):
+        if destination.cancelled():
+            source.cancel()
+    source.add_done_callback(copy_result)
+    destination.add_done_callback(cancel_source)
@@ -1,10 +1,27 @@
 """Define the errors module."""
 
+from .const import (
+    SHED_APP_HANDLERS, SHED_APP_REQUESTS, SHED_DRAINING, SHED_HANDLERS,
+    SHED_REQUESTS)
+
 
 class SignatureVerificationError(Exception):
     """Defines an error for signature verification failures."""
 
-    pass
+    _message = "Request was rejected before verification: {}."
+
+    def __init__(self, reason: str = None):
+        """Create a new instance of the error."""
+        if reason:
+            Exception.__init__(self, self._message.format(reason))
+        else:
+            Exception.__init__(self)
+        self._reason = reason
+
+    @property
+    def reason(self) -> str:
+        """Get the reason the request was rejected early, if any."""
+        return self._reason
 
 
 class SmartAppNotRegisteredError(Exception):
@@ -21,3 +38,38 @@ class SmartAppNotRegisteredError(Exception):
     def installed_app_id(self) -> str:
         """Get the installed app id not found."""
         return self._installed_app_id
+
+
+class SmartAppOverloadedError(Exception):
+    """Defines an error when a request is shed by admission control."""
+
+    _message = "Request for app '{}' was shed: {}."
+    _reasons = {
+        SHED_REQUESTS: 'too many requests in flight',
+        SHED_APP_REQUESTS: 'too many app requests in flight',
+        SHED_HANDLERS: 'too many handlers in flight',
+        SHED_APP_HANDLERS: 'too many app handlers in flight',
+        SHED_DRAINING: 'the app is draining'
+    }
+
+    def __init__(self, app_id: str, reason: str):
+        """Create a new instance of the error."""
+        Exception.__init__(self, self._message.format(
+            app_id, self._reasons.get(reason, reason)))
+        self._app_id = app_id
+        self._reason = reason
+
+    @property
+    def app_id(self) -> str:
+        """Get the app id the request was for."""
+        return self._app_id
+
+    @property
+    def reason(self) -> str:
+        """Get the limit that was reached."""
+        return self._reason
+
+    @property
+    def is_app_limit(self) -> bool:
+        """Get whether the limit of the app, not the global one, was hit."""
+        return self._reason in (SHED_APP_REQUESTS, SHED_APP_HANDLERS)
@@ -1,52 +1,43 @@
 """Define the event module."""
 
-from typing import Any, Dict, Optional, Sequence
+import copy
+from types import MappingProxyType
+from typing import (
+    Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple)
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 from .const import EVENT_TYPE_DEVICE, EVENT_TYPE_TIMER
 from .request import EmptyDataResponse, Request, Response
 
+_NO_DATA = MappingProxyType({})
+
 
 class Event:
-    """Define an event."""
+    """Define an event.
+
+    The event is a view over the raw event data and reads each field from
+    it when accessed.
+    """
+
+    __slots__ = ('_raw', '_event_type', '_device_event', '_timer_event')
 
     def __init__(self, data: dict):
         """Create a new instance of the event class."""
+        self._raw = data
         self._event_type = data['eventType']
-        self._subscription_name = None
-        self._event_id = None
-        self._location_id = None
-        self._device_id = None
-        self._component_id = None
-        self._capability = None
-        self._attribute = None
-        self._value = None
-        self._value_type = None
-        self._data = None
-        self._state_change = None
-        if self._event_type == EVENT_TYPE_DEVICE:
-            device_event = data['deviceEvent']
-            self._subscription_name = device_event['subscriptionName']
-            self._event_id = device_event['eventId']
-            self._location_id = device_event['locationId']
-            self._device_id = device_event['deviceId']
-            self._component_id = device_event['componentId']
-            self._capability = device_event['capability']
-            self._attribute = device_event['attribute']
-            self._value = device_event['value']
-            self._value_type = device_event['valueType']
-            self._data = device_event.get('data')
-            self._state_change = device_event['stateChange']
-        self._timer_name = None
-        self._timer_type = None
-        self._timer_time = None
-        self._timer_expression = None
-        if self._event_type == EVENT_TYPE_TIMER:
-            timer_event = data['timerEvent']
-            self._event_id = timer_event['eventId']
-            self._timer_name = timer_event['name']
-            self._timer_type = timer_event['type']
-            self._timer_time = timer_event['time']
-            self._timer_expression = timer_event['expression']
+        self._device_event = data['deviceEvent'] \
+            if self._event_type == EVENT_TYPE_DEVICE else _NO_DATA
+        self._timer_event = data['timerEvent'] \
+            if self._event_type == EVENT_TYPE_TIMER else _NO_DATA
+
+    @property
+    def raw_data(self) -> dict:
+        """Get the raw event data."""
+        return self._raw
 
     @property
     def event_type(self) -> str:
@@ -56,94 +47,303 @@ class Event:
     @property
     def subscription_name(self) -> str:
         """Get the subscription name."""
-        return self._subscription_name
+        return self._device_event.get('subscriptionName')
 
     @property
     def event_id(self) -> str:
         """Get the event id."""
-        return self._event_id
+        if self._timer_event:
+            return self._timer_event['eventId']
+        return self._device_event.get('eventId')
 
     @property
     def location_id(self) -> str:
         """Get the location id."""
-        return self._location_id
+        return self._device_event.get('locationId')
 
     @property
     def device_id(self) -> str:
         """Get the device id."""
-        return self._device_id
+        return self._device_event.get('deviceId')
 
     @property
     def component_id(self) -> str:
         """Get the component id."""
-        return self._component_id
+        return self._device_event.get('componentId')
 
     @property
     def capability(self) -> str:
         """Get the capability."""
-        return self._capability
+        return self._device_event.get('capability')
 
     @property
     def attribute(self) -> str:
         """Get the attribute."""
-        return self._attribute
+        return self._device_event.get('attribute')
 
     @property
     def value(self) -> Optional[Any]:
         """Get the value."""
-        return self._value
+        return self._device_event.get('value')
 
     @property
     def value_type(self) -> str:
         """Get the type of the value."""
-        return self._value_type
+        return self._device_event.get('valueType')
 
     @property
     def data(self) -> Optional[Dict[str, Any]]:
         """Get the data associated with the event."""
-        return self._data
+        return self._device_event.get('data')
 
     @property
     def state_change(self) -> bool:
         """Get whether this is a new state change."""
-        return self._state_change
+        return self._device_event.get('stateChange')
 
     @property
     def timer_name(self) -> str:
         """Get the name of the timer schedule."""
-        return self._timer_name
+        return self._timer_event.get('name')
 
     @property
     def timer_type(self) -> str:
         """Get the type of time."""
-        return self._timer_type
+        return self._timer_event.get('type')
 
     @property
     def timer_time(self) -> str:
         """Get the time the timer fired."""
-        return self._timer_time
+        return self._timer_event.get('time')
 
     @property
     def timer_expression(self) -> str:
         """Get the timer firing expression."""
-        return self._timer_expression
+        return self._timer_event.get('expression')
+
+
+class EventSnapshot(NamedTuple):
+    """Define a picklable copy of the fields of an event."""
+
+    event_type: str
+    subscription_name: str
+    event_id: str
+    location_id: str
+    device_id: str
+    component_id: str
+    capability: str
+    attribute: str
+    value: Any
+    value_type: str
+    data: Optional[Dict[str, Any]]
+    state_change: bool
+    timer_name: str
+    timer_type: str
+    timer_time: str
+    timer_expression: str
+
+    @classmethod
+    def from_event(cls, event: Event) -> 'EventSnapshot':
+        """Create a snapshot of the event."""
+        return cls(*(getattr(event, field) for field in cls._fields))
+
+
+class EventRequestSnapshot(NamedTuple):
+    """Define a picklable copy of an event request and its events.
+
+    The snapshot leaves out the raw payload and auth token, so it's cheap
+    to send to handlers running in other processes.
+    """
+
+    lifecycle: str
+    execution_id: str
+    installed_app_id: str
+    location_id: str
+    events: Tuple[EventSnapshot, ...]
+
+
+class EventList(Sequence[Event]):
+    """Define a sequence of events created on first access."""
+
+    __slots__ = ('_raw_events', '_events')
+
+    def __init__(self, raw_events: List[dict],
+                 events: Sequence[Event] = None):
+        """Create a new instance of the EventList class."""
+        self._raw_events = raw_events
+        self._events = list(events) if events is not None \
+            else [None] * len(raw_events)
+
+    def __getitem__(self, index):
+        """Get the event, or list of events, at the index."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        event = self._events[index]
+        if event is None:
+            event = self._events[index] = Event(self._raw_events[index])
+        return event
+
+    def __iter__(self) -> Iterator[Event]:
+        """Iterate over the events."""
+        events = self._events
+        for index, event in enumerate(events):
+            if event is None:
+                event = events[index] = Event(self._raw_events[index])
+            yield event
+
+    def __len__(self) -> int:
+        """Get the number of events."""
+        return len(self._events)
+
+    @property
+    def raw_data(self) -> List[dict]:
+        """Get the raw data of the events."""
+        return self._raw_events
+
+
+class EventBatch:
+    """Define a column-wise view of the fields of a list of events.
+
+    Each column is built from the raw event data the first time it's used.
+    Columns are lists unless use_numpy is set, in which case they're NumPy
+    arrays. Building a column is a loop over the events either way, so
+    arrays only pay off for callers that go on to use them with NumPy.
+    """
+
+    __slots__ = ('_raw_events', '_events', '_columns', '_device_events',
+                 '_numpy')
+
+    use_numpy = False
+
+    device_columns = {
+        'subscription_name': 'subscriptionName',
+        'location_id': 'locationId',
+        'device_id': 'deviceId',
+        'component_id': 'componentId',
+        'capability': 'capability',
+        'attribute': 'attribute',
+        'value_type': 'valueType'
+    }
+    columns = frozenset(device_columns) | {
+        'event_type', 'state_change', 'value'}
+
+    def __init__(self, raw_events: List[dict],
+                 events: Sequence[Event] = None, *, use_numpy: bool = None):
+        """Create a new instance of the EventBatch class."""
+        if use_numpy is None:
+            use_numpy = self.use_numpy
+        if use_numpy and numpy is None:
+            raise RuntimeError("The numpy package is not installed.")
+        self._raw_events = raw_events
+        self._events = events
+        self._columns = {}
+        self._device_events = None
+        self._numpy = numpy if use_numpy else None
+
+    def column(self, name: str):
+        """Get the values of the field for every event.
+
+        The value column holds floats, with NaN for events whose value
+        isn't a number, so it can be compared and aggregated directly.
+        """
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = self._build_column(name)
+        return column
+
+    def _build_column(self, name: str):
+        arrays = self._numpy
+        if name == 'event_type':
+            values = [evt['eventType'] for evt in self._raw_events]
+            return arrays.array(values, dtype=object) if arrays else values
+        if self._device_events is None:
+            self._device_events = [evt.get('deviceEvent', _NO_DATA)
+                                   for evt in self._raw_events]
+        if name == 'state_change':
+            values = [bool(evt.get('stateChange'))
+                      for evt in self._device_events]
+            return arrays.array(values, dtype=bool) if arrays else values
+        if name == 'value':
+            values = [_to_number(evt.get('value'))
+                      for evt in self._device_events]
+            return arrays.array(values, dtype=float) if arrays else values
+        key = self.device_columns.get(name)
+        if key is None:
+            raise ValueError(F'"{name}" is not an event column.')
+        values = [evt.get(key) for evt in self._device_events]
+        return arrays.array(values, dtype=object) if arrays else values
+
+    def mask(self, **criteria):
+        """Get a mask of the events whose fields equal the given values."""
+        if self._numpy:
+            mask = self._numpy.ones(len(self), dtype=bool)
+            for name, value in criteria.items():
+                mask &= self.column(name) == value
+            return mask
+        mask = [True] * len(self)
+        for name, value in criteria.items():
+            mask = [selected and item == value for selected, item
+                    in zip(mask, self.column(name))]
+        return mask
+
+    def values(self, mask=None):
+        """Get the numeric values of the events selected by the mask."""
+        return self.compress('value', mask)
+
+    def compress(self, name: str, mask=None):
+        """Get the column values of the events selected by the mask."""
+        column = self.column(name)
+        if mask is None:
+            return column
+        if self._numpy:
+            return column[mask]
+        return [item for item, selected in zip(column, mask) if selected]
+
+    def indices(self, mask) -> List[int]:
+        """Get the indexes of the events selected by the mask."""
+        if self._numpy:
+            return self._numpy.flatnonzero(mask).tolist()
+        return [index for index, selected in enumerate(mask) if selected]
+
+    def select(self, mask) -> List[Event]:
+        """Get the events selected by the mask."""
+        if self._events is None:
+            self._events = EventList(self._raw_events)
+        return [self._events[index] for index in self.indices(mask)]
+
+    def __len__(self) -> int:
+        """Get the number of events."""
+        return len(self._raw_events)
+
+
+def _to_number(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float('nan')
 
 
 class EventRequest(Request):
     """Define the EventRequest class."""
 
+    __slots__ = ('_event_data_raw', '_auth_token', '_events', '_batch')
+
     def __init__(self, data: dict):
         """Create a new instance of the EventRequest."""
         super().__init__(data)
         event_data = self._event_data_raw = data['eventData']
         self._auth_token = event_data['authToken']
         self._init_installed_app(event_data['installedApp'])
-        self._events = [Event(item) for item in event_data['events']]
+        self._events = EventList(event_data['events'])
+        self._batch = None
 
     async def _process(self, app) -> Response:
         resp = EmptyDataResponse('eventData')
         return resp
 
+    def _update_tokens(self, token_store):
+        token_store.update(self._installed_app_id, self._location_id,
+                           self._auth_token)
+
     @property
     def event_data_raw(self) -> dict:
         """Get the raw event data."""
@@ -155,6 +355,28 @@ class EventRequest(Request):
         return self._auth_token
 
     @property
-    def events(self) -> Sequence[Event]:
+    def events(self) -> EventList:
         """Get the events."""
         return self._events
+
+    @property
+    def batch(self) -> EventBatch:
+        """Get a column-wise view of the events."""
+        if self._batch is None:
+            self._batch = EventBatch(self._events.raw_data, self._events)
+        return self._batch
+
+    def snapshot(self) -> EventRequestSnapshot:
+        """Get a picklable snapshot of the request and its events."""
+        return EventRequestSnapshot(
+            self.lifecycle, self.execution_id, self.installed_app_id,
+            self.location_id,
+            tuple(EventSnapshot.from_event(evt) for evt in self._events))
+
+    def with_events(self, events: Sequence[Event]) -> 'EventRequest':
+        """Get a copy of the request holding only the given events."""
+        req = copy.copy(self)
+        # pylint: disable=protected-access
+        req._events = EventList([evt.raw_data for evt in events], events)
+        req._batch = None
+        return req
@@ -6,6 +6,8 @@ from .request import EmptyDataResponse, Request, Response
 class InstallRequest(Request):
     """Define the InstallRequest class."""
 
+    __slots__ = ('_install_data_raw', '_auth_token', '_refresh_token')
+
     def __init__(self, data: dict):
         """Create a new instance of the InstallRequest."""
         super().__init__(data)
@@ -18,6 +20,10 @@ class InstallRequest(Request):
         resp = EmptyDataResponse('installData')
         return resp
 
+    def _update_tokens(self, token_store):
+        token_store.update(self._installed_app_id, self._location_id,
+                           self._auth_token, self._refresh_token)
+
     @property
     def install_data_raw(self) -> dict:
         """Get the raw installation data."""
@@ -0,0 +1,157 @@
+"""Define the instrumentation module."""
+
+from time import perf_counter_ns
+from typing import Dict, List, NamedTuple, Tuple
+
+STAGE_PARSE = 'parse'
+STAGE_VERIFY = 'verify'
+STAGE_PROCESS = 'process'
+STAGE_DISPATCH = 'dispatch'
+STAGE_ENCODE = 'encode'
+STAGE_TOTAL = 'total'
+
+# Each power of two is split into 2 ** _SUB_BITS buckets, so a percentile
+# is reported within 1 / 2 ** _SUB_BITS of the recorded duration.
+_SUB_BITS = 3
+_BUCKETS = (65 - _SUB_BITS) << _SUB_BITS
+
+
+def _bucket(value: int) -> int:
+    length = value.bit_length()
+    if length <= _SUB_BITS + 1:
+        return value
+    shift = length - _SUB_BITS - 1
+    return (shift << _SUB_BITS) + (value >> shift)
+
+
+def _bucket_upper(index: int) -> int:
+    if index < 2 << _SUB_BITS:
+        return index
+    shift = (index >> _SUB_BITS) - 1
+    mantissa = index - (shift << _SUB_BITS)
+    return ((mantissa + 1) << shift) - 1
+
+
+class StageTiming(NamedTuple):
+    """Define the summary of the durations recorded for a stage."""
+
+    count: int
+    mean_ns: float
+    p50_ns: int
+    p99_ns: int
+    max_ns: int
+
+
+class Histogram:
+    """Counts durations in log-linear buckets.
+
+    Recording is a few integer operations on the event loop's thread, so
+    no lock is taken.
+    """
+
+    __slots__ = ('_counts', '_total', '_max')
+
+    def __init__(self):
+        """Create a new instance of the Histogram class."""
+        self._counts = [0] * _BUCKETS
+        self._total = 0
+        self._max = 0
+
+    def record(self, value: int):
+        """Record a duration in nanoseconds."""
+        # This is _bucket inlined, as recording is on the hot path.
+        length = value.bit_length()
+        if length > _SUB_BITS + 1:
+            shift = length - _SUB_BITS - 1
+            self._counts[(shift << _SUB_BITS) + (value >> shift)] += 1
+        else:
+            self._counts[value] += 1
+        self._total += value
+        if value > self._max:  # pylint: disable=consider-using-max-builtin
+            self._max = value
+
+    def percentile(self, percent: float) -> int:
+        """Get the duration the percent of recorded durations are within."""
+        total = self.count
+        if not total:
+            return 0
+        rank = max(total * percent / 100, 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_upper(index), self._max)
+        return self._max  # pragma: no cover
+
+    def count_at_most(self, value: int) -> int:
+        """Get the number of durations in buckets ending at or below it."""
+        index = _bucket(value)
+        if _bucket_upper(index) > value:
+            index -= 1
+        return sum(self._counts[:index + 1])
+
+    def summary(self) -> StageTiming:
+        """Get the count, mean, p50, p99 and max of the durations."""
+        total = self.count
+        return StageTiming(
+            total, self._total / total if total else 0.0,
+            self.percentile(50), self.percentile(99), self._max)
+
+    @property
+    def count(self) -> int:
+        """Get the number of durations recorded."""
+        return sum(self._counts)
+
+    @property
+    def total(self) -> int:
+        """Get the sum of the durations recorded."""
+        return self._total
+
+    @property
+    def max(self) -> int:
+        """Get the longest duration recorded."""
+        return self._max
+
+
+class Instrumentation:
+    """Records how long each stage of handling a request takes."""
+
+    def __init__(self):
+        """Create a new instance of the Instrumentation class."""
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def record(self, lifecycle: str, stage: str, elapsed_ns: int):
+        """Record the nanoseconds a stage took for the lifecycle."""
+        histogram = self._histograms.get((lifecycle, stage))
+        if histogram is None:
+            histogram = self._histograms[(lifecycle, stage)] = Histogram()
+        histogram.record(elapsed_ns)
+
+    def lap(self, lifecycle: str, stage: str, started_ns: int) -> int:
+        """Record the stage as ending now and get the time it ended."""
+        now = perf_counter_ns()
+        histogram = self._histograms.get((lifecycle, stage))
+        if histogram is None:
+            histogram = self._histograms[(lifecycle, stage)] = Histogram()
+        histogram.record(now - started_ns)
+        return now
+
+    def histogram(self, lifecycle: str, stage: str) -> Histogram:
+        """Get the histogram of the stage, if any were recorded."""
+        return self._histograms.get((lifecycle, stage))
+
+    def snapshot(self) -> Dict[str, Dict[str, StageTiming]]:
+        """Get the timing summary of each stage by lifecycle."""
+        snapshot = {}
+        for (lifecycle, stage), histogram in self._histograms.items():
+            snapshot.setdefault(lifecycle, {})[stage] = histogram.summary()
+        return snapshot
+
+    def reset(self):
+        """Discard everything recorded."""
+        self._histograms.clear()
+
+    @property
+    def stages(self) -> List[Tuple[str, str]]:
+        """Get the lifecycle and stage pairs that were recorded."""
+        return list(self._histograms)
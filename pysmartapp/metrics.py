@@ -0,0 +1,251 @@
+"""Define the metrics module."""
+
+import asyncio
+import functools
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from .instrumentation import Histogram
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0)
+
+
+class TargetMetrics:
+    """Define the invocation counts and latency of a dispatcher target."""
+
+    __slots__ = ('calls', 'errors', 'cancelled', 'in_flight', 'latency')
+
+    def __init__(self):
+        """Create a new instance of the TargetMetrics class."""
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+
+    def started(self, future: asyncio.Future):
+        """Count a call of the target until its future is done."""
+        self.calls += 1
+        self.in_flight += 1
+        future.add_done_callback(
+            functools.partial(self._done, perf_counter_ns()))
+
+    def _done(self, started: int, future: asyncio.Future):
+        self.in_flight -= 1
+        if future.cancelled():
+            self.cancelled += 1
+            return
+        self.latency.record(perf_counter_ns() - started)
+        if future.exception() is not None:
+            self.errors += 1
+
+
+class DispatchMetrics:
+    """Collects metrics of the signals and targets of a dispatcher.
+
+    Targets are named after the function they call, so targets connected
+    more than once, or to the same function, share their metrics.
+    """
+
+    def __init__(self):
+        """Create a new instance of the DispatchMetrics class."""
+        self._sent = {}
+        self._targets: Dict[Tuple[str, str], TargetMetrics] = {}
+
+    def signal_sent(self, signal: str):
+        """Count a signal that was sent."""
+        self._sent[signal] = self._sent.get(signal, 0) + 1
+
+    def target(self, signal: str, target: Callable[..., Any]) \
+            -> TargetMetrics:
+        """Get the metrics of the target connected to the signal."""
+        key = (signal, get_target_name(target))
+        metrics = self._targets.get(key)
+        if metrics is None:
+            metrics = self._targets[key] = TargetMetrics()
+        return metrics
+
+    def meter(self, signal: str, target: Callable[..., Any],
+              call: Callable[..., asyncio.Future]) \
+            -> Callable[..., asyncio.Future]:
+        """Wrap the call of a target so its invocations are measured."""
+        metrics = self.target(signal, target)
+
+        def metered(*args: Any) -> asyncio.Future:
+            future = call(*args)
+            if future is not None:
+                metrics.started(future)
+            return future
+        return metered
+
+    @property
+    def sent(self) -> Dict[str, int]:
+        """Get the number of times each signal was sent."""
+        return self._sent
+
+    @property
+    def targets(self) -> Dict[Tuple[str, str], TargetMetrics]:
+        """Get the metrics of each signal and target name."""
+        return self._targets
+
+
+def get_target_name(target: Callable[..., Any]) -> str:
+    """Get the module and qualified name of the function a target calls."""
+    while isinstance(target, functools.partial):
+        target = target.func
+    if not hasattr(target, '__qualname__'):
+        target = type(target)
+    module = getattr(target, '__module__', None)
+    if module:
+        return F"{module}.{target.__qualname__}"
+    return target.__qualname__
+
+
+def render_metrics(*, dispatcher=None, manager=None, instrumentation=None,
+                   admission=None, prefix: str = 'pysmartapp') -> str:
+    """Render the metrics in the Prometheus text exposition format.
+
+    Any of the dispatcher, the SmartAppManager, the Instrumentation and
+    the AdmissionController of the apps can be given. Serve the text with
+    CONTENT_TYPE.
+    """
+    writer = _MetricsWriter(prefix)
+    if dispatcher is not None:
+        _write_dispatcher(writer, dispatcher)
+    if manager is not None:
+        writer.family(
+            'requests_total', 'counter',
+            'Requests handled by the manager by app id and lifecycle.',
+            [({'app_id': app_id, 'lifecycle': lifecycle}, count)
+             for (app_id, lifecycle), count
+             in manager.request_counts.items()])
+        writer.family(
+            'requests_unregistered_total', 'counter',
+            'Requests for apps that are not registered with the manager.',
+            [({'app_id': app_id, 'lifecycle': lifecycle}, count)
+             for (app_id, lifecycle), count
+             in manager.unregistered_counts.items()])
+    if instrumentation is not None:
+        writer.histograms(
+            'stage_duration_seconds',
+            'Time spent in each stage of handling a request.',
+            [({'lifecycle': lifecycle, 'stage': stage},
+              instrumentation.histogram(lifecycle, stage))
+             for lifecycle, stage in instrumentation.stages])
+    if admission is not None:
+        _write_admission(writer, admission)
+    return writer.text()
+
+
+def _write_dispatcher(writer: '_MetricsWriter', dispatcher):
+    writer.family(
+        'dispatcher_in_flight', 'gauge',
+        'Targets started by the dispatcher that have not finished.',
+        [({}, len(dispatcher.in_flight))])
+    pools = dispatcher.pools.values()
+    writer.family(
+        'dispatcher_pool_active', 'gauge',
+        'Synchronous targets running in each pool.',
+        [({'pool': pool.name}, pool.active) for pool in pools])
+    writer.family(
+        'dispatcher_pool_queued', 'gauge',
+        'Synchronous targets waiting for a worker in each pool.',
+        [({'pool': pool.name}, pool.queued) for pool in pools])
+    writer.family(
+        'dispatcher_pool_rejected_total', 'counter',
+        'Synchronous targets rejected because the pool queue was full.',
+        [({'pool': pool.name}, pool.rejected) for pool in pools])
+    metrics = dispatcher.metrics
+    if metrics is None:
+        return
+    writer.family(
+        'signals_sent_total', 'counter', 'Signals sent by the dispatcher.',
+        [({'signal': signal}, count)
+         for signal, count in metrics.sent.items()])
+    targets = [({'signal': signal, 'target': name}, target)
+               for (signal, name), target in metrics.targets.items()]
+    writer.family(
+        'target_calls_total', 'counter', 'Calls of each target.',
+        [(labels, target.calls) for labels, target in targets])
+    writer.family(
+        'target_errors_total', 'counter',
+        'Calls of each target that raised an exception.',
+        [(labels, target.errors) for labels, target in targets])
+    writer.family(
+        'target_cancelled_total', 'counter',
+        'Calls of each target that were cancelled.',
+        [(labels, target.cancelled) for labels, target in targets])
+    writer.family(
+        'target_in_flight', 'gauge',
+        'Calls of each target that have not finished.',
+        [(labels, target.in_flight) for labels, target in targets])
+    writer.histograms(
+        'target_duration_seconds', 'Time each target took to finish.',
+        [(labels, target.latency) for labels, target in targets])
+
+
+def _write_admission(writer: '_MetricsWriter', admission):
+    writer.family(
+        'admission_requests', 'gauge', 'Requests admitted and in flight.',
+        [({'app_id': app_id}, count)
+         for app_id, count in admission.app_requests.items()])
+    writer.family(
+        'admission_handlers', 'gauge',
+        'Handler tasks of admitted requests that have not finished.',
+        [({'app_id': app_id}, count)
+         for app_id, count in admission.app_handlers.items()])
+    writer.family(
+        'requests_shed_total', 'counter',
+        'Requests shed by admission control by app id and limit reached.',
+        [({'app_id': app_id, 'reason': reason}, count)
+         for (app_id, reason), count in admission.shed.items()])
+
+
+class _MetricsWriter:
+    def __init__(self, prefix: str):
+        self._prefix = prefix
+        self._lines: List[str] = []
+
+    def family(self, name: str, metric_type: str, description: str,
+               samples: Iterable[Tuple[Dict[str, str], Any]]):
+        """Write a metric family and its samples."""
+        name = F"{self._prefix}_{name}"
+        self._lines.append(F"# HELP {name} {description}")
+        self._lines.append(F"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histograms(self, name: str, description: str,
+                   samples: Iterable[Tuple[Dict[str, str], Histogram]]):
+        """Write a histogram family with cumulative latency buckets."""
+        name = F"{self._prefix}_{name}"
+        self._lines.append(F"# HELP {name} {description}")
+        self._lines.append(F"# TYPE {name} histogram")
+        for labels, histogram in samples:
+            for bound in LATENCY_BUCKETS:
+                self._sample(F"{name}_bucket", {**labels, 'le': str(bound)},
+                             histogram.count_at_most(int(bound * 1e9)))
+            count = histogram.count
+            self._sample(F"{name}_bucket", {**labels, 'le': '+Inf'}, count)
+            self._sample(F"{name}_sum", labels, histogram.total / 1e9)
+            self._sample(F"{name}_count", labels, count)
+
+    def _sample(self, name: str, labels: Dict[str, str], value):
+        if labels:
+            label_text = ','.join(
+                F'{key}="{_escape(str(label))}"'
+                for key, label in labels.items())
+            name = F"{name}{{{label_text}}}"
+        self._lines.append(F"{name} {value}")
+
+    def text(self) -> str:
+        """Get the text of everything written."""
+        return '\n'.join(self._lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
@@ -6,6 +6,8 @@ from .request import EmptyDataResponse, Request, Response
 class OAuthCallbackRequest(Request):
     """Define the OAuthCallbackRequest class."""
 
+    __slots__ = ('_oauth_callback_data_raw', '_url_path')
+
     def __init__(self, data: dict):
         """Create a new instance of the OAuthCallbackRequest."""
         super().__init__(data)
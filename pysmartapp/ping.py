@@ -1,11 +1,17 @@
 """Define the ping module."""
 
 from .request import Request, Response
+from .serialization import dumps
+
+_PING_PREFIX = b'{"pingData":{"challenge":'
+_PING_SUFFIX = b'}}'
 
 
 class PingRequest(Request):
     """Defines a ping request."""
 
+    __slots__ = ('_ping_data_raw',)
+
     def __init__(self, data: dict):
         """Create a new instance of the PingRequest class."""
         super().__init__(data)
@@ -39,6 +45,10 @@ class PingResponse(Response):
         """Create a data structure for the response."""
         return {'pingData': {'challenge': self.ping_challenge}}
 
+    def to_bytes(self) -> bytes:
+        """Create the encoded JSON body of the response."""
+        return _PING_PREFIX + dumps(self._ping_challenge) + _PING_SUFFIX
+
     @property
     def ping_challenge(self):
         """Get the ping challenge in the response."""
@@ -0,0 +1,73 @@
+"""Define the replay module."""
+
+from collections import OrderedDict
+import time
+from typing import Hashable
+
+
+class ReplayCache:
+    """Remembers recently handled requests so retries can be detected."""
+
+    def __init__(self, *, max_size: int = 1024, ttl: float = 300.0):
+        """Create a new instance of the ReplayCache class."""
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def check(self, key: Hashable) -> bool:
+        """Get whether the key was seen within the time window."""
+        self._evict(time.monotonic())
+        if key in self._entries:
+            self._hits += 1
+            return True
+        self._misses += 1
+        return False
+
+    def add(self, key: Hashable):
+        """Remember the key for the length of the time window."""
+        now = time.monotonic()
+        self._entries.pop(key, None)
+        self._entries[key] = now + self._ttl
+        self._evict(now)
+
+    def clear(self):
+        """Forget all keys and reset the counters."""
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def _evict(self, now: float):
+        # Entries are kept in insertion order and share the same ttl, so
+        # the oldest entries are always at the front.
+        entries = self._entries
+        while entries and (len(entries) > self._max_size
+                           or next(iter(entries.values())) <= now):
+            entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        """Get the number of keys remembered."""
+        return len(self._entries)
+
+    @property
+    def max_size(self) -> int:
+        """Get the maximum number of keys remembered."""
+        return self._max_size
+
+    @property
+    def ttl(self) -> float:
+        """Get the number of seconds a key is remembered."""
+        return self._ttl
+
+    @property
+    def hits(self) -> int:
+        """Get the number of checks that found a known key."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Get the number of checks that found an unknown key."""
+        return self._misses
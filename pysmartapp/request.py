@@ -1,8 +1,20 @@
 """Define the request module."""
 
-from httpsig.verify import HeaderVerifier
+import hashlib
+from time import perf_counter_ns
 
 from .errors import SignatureVerificationError
+from .instrumentation import STAGE_DISPATCH, STAGE_PROCESS, STAGE_VERIFY
+from .serialization import dumps
+from .signature import SignedMessage, normalize_headers
+
+# Responses to every lifecycle except PING and CONFIGURATION are always
+# the same, so they're encoded once up front.
+EMPTY_DATA_BYTES = {
+    name: dumps({name: {}}) for name in (
+        'installData', 'updateData', 'eventData', 'oAuthCallbackData',
+        'uninstallData')
+}
 
 
 class Response:
@@ -12,6 +24,10 @@ class Response:
         """Create a data structure for the response."""
         raise NotImplementedError
 
+    def to_bytes(self) -> bytes:
+        """Create the encoded JSON body of the response."""
+        return dumps(self.to_data())
+
 
 class EmptyDataResponse(Response):
     """Defines a response with an empty data structure."""
@@ -24,6 +40,13 @@ class EmptyDataResponse(Response):
         """Return a data structure representing this request."""
         return {self.name: {}}
 
+    def to_bytes(self) -> bytes:
+        """Return the encoded JSON body of the response."""
+        encoded = EMPTY_DATA_BYTES.get(self._name)
+        if encoded is None:
+            encoded = dumps({self._name: {}})
+        return encoded
+
     @property
     def name(self) -> str:
         """Get the name of the empty data tag."""
@@ -38,6 +61,11 @@ class EmptyDataResponse(Response):
 class Request:
     """Defines a request to process."""
 
+    __slots__ = (
+        '_lifecycle', '_execution_id', '_locale', '_version',
+        '_installed_app_id', '_location_id', '_installed_app_config',
+        '_settings', '_supports_validation', '_is_duplicate')
+
     def __init__(self, data: dict):
         """Create a new instance of the Request class."""
         self._lifecycle = data['lifecycle']
@@ -49,6 +77,7 @@ class Request:
         self._installed_app_config = {}
         self._settings = data.get('settings', {})
         self._supports_validation = True
+        self._is_duplicate = False
 
     def _init_installed_app(self, installed_app):
         self._installed_app_id = installed_app['installedAppId']
@@ -56,25 +85,98 @@ class Request:
         self._installed_app_config = installed_app['config']
 
     async def process(self, app, headers: list = None,
-                      validate_signature: bool = True) -> Response:
-        """Process the request with the SmartApp."""
+                      validate_signature: bool = True,
+                      body: bytes = None) -> Response:
+        """Process the request with the SmartApp.
+
+        When the raw body is given, it's checked against the digest header
+        as part of validating the signature.
+        """
+        replay_cache = getattr(app, 'replay_cache', None)
+        instrumentation = getattr(app, 'instrumentation', None)
+        if instrumentation is not None:
+            started = perf_counter_ns()
+        signed = None
         if validate_signature and self._supports_validation:
-            try:
-                verifier = HeaderVerifier(
-                    headers=headers, secret=app.public_key, method='POST',
-                    path=app.path)
-                result = verifier.verify()
-            except Exception as ex:
-                raise SignatureVerificationError from ex
-            if not result:
-                raise SignatureVerificationError
+            signed = self._parse_signature(app, headers, body)
+        replay_key = None
+        if self._supports_validation and replay_cache is not None:
+            replay_key = self._get_replay_key(app, headers, body, signed)
+            self._is_duplicate = replay_cache.check(replay_key)
+        # A duplicate already passed verification the first time it was
+        # received, so only the public key operation is skipped. The
+        # checks made by parsing still run.
+        if signed is not None and not self._is_duplicate:
+            await self._verify_signature(app, signed)
+        if replay_key is not None and not self._is_duplicate:
+            replay_cache.add(replay_key)
+        if instrumentation is not None:
+            started = instrumentation.lap(
+                self._lifecycle, STAGE_VERIFY, started)
         response = await self._process(app)
-        app.dispatcher.send(self.lifecycle, self, response, app)
+        token_store = getattr(app, 'token_store', None)
+        if token_store is not None:
+            self._update_tokens(token_store)
+        if instrumentation is not None:
+            started = instrumentation.lap(
+                self._lifecycle, STAGE_PROCESS, started)
+        if self._is_duplicate and app.drop_duplicates:
+            return response
+        if app.wait_for_handlers:
+            await app.dispatcher.asend(self.lifecycle, self, response, app,
+                                       timeout=app.handler_timeout)
+        else:
+            futures = app.dispatcher.send(self.lifecycle, self, response, app)
+            admission = getattr(app, 'admission', None)
+            if admission is not None and futures:
+                admission.track(getattr(app, 'app_id', None) or '', futures)
+        if instrumentation is not None:
+            instrumentation.lap(self._lifecycle, STAGE_DISPATCH, started)
         return response
 
+    def _get_replay_key(self, app, headers, body: bytes,
+                        signed: SignedMessage) -> tuple:
+        # Requests are only duplicates for the same app and key, and when
+        # verifying, for the same signing string, so a signature can't be
+        # reused with other signed headers or for another app. The raw body
+        # is included so a different body gets its digest checked.
+        if signed is None:
+            signed = normalize_headers(headers).get('authorization')
+        return (
+            getattr(app, 'app_id', None), getattr(app, 'public_key', None),
+            self._execution_id, signed,
+            hashlib.sha256(body).digest() if body is not None else None)
+
+    @staticmethod
+    def _parse_signature(app, headers, body: bytes) -> SignedMessage:
+        try:
+            return app.verifier.parse(headers, body)
+        except SignatureVerificationError:
+            raise
+        except Exception as ex:
+            raise SignatureVerificationError from ex
+
+    @staticmethod
+    async def _verify_signature(app, signed: SignedMessage):
+        pool = app.verification_pool
+        try:
+            if pool:
+                result = await pool.verify_message(app.verifier, signed)
+            else:
+                result = app.verifier.verify_message(signed)
+        except SignatureVerificationError:
+            raise
+        except Exception as ex:
+            raise SignatureVerificationError from ex
+        if not result:
+            raise SignatureVerificationError
+
     async def _process(self, app) -> Response:
         raise NotImplementedError
 
+    def _update_tokens(self, token_store):
+        """Update the token store with the tokens of the request, if any."""
+
     @property
     def lifecycle(self) -> str:
         """Get the lifecycle of the request."""
@@ -114,3 +216,8 @@ class Request:
     def settings(self):
         """Get the settings associated with the request."""
         return self._settings
+
+    @property
+    def is_duplicate(self) -> bool:
+        """Get whether the request was already received recently."""
+        return self._is_duplicate
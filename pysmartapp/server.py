@@ -0,0 +1,252 @@
+"""Define the server module."""
+
+import asyncio
+from http import HTTPStatus
+import logging
+from typing import List, Optional, Tuple
+
+from .errors import (
+    SignatureVerificationError, SmartAppNotRegisteredError,
+    SmartAppOverloadedError)
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BODY_SIZE = 4 * 1024 * 1024
+DEFAULT_KEEP_ALIVE_TIMEOUT = 75.0
+MAX_HEAD_SIZE = 64 * 1024
+
+# Status lines and the fixed headers are encoded once, so writing a
+# response only formats the content length.
+_STATUS_LINES = {
+    status: F"HTTP/1.1 {status.value} {status.phrase}\r\n".encode('ascii')
+    for status in HTTPStatus
+}
+_JSON_HEADERS = b'Content-Type: application/json\r\n'
+_CLOSE_HEADERS = b'Connection: close\r\n'
+
+
+class HttpProtocol(asyncio.Protocol):
+    """Serves lifecycle requests to a SmartApp or SmartAppManager.
+
+    Implements just enough of HTTP/1.1 for SmartThings to deliver requests:
+    POST to the path of the app with a Content-Length body. Connections are
+    kept alive and pipelined requests are answered in order, one at a time.
+    """
+
+    def __init__(self, app, *, validate_signature: bool = True,
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+                 keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT):
+        """Create a new instance of the HttpProtocol class."""
+        self._app = app
+        self._validate_signature = validate_signature
+        self._max_body_size = max_body_size
+        self._keep_alive_timeout = keep_alive_timeout
+        self._loop = asyncio.get_running_loop()
+        self._transport = None
+        self._buffer = bytearray()
+        # The head of a request whose body hasn't fully arrived yet.
+        self._pending = None
+        self._task = None
+        self._paused = False
+        self._eof = False
+        self._idle_handle = None
+
+    def connection_made(self, transport: asyncio.Transport):
+        """Start the keep-alive timer of the new connection."""
+        self._transport = transport
+        self._start_idle_timer()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        """Discard the state of the connection."""
+        self._cancel_idle_timer()
+        self._buffer.clear()
+        self._pending = None
+
+    def data_received(self, data: bytes):
+        """Buffer the data and handle the request once it's complete."""
+        self._cancel_idle_timer()
+        self._buffer += data
+        if self._task is None:
+            self._process_buffer()
+        elif len(self._buffer) > self._max_body_size and not self._paused:
+            # A client pipelining faster than requests are handled is
+            # stopped from growing the buffer without bound.
+            self._paused = True
+            self._transport.pause_reading()
+
+    def eof_received(self) -> bool:
+        """Close the connection once the current request is answered."""
+        self._eof = True
+        return self._task is not None
+
+    def _process_buffer(self):
+        buffer = self._buffer
+        if self._pending is None:
+            end = buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(buffer) > MAX_HEAD_SIZE:
+                    self._abort(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                else:
+                    self._start_idle_timer()
+                return
+            head = self._parse_head(bytes(buffer[:end]))
+            if head is None:
+                return
+            self._pending = head + (end + 4,)
+        headers, length, keep_alive, start = self._pending
+        if len(buffer) < start + length:
+            self._start_idle_timer()
+            return
+        body = bytes(buffer[start:start + length])
+        del buffer[:start + length]
+        self._pending = None
+        self._task = self._loop.create_task(
+            self._handle(body, headers, keep_alive))
+
+    def _parse_head(self, head: bytes) \
+            -> Optional[Tuple[List[Tuple[str, str]], int, bool]]:
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            return self._abort(HTTPStatus.BAD_REQUEST)
+        method, target, version = parts
+        keep_alive = version != 'HTTP/1.0'
+        length = None
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                return self._abort(HTTPStatus.BAD_REQUEST)
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'content-length':
+                length = parse_content_length(value, length)
+                if length is None:
+                    return self._abort(HTTPStatus.BAD_REQUEST)
+            elif name == 'connection':
+                keep_alive = _get_keep_alive(value, keep_alive)
+            elif name == 'transfer-encoding':
+                return self._abort(HTTPStatus.NOT_IMPLEMENTED)
+            headers.append((name, value))
+        if target.partition('?')[0] != self._app.path:
+            return self._abort(HTTPStatus.NOT_FOUND)
+        if method != 'POST':
+            return self._abort(HTTPStatus.METHOD_NOT_ALLOWED)
+        if length is None:
+            return self._abort(HTTPStatus.LENGTH_REQUIRED)
+        if length > self._max_body_size:
+            return self._abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        return headers, length, keep_alive
+
+    async def _handle(self, body: bytes, headers: List[Tuple[str, str]],
+                      keep_alive: bool):
+        status, content = await serve_request(
+            self._app, body, headers, self._validate_signature)
+        self._task = None
+        transport = self._transport
+        if transport.is_closing():
+            return
+        self._write(status, content, keep_alive)
+        if not keep_alive:
+            transport.close()
+            return
+        if self._paused:
+            self._paused = False
+            transport.resume_reading()
+        self._process_buffer()
+        # Requests pipelined before the client half-closed are answered
+        # before the connection is closed.
+        if self._eof and self._task is None:
+            transport.close()
+
+    def _write(self, status: HTTPStatus, content: bytes, keep_alive: bool):
+        self._transport.write(b''.join((
+            _STATUS_LINES[status],
+            _JSON_HEADERS if content else b'',
+            b'' if keep_alive else _CLOSE_HEADERS,
+            b'Content-Length: %d\r\n\r\n' % len(content),
+            content)))
+
+    def _abort(self, status: HTTPStatus):
+        self._write(status, b'', False)
+        self._transport.close()
+        self._buffer.clear()
+
+    def _start_idle_timer(self):
+        if self._keep_alive_timeout is not None:
+            self._idle_handle = self._loop.call_later(
+                self._keep_alive_timeout, self._transport.close)
+
+    def _cancel_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+
+async def serve_request(app, body: bytes, headers,
+                        validate_signature: bool = True) \
+        -> Tuple[HTTPStatus, bytes]:
+    """Handle the request body and get the HTTP status and response body.
+
+    Errors are answered with an empty body: 401 when the signature is
+    rejected, 404 for apps that aren't registered, 429 or 503 when shed
+    by the limit of the app or a global limit, 400 for malformed requests
+    and 500 for anything else.
+    """
+    try:
+        return HTTPStatus.OK, await app.handle_request_bytes(
+            body, headers, validate_signature)
+    except SmartAppOverloadedError as ex:
+        if ex.is_app_limit:
+            return HTTPStatus.TOO_MANY_REQUESTS, b''
+        return HTTPStatus.SERVICE_UNAVAILABLE, b''
+    except SignatureVerificationError:
+        return HTTPStatus.UNAUTHORIZED, b''
+    except SmartAppNotRegisteredError:
+        return HTTPStatus.NOT_FOUND, b''
+    except (KeyError, TypeError, ValueError):
+        return HTTPStatus.BAD_REQUEST, b''
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception("Unable to handle the request.")
+        return HTTPStatus.INTERNAL_SERVER_ERROR, b''
+
+
+async def start_server(app, host: str = None, port: int = 8080, *,
+                       validate_signature: bool = True,
+                       max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+                       keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+                       **kwargs) -> asyncio.AbstractServer:
+    """Start serving the SmartApp or SmartAppManager over HTTP.
+
+    Any other keyword arguments, such as ssl, are passed to create_server.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(
+        lambda: HttpProtocol(
+            app, validate_signature=validate_signature,
+            max_body_size=max_body_size,
+            keep_alive_timeout=keep_alive_timeout),
+        host, port, **kwargs)
+
+
+def parse_content_length(value: str, length: int = None) -> Optional[int]:
+    """Get the length in a Content-Length header, or None if it's invalid.
+
+    The length already read from an earlier Content-Length header of the
+    request, if any, must be repeated.
+    """
+    # isdigit() alone accepts digits int() can't parse, like superscripts.
+    if not value.isascii() or not value.isdigit():
+        return None
+    if length is not None and int(value) != length:
+        return None
+    return int(value)
+
+
+def _get_keep_alive(value: str, default: bool) -> bool:
+    tokens = value.lower()
+    if 'close' in tokens:
+        return False
+    if 'keep-alive' in tokens:
+        return True
+    return default
@@ -0,0 +1,352 @@
+"""Define the signature module."""
+
+import asyncio
+import base64
+import binascii
+from collections import Counter
+from concurrent.futures import (
+    Executor, ProcessPoolExecutor, ThreadPoolExecutor)
+from email.utils import parsedate_to_datetime
+import hashlib
+import os
+import time
+from typing import Callable, Dict, FrozenSet, NamedTuple, Sequence
+
+from httpsig.utils import ALGORITHMS, parse_authorization_header
+from httpsig.verify import Verifier
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:  # pragma: no cover
+    serialization = None
+
+from .const import (
+    REJECTED_CLOCK_SKEW, REJECTED_DIGEST, REJECTED_KEY_ID,
+    REJECTED_MALFORMED_SIGNATURE, REJECTED_MISSING_HEADER,
+    REJECTED_MISSING_SIGNATURE, REJECTED_UNSUPPORTED_ALGORITHM)
+from .errors import SignatureVerificationError
+
+REQUIRED_HEADERS = ('date',)
+DIGEST_ALGORITHMS = {
+    'sha-256': hashlib.sha256,
+    'sha-512': hashlib.sha512
+}
+
+
+class SignedMessage(NamedTuple):
+    """Define the parts of a request needed to check its signature."""
+
+    algorithm: str
+    message: bytes
+    signature: str
+
+
+class SignatureVerifier:
+    """Verifies the HTTP signature of requests sent to a SmartApp."""
+
+    algorithms: FrozenSet[str] = None
+
+    def __init__(self, public_key: str, path: str, method: str = 'POST', *,
+                 key_id: str = None, max_clock_skew: float = None):
+        """Create a new instance of the SignatureVerifier class."""
+        self._public_key = public_key
+        self._path = path
+        self._method = method
+        self._key_id = key_id
+        self._max_clock_skew = max_clock_skew
+        self._rejections = Counter()
+        # The request line is the same for every request the SmartApp
+        # receives, so its part of the signing string is built only once.
+        self._request_target = F"(request-target): {method.lower()} {path}"
+
+    def verify(self, headers, body: bytes = None) -> bool:
+        """Verify the signature contained in the headers."""
+        return self.verify_message(self.parse(headers, body))
+
+    def verify_message(self, signed: SignedMessage) -> bool:
+        """Verify the signature of a parsed message."""
+        return self._verify_signature(*signed)
+
+    def parse(self, headers, body: bytes = None) -> SignedMessage:
+        """Parse the headers into the message that was signed.
+
+        Requests that can't possibly pass verification are rejected here,
+        before any public key operation, with SignatureVerificationError.
+        When the raw body is given it must match the digest header.
+        """
+        headers = normalize_headers(headers)
+        authorization = headers.get('authorization')
+        if not authorization:
+            self._reject(REJECTED_MISSING_SIGNATURE)
+        try:
+            scheme = parse_authorization_header(authorization)
+        except ValueError:
+            self._reject(REJECTED_MALFORMED_SIGNATURE)
+        auth = scheme[1]
+        if scheme[0].lower() != 'signature' or 'signature' not in auth \
+                or 'algorithm' not in auth:
+            self._reject(REJECTED_MALFORMED_SIGNATURE)
+        algorithm = auth['algorithm'].lower()
+        if self.algorithms is not None and algorithm not in self.algorithms:
+            self._reject(REJECTED_UNSUPPORTED_ALGORITHM)
+        if self._key_id is not None and auth.get('keyid') != self._key_id:
+            self._reject(REJECTED_KEY_ID)
+        signed_headers = auth.get('headers', 'date').lower().split(' ')
+        if any(name not in signed_headers for name in REQUIRED_HEADERS) \
+                or any(name not in headers for name in signed_headers
+                       if name != '(request-target)'):
+            self._reject(REJECTED_MISSING_HEADER)
+        if self._max_clock_skew is not None:
+            self._check_date(headers['date'])
+        if body is not None:
+            self._check_digest(headers.get('digest'), body)
+        # Signed header values must be ASCII to be part of the message.
+        try:
+            message = self.build_message(signed_headers, headers)
+        except UnicodeEncodeError:
+            self._reject(REJECTED_MALFORMED_SIGNATURE)
+        return SignedMessage(algorithm, message, auth['signature'])
+
+    def _check_date(self, value: str):
+        try:
+            sent = parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            self._reject(REJECTED_CLOCK_SKEW)
+        if abs(time.time() - sent) > self._max_clock_skew:
+            self._reject(REJECTED_CLOCK_SKEW)
+
+    def _check_digest(self, value: str, body: bytes):
+        if not value:
+            self._reject(REJECTED_MISSING_HEADER)
+        for digest in value.split(','):
+            name, _, encoded = digest.strip().partition('=')
+            algorithm = DIGEST_ALGORITHMS.get(name.lower())
+            if algorithm is None:
+                continue
+            try:
+                expected = base64.b64decode(encoded, validate=True)
+            except binascii.Error:
+                break
+            if algorithm(body).digest() == expected:
+                return
+            break
+        self._reject(REJECTED_DIGEST)
+
+    def _reject(self, reason: str):
+        self._rejections[reason] += 1
+        raise SignatureVerificationError(reason)
+
+    def build_message(self, signed_headers: Sequence[str],
+                      headers: Dict[str, str]) -> bytes:
+        """Build the signing string from the normalized headers."""
+        lines = []
+        for name in signed_headers:
+            if name == '(request-target)':
+                lines.append(self._request_target)
+            elif name in headers:
+                lines.append(F"{name}: {headers[name]}")
+            else:
+                raise ValueError(F'missing required header "{name}"')
+        return '\n'.join(lines).encode('ascii')
+
+    def _verify_signature(self, algorithm: str, message: bytes,
+                          signature: str) -> bool:
+        raise NotImplementedError
+
+    @property
+    def public_key(self) -> str:
+        """Get the public key used to verify signatures."""
+        return self._public_key
+
+    @property
+    def path(self) -> str:
+        """Get the path included in the signed request target."""
+        return self._path
+
+    @property
+    def key_id(self) -> str:
+        """Get the key id requests must be signed with, if any."""
+        return self._key_id
+
+    @property
+    def max_clock_skew(self) -> float:
+        """Get the seconds the date header may differ from now, if any."""
+        return self._max_clock_skew
+
+    @property
+    def rejections(self) -> Dict[str, int]:
+        """Get the number of requests rejected before verify by reason."""
+        return self._rejections
+
+
+class HttpSigVerifier(SignatureVerifier):
+    """Verifies signatures with the httpsig package."""
+
+    algorithms = ALGORITHMS
+
+    def __init__(self, public_key: str, path: str, method: str = 'POST',
+                 **kwargs):
+        """Create a new instance of the HttpSigVerifier class."""
+        super().__init__(public_key, path, method, **kwargs)
+        self._verifiers = {}
+
+    def _verify_signature(self, algorithm: str, message: bytes,
+                          signature: str) -> bool:
+        # Importing the key is expensive, so it is only done once per
+        # algorithm and reused for every request afterwards.
+        verifier = self._verifiers.get(algorithm)
+        if verifier is None:
+            verifier = self._verifiers[algorithm] = Verifier(
+                self._public_key, algorithm=algorithm)
+        # pylint: disable=protected-access
+        return verifier._verify(message, signature)
+
+
+class CryptographyVerifier(SignatureVerifier):
+    """Verifies RSA signatures with the cryptography package."""
+
+    hash_algorithms = {
+        'rsa-sha1': 'SHA1',
+        'rsa-sha256': 'SHA256',
+        'rsa-sha512': 'SHA512'
+    }
+    algorithms = frozenset(hash_algorithms)
+
+    def __init__(self, public_key: str, path: str, method: str = 'POST',
+                 **kwargs):
+        """Create a new instance of the CryptographyVerifier class."""
+        if serialization is None:
+            raise RuntimeError("The cryptography package is not installed.")
+        super().__init__(public_key, path, method, **kwargs)
+        self._key = None
+
+    def _verify_signature(self, algorithm: str, message: bytes,
+                          signature: str) -> bool:
+        hash_name = self.hash_algorithms[algorithm]
+        if self._key is None:
+            self._key = serialization.load_pem_public_key(
+                _strip_pem(self._public_key))
+        try:
+            self._key.verify(base64.b64decode(signature), message,
+                             padding.PKCS1v15(),
+                             getattr(hashes, hash_name)())
+        except InvalidSignature:
+            return False
+        return True
+
+
+# Called with the public key and path of an app, and with key_id as a
+# keyword when the app has one.
+VerifierFactory = Callable[..., SignatureVerifier]
+
+
+class VerificationPool:
+    """Runs signature verification in an executor off the event loop."""
+
+    def __init__(self, executor: Executor = None, *,
+                 max_concurrency: int = None):
+        """Create a new instance of the VerificationPool class."""
+        self._max_concurrency = max_concurrency or os.cpu_count() or 1
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=self._max_concurrency,
+            thread_name_prefix='pysmartapp-verify')
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._queue_depth = 0
+        self._active = 0
+
+    async def verify(self, verifier: SignatureVerifier, headers,
+                     body: bytes = None) -> bool:
+        """Verify the signature in the headers using the executor."""
+        # Parsing is cheap, so it stays on the loop and only the public
+        # key operation is handed to the executor.
+        return await self.verify_message(
+            verifier, verifier.parse(headers, body))
+
+    async def verify_message(self, verifier: SignatureVerifier,
+                             signed: SignedMessage) -> bool:
+        """Verify the signature of a parsed message using the executor."""
+        self._queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queue_depth -= 1
+        self._active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if isinstance(self._executor, ProcessPoolExecutor):
+                return await loop.run_in_executor(
+                    self._executor, _verify_in_process, type(verifier),
+                    verifier.public_key, verifier.path, signed)
+            return await loop.run_in_executor(
+                self._executor, verifier.verify_message, signed)
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the executor."""
+        self._executor.shutdown(wait=wait)
+
+    @property
+    def executor(self) -> Executor:
+        """Get the executor verification runs in."""
+        return self._executor
+
+    @property
+    def max_concurrency(self) -> int:
+        """Get the maximum number of verifications run at once."""
+        return self._max_concurrency
+
+    @property
+    def active(self) -> int:
+        """Get the number of verifications running in the executor."""
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """Get the number of verifications waiting for a free slot."""
+        return self._queue_depth
+
+
+def create_verifier(public_key: str, path: str,
+                    **kwargs) -> SignatureVerifier:
+    """Create a verifier using the fastest engine installed."""
+    if serialization is None:
+        return HttpSigVerifier(public_key, path, **kwargs)
+    return CryptographyVerifier(public_key, path, **kwargs)
+
+
+def normalize_headers(headers) -> Dict[str, str]:
+    """Get a copy of the headers with lower-case names."""
+    if headers is None:
+        return {}
+    if hasattr(headers, 'items'):
+        headers = headers.items()
+    return {name.lower(): value for name, value in headers}
+
+
+def _strip_pem(public_key) -> bytes:
+    # Keys copied from the developer workspace often contain blank lines
+    # or trailing whitespace, which httpsig tolerates but cryptography
+    # does not.
+    if isinstance(public_key, bytes):
+        public_key = public_key.decode('ascii')
+    lines = (line.strip() for line in public_key.splitlines())
+    return '\n'.join(line for line in lines if line).encode('ascii')
+
+
+_PROCESS_VERIFIERS = {}
+
+
+def _verify_in_process(factory: VerifierFactory, public_key: str, path: str,
+                       signed: SignedMessage) -> bool:
+    # Verifiers can't be pickled with their imported key, so each worker
+    # process keeps its own cache of them. The pre-verification checks
+    # already ran on the loop, so the worker only needs the key.
+    key = (factory, public_key, path)
+    verifier = _PROCESS_VERIFIERS.get(key)
+    if verifier is None:
+        verifier = _PROCESS_VERIFIERS[key] = factory(public_key, path)
+    return verifier.verify_message(signed)
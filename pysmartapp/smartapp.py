@@ -1,15 +1,28 @@
 """Define a SmartApp."""
 
+import asyncio
+from collections import Counter
 import logging
-from typing import Any, Callable, Dict, List
+from operator import methodcaller
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Tuple, Type
 
+from .admission import AdmissionController
 from .const import (
     LIFECYCLE_CONFIG, LIFECYCLE_EVENT, LIFECYCLE_INSTALL,
     LIFECYCLE_OAUTH_CALLBACK, LIFECYCLE_PING, LIFECYCLE_UNINSTALL,
-    LIFECYCLE_UPDATE, SETTINGS_APP_ID)
-from .dispatch import Dispatcher
-from .errors import SmartAppNotRegisteredError
-from .utilities import create_request
+    LIFECYCLE_UPDATE, SETTINGS_APP_ID, SHED_DRAINING)
+from .dispatch import Dispatcher, DrainResult
+from .errors import SmartAppNotRegisteredError, SmartAppOverloadedError
+from .instrumentation import (
+    STAGE_ENCODE, STAGE_PARSE, STAGE_TOTAL, Instrumentation)
+from .replay import ReplayCache
+from .request import Request, Response
+from .serialization import loads
+from .signature import (
+    SignatureVerifier, VerificationPool, VerifierFactory, create_verifier)
+from .tokens import TokenStore
+from .utilities import REQUEST_TYPES, create_request
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -17,10 +30,153 @@ _LOGGER = logging.getLogger(__name__)
 class SmartAppBase:
     """Define common functionality for the SmartApp and SmartAppManager."""
 
-    def __init__(self, *, path: str = '/', dispatcher: Dispatcher = None):
+    def __init__(self, *, path: str = '/', dispatcher: Dispatcher = None,
+                 verifier_factory: VerifierFactory = None,
+                 verification_pool: VerificationPool = None,
+                 replay_cache: ReplayCache = None,
+                 drop_duplicates: bool = False,
+                 wait_for_handlers: bool = False,
+                 handler_timeout: float = None,
+                 instrumentation: Instrumentation = None,
+                 admission: AdmissionController = None,
+                 token_store: TokenStore = None):
         """Initialize a new instance of the smartapp."""
         self._dispatcher = dispatcher or Dispatcher()
         self._path = path
+        self._verifier_factory = verifier_factory or create_verifier
+        self._verification_pool = verification_pool
+        self._replay_cache = replay_cache
+        self._drop_duplicates = drop_duplicates
+        self._wait_for_handlers = wait_for_handlers
+        self._handler_timeout = handler_timeout
+        self._instrumentation = instrumentation
+        self._admission = admission
+        self._token_store = token_store
+        self._request_types = dict(REQUEST_TYPES)
+        self._draining = False
+        self._requests_in_flight = 0
+        self._idle = None
+
+    async def handle_request(self, data: dict, headers: dict = None,
+                             validate_signature: bool = True) -> dict:
+        """Process a lifecycle event."""
+        return await self._handle_request(
+            data, headers, validate_signature, encode=methodcaller('to_data'))
+
+    async def handle_request_bytes(self, body: bytes, headers: dict = None,
+                                   validate_signature: bool = True) -> bytes:
+        """Process a lifecycle event from the raw request body.
+
+        The body is decoded with orjson when it is installed and the
+        response is returned encoded. When validating, the digest header
+        is checked against the body as received.
+        """
+        started = perf_counter_ns() if self._instrumentation else None
+        return await self._handle_request(
+            loads(body), headers, validate_signature, body,
+            encode=methodcaller('to_bytes'), started=started)
+
+    async def _handle_request(self, data: dict, headers, validate_signature,
+                              body: bytes = None, *,
+                              encode: Callable[[Response], Any] = None,
+                              started: int = None):
+        if self._draining:
+            raise SmartAppOverloadedError('', SHED_DRAINING)
+        self._requests_in_flight += 1
+        try:
+            return await self._process_request(
+                data, headers, validate_signature, body, encode=encode,
+                started=started)
+        finally:
+            self._requests_in_flight -= 1
+            if not self._requests_in_flight and self._idle is not None:
+                self._idle.set()
+
+    async def _process_request(self, data: dict, headers, validate_signature,
+                               body: bytes, *,
+                               encode: Callable[[Response], Any],
+                               started: int):
+        instrumentation = self._instrumentation
+        if instrumentation is not None and started is None:
+            started = perf_counter_ns()
+        req = create_request(data, self._request_types)
+        if instrumentation is not None:
+            instrumentation.lap(req.lifecycle, STAGE_PARSE, started)
+        smartapp = self._get_smartapp(req)
+        admission = self._admission
+        if admission is None:
+            resp = await req.process(
+                smartapp, headers, validate_signature, body)
+        else:
+            app_id = getattr(smartapp, 'app_id', None) or ''
+            admission.admit(app_id, req.lifecycle)
+            try:
+                resp = await req.process(
+                    smartapp, headers, validate_signature, body)
+            finally:
+                admission.release(app_id)
+
+        if req.installed_app_id:
+            _LOGGER.debug("%s: %s received for installed app %s.",
+                          req.execution_id, req.lifecycle,
+                          req.installed_app_id)
+        else:
+            _LOGGER.debug("%s: %s received.",
+                          req.execution_id, req.lifecycle)
+        if encode is None:
+            return resp
+        if instrumentation is None:
+            return encode(resp)
+        encoding = perf_counter_ns()
+        encoded = encode(resp)
+        instrumentation.record(req.lifecycle, STAGE_TOTAL, instrumentation.lap(
+            req.lifecycle, STAGE_ENCODE, encoding) - started)
+        return encoded
+
+    def _get_smartapp(self, req: Request) -> 'SmartAppBase':
+        raise NotImplementedError
+
+    async def drain(self, timeout: float = None) -> DrainResult:
+        """Stop accepting requests and wait for the work in flight.
+
+        New requests are shed with SmartAppOverloadedError. The requests
+        being handled are waited on, then the targets they dispatched,
+        until the timeout when the targets still running are cancelled.
+        Pending writes of the token store are flushed last.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        # Targets may finish while the requests are waited on, so they're
+        # counted from here rather than from when the dispatcher drains.
+        finished = self._dispatcher.stats.finished
+        self._draining = True
+        if self._requests_in_flight:
+            self._idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._idle = None
+        if deadline is not None:
+            timeout = max(deadline - loop.time(), 0)
+        result = await self._dispatcher.drain(timeout)
+        if self._token_store is not None:
+            await self._token_store.flush()
+        return result._replace(
+            finished=self._dispatcher.stats.finished - finished)
+
+    def register_request_type(self, lifecycle: str,
+                              request_type: Type[Request]):
+        """Register the request type created for the lifecycle.
+
+        Replaces the built-in type when the lifecycle is already known.
+        Targets for new lifecycles are connected through the dispatcher
+        using the lifecycle as the signal.
+        """
+        if not lifecycle:
+            raise ValueError('request type must have a lifecycle.')
+        self._request_types[lifecycle] = request_type
 
     def connect_ping(self, target: Callable[..., Any]) \
             -> Callable[[], None]:
@@ -42,10 +198,29 @@ class SmartAppBase:
         """Connect a target to the update signal."""
         return self._dispatcher.connect(LIFECYCLE_UPDATE, target)
 
-    def connect_event(self, target: Callable[..., Any]) \
+    def connect_event(self, target: Callable[..., Any], *,
+                      subscription_name: str = None, device_id: str = None,
+                      capability: str = None, attribute: str = None,
+                      event_type: str = None, executor: str = None) \
             -> Callable[[], None]:
-        """Connect a target to the event signal."""
-        return self._dispatcher.connect(LIFECYCLE_EVENT, target)
+        """Connect a target to the event signal.
+
+        When any filter is given the target is only called for requests
+        with a matching event, and receives a copy of the request holding
+        just the events that match every filter. The executor names the
+        dispatcher pool a synchronous target runs in; targets run in the
+        'process' pool receive a picklable snapshot of the request only.
+        """
+        filters = {
+            'subscription_name': subscription_name,
+            'device_id': device_id,
+            'capability': capability,
+            'attribute': attribute,
+            'event_type': event_type
+        }
+        return self._dispatcher.connect(LIFECYCLE_EVENT, target, filters={
+            name: value for name, value in filters.items()
+            if value is not None}, pool=executor)
 
     def connect_oauth_callback(self, target: Callable[..., Any]) \
             -> Callable[[], None]:
@@ -67,36 +242,103 @@ class SmartAppBase:
         """Get the dispatcher used to connect and send notifications."""
         return self._dispatcher
 
+    @property
+    def request_types(self) -> Dict[str, Type[Request]]:
+        """Get the request types created for each lifecycle."""
+        return self._request_types
+
+    @property
+    def verifier_factory(self) -> VerifierFactory:
+        """Get the factory used to create signature verifiers."""
+        return self._verifier_factory
+
+    @property
+    def verification_pool(self) -> VerificationPool:
+        """Get the pool signatures are verified in, if any."""
+        return self._verification_pool
+
+    @property
+    def replay_cache(self) -> ReplayCache:
+        """Get the cache used to detect duplicate requests, if any."""
+        return self._replay_cache
+
+    @property
+    def drop_duplicates(self) -> bool:
+        """Get whether duplicate requests are not dispatched."""
+        return self._drop_duplicates
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        """Get the recorder of stage timings, if enabled."""
+        return self._instrumentation
+
+    @property
+    def draining(self) -> bool:
+        """Get whether requests are no longer accepted."""
+        return self._draining
+
+    @property
+    def requests_in_flight(self) -> int:
+        """Get the number of requests being handled."""
+        return self._requests_in_flight
+
+    @property
+    def token_store(self) -> TokenStore:
+        """Get the store the tokens of installed apps are kept in, if any."""
+        return self._token_store
+
+    @property
+    def admission(self) -> AdmissionController:
+        """Get the limits on requests and handlers in flight, if any."""
+        return self._admission
+
+    @property
+    def wait_for_handlers(self) -> bool:
+        """Get whether the response waits for the targets to finish."""
+        return self._wait_for_handlers
+
+    @property
+    def handler_timeout(self) -> float:
+        """Get the seconds a target is waited on before it's cancelled."""
+        return self._handler_timeout
+
 
 class SmartApp(SmartAppBase):
     """Define the SmartApp class."""
 
     def __init__(self, *, path: str = '/', public_key=None,
-                 dispatcher: Dispatcher = None):
+                 key_id: str = None, dispatcher: Dispatcher = None,
+                 verifier_factory: VerifierFactory = None,
+                 verification_pool: VerificationPool = None,
+                 replay_cache: ReplayCache = None,
+                 drop_duplicates: bool = False,
+                 wait_for_handlers: bool = False,
+                 handler_timeout: float = None,
+                 instrumentation: Instrumentation = None,
+                 admission: AdmissionController = None,
+                 token_store: TokenStore = None):
         """Initialize the SmartApp class."""
-        super().__init__(path=path, dispatcher=dispatcher)
+        super().__init__(path=path, dispatcher=dispatcher,
+                         verifier_factory=verifier_factory,
+                         verification_pool=verification_pool,
+                         replay_cache=replay_cache,
+                         drop_duplicates=drop_duplicates,
+                         wait_for_handlers=wait_for_handlers,
+                         handler_timeout=handler_timeout,
+                         instrumentation=instrumentation,
+                         admission=admission,
+                         token_store=token_store)
         self._app_id = None
         self._config_app_id = 'app'
         self._description = None
         self._name = None
         self._permissions = []
         self._public_key = public_key
+        self._key_id = key_id
+        self._verifier = None
 
-    async def handle_request(self, data: dict, headers: dict = None,
-                             validate_signature: bool = True) -> dict:
-        """Process a lifecycle event."""
-        req = create_request(data)
-        resp = await req.process(self, headers, validate_signature)
-
-        if req.installed_app_id:
-            _LOGGER.debug("%s: %s received for installed app %s.",
-                          req.execution_id, req.lifecycle,
-                          req.installed_app_id)
-        else:
-            _LOGGER.debug("%s: %s received.",
-                          req.execution_id, req.lifecycle)
-
-        return resp.to_data()
+    def _get_smartapp(self, req: Request) -> SmartAppBase:
+        return self
 
     @property
     def app_id(self):
@@ -148,42 +390,85 @@ class SmartApp(SmartAppBase):
         """Get the public key of the SmartApp used to verify events."""
         return self._public_key
 
+    @public_key.setter
+    def public_key(self, value: str):
+        """Set the public key of the SmartApp used to verify events."""
+        self._public_key = value
+        self._verifier = None
+
+    @property
+    def key_id(self) -> str:
+        """Get the key id requests must be signed with, if any."""
+        return self._key_id
+
+    @key_id.setter
+    def key_id(self, value: str):
+        """Set the key id requests must be signed with."""
+        self._key_id = value
+        self._verifier = None
+
+    @property
+    def verifier(self) -> SignatureVerifier:
+        """Get the verifier that caches the imported public key."""
+        if self._verifier is None:
+            # Factories that don't check key ids only get the key and path.
+            if self._key_id is None:
+                self._verifier = self._verifier_factory(
+                    self._public_key, self._path)
+            else:
+                self._verifier = self._verifier_factory(
+                    self._public_key, self._path, key_id=self._key_id)
+        return self._verifier
+
 
 class SmartAppManager(SmartAppBase):
     """Service to support multiple SmartApps at the same end-point."""
 
-    def __init__(self, path: str, *, dispatcher: Dispatcher = None):
+    def __init__(self, path: str, *, dispatcher: Dispatcher = None,
+                 verifier_factory: VerifierFactory = None,
+                 verification_pool: VerificationPool = None,
+                 replay_cache: ReplayCache = None,
+                 drop_duplicates: bool = False,
+                 wait_for_handlers: bool = False,
+                 handler_timeout: float = None,
+                 instrumentation: Instrumentation = None,
+                 admission: AdmissionController = None,
+                 token_store: TokenStore = None):
         """Create a new instance of the manager."""
-        super().__init__(path=path, dispatcher=dispatcher)
+        super().__init__(path=path, dispatcher=dispatcher,
+                         verifier_factory=verifier_factory,
+                         verification_pool=verification_pool,
+                         replay_cache=replay_cache,
+                         drop_duplicates=drop_duplicates,
+                         wait_for_handlers=wait_for_handlers,
+                         handler_timeout=handler_timeout,
+                         instrumentation=instrumentation,
+                         admission=admission,
+                         token_store=token_store)
         self._smartapps = {}
+        self._request_counts = Counter()
+        self._unregistered_counts = Counter()
 
-    async def handle_request(self, data: dict, headers: dict = None,
-                             validate_signature: bool = True) -> dict:
-        """Process a lifecycle event."""
-        req = create_request(data)
+    def _get_smartapp(self, req: Request) -> SmartAppBase:
         # Always process ping lifecycle events.
         if req.lifecycle == LIFECYCLE_PING:
-            resp = await req.process(self, headers, validate_signature)
-        else:
-            app_id = req.settings.get(SETTINGS_APP_ID)
-            if not app_id:
-                raise SmartAppNotRegisteredError(req.installed_app_id)
-            smartapp = self._smartapps.get(app_id)
-            if not smartapp:
-                raise SmartAppNotRegisteredError(req.installed_app_id)
-            resp = await req.process(smartapp, headers, validate_signature)
+            self._request_counts['', req.lifecycle] += 1
+            return self
+        app_id = req.settings.get(SETTINGS_APP_ID)
+        smartapp = self._smartapps.get(app_id) if app_id else None
+        if not smartapp:
+            self._unregistered_counts[app_id or '', req.lifecycle] += 1
+            raise SmartAppNotRegisteredError(req.installed_app_id)
+        self._request_counts[app_id, req.lifecycle] += 1
+        return smartapp
 
-        if req.installed_app_id:
-            _LOGGER.debug("%s: %s received for installed app %s.",
-                          req.execution_id, req.lifecycle,
-                          req.installed_app_id)
-        else:
-            _LOGGER.debug("%s: %s received.",
-                          req.execution_id, req.lifecycle)
-        return resp.to_data()
+    def register(self, app_id: str, public_key: str, *,
+                 key_id: str = None) -> SmartApp:
+        """Create a new SmartApp for the end-point.
 
-    def register(self, app_id: str, public_key: str) -> SmartApp:
-        """Create a new SmartApp for the end-point."""
+        When key_id is given, requests for the app signed with another key
+        id are rejected.
+        """
         if app_id is None:
             raise ValueError('smartapp must have an app_id.')
         if app_id in self._smartapps:
@@ -191,7 +476,17 @@ class SmartAppManager(SmartAppBase):
         smartapp = SmartApp(
             path=self._path,
             public_key=public_key,
-            dispatcher=self._dispatcher
+            key_id=key_id,
+            dispatcher=self._dispatcher,
+            verifier_factory=self._verifier_factory,
+            verification_pool=self._verification_pool,
+            replay_cache=self._replay_cache,
+            drop_duplicates=self._drop_duplicates,
+            wait_for_handlers=self._wait_for_handlers,
+            handler_timeout=self._handler_timeout,
+            instrumentation=self._instrumentation,
+            admission=self._admission,
+            token_store=self._token_store
         )
         smartapp.app_id = app_id
         self._smartapps[smartapp.app_id] = smartapp
@@ -209,3 +504,13 @@ class SmartAppManager(SmartAppBase):
     def smartapps(self) -> Dict[str, SmartApp]:
         """Get registered SmartApps."""
         return self._smartapps
+
+    @property
+    def request_counts(self) -> Dict[Tuple[str, str], int]:
+        """Get the number of requests handled by app id and lifecycle."""
+        return self._request_counts
+
+    @property
+    def unregistered_counts(self) -> Dict[Tuple[str, str], int]:
+        """Get the number of requests for unregistered apps."""
+        return self._unregistered_counts
@@ -0,0 +1,103 @@
+"""Define the subscription module."""
+
+from itertools import count
+from typing import Any, Callable, Dict, List, Tuple
+
+from .event import EventRequest
+
+EVENT_FILTERS = {
+    'event_type': 'eventType',
+    'subscription_name': 'subscriptionName',
+    'device_id': 'deviceId',
+    'capability': 'capability',
+    'attribute': 'attribute'
+}
+
+_NO_DATA = {}
+
+
+class EventSubscription:
+    """Define a target connected to the events matching its filters."""
+
+    __slots__ = ('target', 'filters', 'order')
+
+    def __init__(self, target: Callable[..., Any], filters: Dict[str, Any],
+                 order: int):
+        """Create a new instance of the EventSubscription class."""
+        self.target = target
+        self.filters = filters
+        self.order = order
+
+
+class EventSubscriptions:
+    """Indexes event targets by the field values their filters require.
+
+    Each filter is a (field, value) key in a hash index, so matching a
+    request costs one lookup per indexed field for each event, no matter
+    how many targets are connected.
+    """
+
+    def __init__(self):
+        """Create a new instance of the EventSubscriptions class."""
+        self._index = {}
+        self._fields = {}
+        self._order = count()
+        self._size = 0
+
+    def add(self, target: Callable[..., Any],
+            filters: Dict[str, Any]) -> EventSubscription:
+        """Add a target for the events matching all of the filters."""
+        if not filters:
+            raise ValueError('filters must contain at least one field.')
+        for field in filters:
+            if field not in EVENT_FILTERS:
+                raise ValueError(F'"{field}" is not an event filter.')
+        subscription = EventSubscription(
+            target, dict(filters), next(self._order))
+        for field, value in filters.items():
+            self._index.setdefault((field, value), {})[subscription] = None
+            self._fields[field] = self._fields.get(field, 0) + 1
+        self._size += 1
+        return subscription
+
+    def remove(self, subscription: EventSubscription):
+        """Remove the subscription, if it hasn't been already."""
+        for field, value in subscription.filters.items():
+            subscriptions = self._index.get((field, value))
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            del subscriptions[subscription]
+            if not subscriptions:
+                del self._index[(field, value)]
+            self._fields[field] -= 1
+            if not self._fields[field]:
+                del self._fields[field]
+        self._size -= 1
+
+    def match(self, req: EventRequest) \
+            -> List[Tuple[Callable[..., Any], EventRequest]]:
+        """Get each matched target with a request of its matching events."""
+        index = self._index
+        fields = [(field, EVENT_FILTERS[field]) for field in self._fields]
+        matches = {}
+        for position, raw in enumerate(req.events.raw_data):
+            device_event = raw.get('deviceEvent') or _NO_DATA
+            hits = {}
+            for field, key in fields:
+                value = raw[key] if field == 'event_type' \
+                    else device_event.get(key)
+                for subscription in index.get((field, value), ()):
+                    hits[subscription] = hits.get(subscription, 0) + 1
+            for subscription, found in hits.items():
+                if found == len(subscription.filters):
+                    matches.setdefault(subscription, []).append(position)
+        events = req.events
+        return [
+            (subscription.target,
+             req.with_events([events[position] for position in positions]))
+            for subscription, positions in sorted(
+                matches.items(), key=lambda item: item[0].order)]
+
+    def __len__(self) -> int:
+        """Get the number of subscriptions."""
+        return self._size
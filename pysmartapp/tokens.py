@@ -0,0 +1,300 @@
+"""Define the tokens module."""
+
+import asyncio
+from collections import Counter, OrderedDict
+from concurrent.futures import Executor
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Set
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_DELAY = 1.0
+
+
+class InstalledAppTokens(NamedTuple):
+    """Define the tokens of an installed app."""
+
+    installed_app_id: str
+    location_id: str
+    auth_token: str
+    refresh_token: Optional[str]
+    updated: float
+
+
+class TokenBackend:
+    """Define the persistent storage behind a TokenStore.
+
+    Methods are called in an executor, one batch at a time, so they may
+    block.
+    """
+
+    def load(self, installed_app_id: str) -> Optional[InstalledAppTokens]:
+        """Load the tokens of the installed app, if stored."""
+        raise NotImplementedError
+
+    def save_many(self, tokens: Sequence[InstalledAppTokens]):
+        """Save the tokens, keeping the stored refresh token when None."""
+        raise NotImplementedError
+
+    def delete_many(self, installed_app_ids: Sequence[str]):
+        """Delete the tokens of the installed apps."""
+        raise NotImplementedError
+
+
+class SQLiteTokenBackend(TokenBackend):
+    """Stores tokens in a SQLite database."""
+
+    def __init__(self, path: str = ':memory:'):
+        """Create a new instance of the SQLiteTokenBackend class."""
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS installed_app_tokens ('
+                'installed_app_id TEXT PRIMARY KEY, location_id TEXT, '
+                'auth_token TEXT, refresh_token TEXT, updated REAL)')
+
+    def load(self, installed_app_id: str) -> Optional[InstalledAppTokens]:
+        """Load the tokens of the installed app, if stored."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT installed_app_id, location_id, auth_token, '
+                'refresh_token, updated FROM installed_app_tokens '
+                'WHERE installed_app_id = ?', (installed_app_id,)).fetchone()
+        return InstalledAppTokens(*row) if row else None
+
+    def save_many(self, tokens: Sequence[InstalledAppTokens]):
+        """Save the tokens in one transaction."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO installed_app_tokens VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(installed_app_id) DO UPDATE SET '
+                'location_id = excluded.location_id, '
+                'auth_token = excluded.auth_token, '
+                'refresh_token = COALESCE(excluded.refresh_token, '
+                'refresh_token), updated = excluded.updated', tokens)
+
+    def delete_many(self, installed_app_ids: Sequence[str]):
+        """Delete the tokens of the installed apps in one transaction."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM installed_app_tokens WHERE installed_app_id = ?',
+                ((installed_app_id,) for installed_app_id
+                 in installed_app_ids))
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class TokenStore:
+    """Keeps the tokens of installed apps in an LRU cache over a backend.
+
+    Tokens received in lifecycle requests are cached at once. Requests that
+    carry the tokens already cached, like most of an EVENT storm, don't
+    write anything. Changes are written to the backend in one batch
+    flush_delay seconds after the first one, so an app whose tokens change
+    several times in that window is written once. Without a backend only
+    the max_size most recently used apps are kept.
+    """
+
+    def __init__(self, backend: TokenBackend = None, *, max_size: int = 1024,
+                 flush_delay: float = DEFAULT_FLUSH_DELAY,
+                 executor: Executor = None):
+        """Create a new instance of the TokenStore class."""
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+        self._backend = backend
+        self._max_size = max_size
+        self._flush_delay = flush_delay
+        self._executor = executor
+        self._cache: Dict[str, InstalledAppTokens] = OrderedDict()
+        self._dirty: Dict[str, InstalledAppTokens] = {}
+        self._deleted: Set[str] = set()
+        # Ids in delete batches still being written, which may overlap.
+        self._deleting = Counter()
+        self._flush_handle = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+        self._writes = 0
+
+    def update(self, installed_app_id: str, location_id: str,
+               auth_token: str, refresh_token: str = None):
+        """Store the tokens received for the installed app."""
+        cached = self._cache.get(installed_app_id)
+        if cached is not None:
+            self._cache.move_to_end(installed_app_id)
+            if cached.auth_token == auth_token and refresh_token in (
+                    None, cached.refresh_token):
+                return
+            if refresh_token is None:
+                refresh_token = cached.refresh_token
+        tokens = InstalledAppTokens(
+            installed_app_id, location_id, auth_token, refresh_token,
+            time.time())
+        self._cache[installed_app_id] = tokens
+        self._evict()
+        if self._backend is not None:
+            self._deleted.discard(installed_app_id)
+            self._dirty[installed_app_id] = tokens
+            self._schedule_flush()
+
+    def remove(self, installed_app_id: str):
+        """Forget the tokens of the installed app."""
+        self._cache.pop(installed_app_id, None)
+        if self._backend is not None:
+            self._dirty.pop(installed_app_id, None)
+            self._deleted.add(installed_app_id)
+            self._schedule_flush()
+
+    async def get(self, installed_app_id: str) \
+            -> Optional[InstalledAppTokens]:
+        """Get the tokens of the installed app, loading them if needed.
+
+        Tokens first seen in an EVENT have no refresh token, so it's
+        loaded from the backend when it's asked for.
+        """
+        tokens = self._cache.get(installed_app_id) \
+            or self._dirty.get(installed_app_id)
+        if self._backend is None or tokens is not None \
+                and tokens.refresh_token is not None:
+            if tokens is not None:
+                self._cache_tokens(tokens)
+            return tokens
+        if installed_app_id in self._deleted:
+            return None
+        # A row that's being deleted must not be cached again.
+        loaded = None
+        if not self._deleting[installed_app_id]:
+            loaded = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._backend.load, installed_app_id)
+        # The tokens may have changed while they were being loaded.
+        if installed_app_id in self._deleted:
+            return None
+        if self._deleting[installed_app_id]:
+            loaded = None
+        tokens = self._cache.get(installed_app_id) \
+            or self._dirty.get(installed_app_id)
+        if tokens is None:
+            tokens = loaded
+        elif tokens.refresh_token is None and loaded is not None:
+            tokens = tokens._replace(refresh_token=loaded.refresh_token)
+        if tokens is not None:
+            self._cache_tokens(tokens)
+        return tokens
+
+    def _cache_tokens(self, tokens: InstalledAppTokens):
+        self._cache[tokens.installed_app_id] = tokens
+        self._cache.move_to_end(tokens.installed_app_id)
+        self._evict()
+
+    async def flush(self):
+        """Write the pending changes to the backend.
+
+        A scheduled flush already running is waited for, so everything
+        changed before the call is written when it returns.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        running = self._flush_tasks - {asyncio.current_task()}
+        if running:
+            await asyncio.wait(running)
+        if not self._dirty and not self._deleted:
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        self._deleting.update(deleted)
+        try:
+            await self._flush(dirty, deleted)
+        finally:
+            self._deleting.subtract(deleted)
+            for installed_app_id in deleted:
+                if not self._deleting[installed_app_id]:
+                    del self._deleting[installed_app_id]
+
+    async def _flush(self, dirty: Dict[str, InstalledAppTokens],
+                     deleted: Set[str]):
+        # Flushes are written one after another so a later batch can't be
+        # overwritten by an earlier one still running in the executor.
+        async with self._flush_lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._write, list(dirty.values()),
+                    list(deleted))
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception(
+                    "Unable to write the tokens of %d installed apps.",
+                    len(dirty) + len(deleted))
+                self._requeue(dirty, deleted)
+                return
+        self._writes += 1
+
+    def _write(self, tokens: Sequence[InstalledAppTokens],
+               deleted: Sequence[str]):
+        if tokens:
+            self._backend.save_many(tokens)
+        if deleted:
+            self._backend.delete_many(deleted)
+
+    def _requeue(self, dirty: Dict[str, InstalledAppTokens],
+                 deleted: Iterable[str]):
+        # Changes made since the batch was taken are newer, so they win.
+        for installed_app_id, tokens in dirty.items():
+            if installed_app_id not in self._deleted:
+                self._dirty.setdefault(installed_app_id, tokens)
+        for installed_app_id in deleted:
+            if installed_app_id not in self._dirty:
+                self._deleted.add(installed_app_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self._flush_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        # The loop only keeps a weak reference to tasks, so each one is
+        # kept until it's done or it could be collected mid-write.
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _evict(self):
+        cache = self._cache
+        while len(cache) > self._max_size:
+            cache.popitem(last=False)
+
+    def __len__(self) -> int:
+        """Get the number of installed apps cached."""
+        return len(self._cache)
+
+    @property
+    def backend(self) -> TokenBackend:
+        """Get the backend tokens are written to, if any."""
+        return self._backend
+
+    @property
+    def max_size(self) -> int:
+        """Get the maximum number of installed apps cached."""
+        return self._max_size
+
+    @property
+    def flush_delay(self) -> float:
+        """Get the seconds changes wait before they're written."""
+        return self._flush_delay
+
+    @property
+    def pending(self) -> int:
+        """Get the number of installed apps with changes to write."""
+        return len(self._dirty) + len(self._deleted)
+
+    @property
+    def writes(self) -> int:
+        """Get the number of batches written to the backend."""
+        return self._writes
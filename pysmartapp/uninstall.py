@@ -6,6 +6,8 @@ from .request import EmptyDataResponse, Request, Response
 class UninstallRequest(Request):
     """Define the UninstallRequest class."""
 
+    __slots__ = ('_uninstall_data_raw',)
+
     def __init__(self, data: dict):
         """Create a new instance of the UninstallRequest."""
         super().__init__(data)
@@ -16,6 +18,9 @@ class UninstallRequest(Request):
         resp = EmptyDataResponse('uninstallData')
         return resp
 
+    def _update_tokens(self, token_store):
+        token_store.remove(self._installed_app_id)
+
     @property
     def uninstall_data_raw(self) -> dict:
         """Get the raw update data."""
@@ -1,5 +1,7 @@
 """Define the utilities class."""
 
+from typing import Dict, Type
+
 from .config import ConfigRequest
 from .const import (
     LIFECYCLE_CONFIG, LIFECYCLE_EVENT, LIFECYCLE_INSTALL,
@@ -9,25 +11,27 @@ from .event import EventRequest
 from .install import InstallRequest
 from .oauthcallback import OAuthCallbackRequest
 from .ping import PingRequest
+from .request import Request
 from .uninstall import UninstallRequest
 from .update import UpdateRequest
 
+REQUEST_TYPES: Dict[str, Type[Request]] = {
+    LIFECYCLE_PING: PingRequest,
+    LIFECYCLE_CONFIG: ConfigRequest,
+    LIFECYCLE_INSTALL: InstallRequest,
+    LIFECYCLE_UPDATE: UpdateRequest,
+    LIFECYCLE_EVENT: EventRequest,
+    LIFECYCLE_OAUTH_CALLBACK: OAuthCallbackRequest,
+    LIFECYCLE_UNINSTALL: UninstallRequest
+}
+
 
-def create_request(data: dict):
+def create_request(data: dict,
+                   request_types: Dict[str, Type[Request]] = None) -> Request:
     """Create a request from the given dictionary and headers."""
-    lifecycle = data['lifecycle']
-    if lifecycle == LIFECYCLE_PING:
-        return PingRequest(data)
-    if lifecycle == LIFECYCLE_CONFIG:
-        return ConfigRequest(data)
-    if lifecycle == LIFECYCLE_INSTALL:
-        return InstallRequest(data)
-    if lifecycle == LIFECYCLE_UPDATE:
-        return UpdateRequest(data)
-    if lifecycle == LIFECYCLE_EVENT:
-        return EventRequest(data)
-    if lifecycle == LIFECYCLE_OAUTH_CALLBACK:
-        return OAuthCallbackRequest(data)
-    if lifecycle == LIFECYCLE_UNINSTALL:
-        return UninstallRequest(data)
-    raise ValueError('The specified lifecycle event was not recognized.')
+    if request_types is None:
+        request_types = REQUEST_TYPES
+    request_type = request_types.get(data['lifecycle'])
+    if request_type is None:
+        raise ValueError('The specified lifecycle event was not recognized.')
+    return request_type(data)
@@ -21,8 +21,13 @@ setup(name=consts['__title__'],
       author='Andrew Sayre',
       author_email='andrew@sayre.net',
       license='MIT',
-      packages=find_packages(exclude=('tests*',)),
+      packages=find_packages(exclude=('tests*', 'benchmarks*')),
       install_requires=['httpsig>=1.3.0,<2.0.0'],
+      extras_require={
+          'cryptography': ['cryptography>=3.1'],
+          'numpy': ['numpy>=1.17'],
+          'orjson': ['orjson>=3.0.0']
+      },
       tests_require=[],
       platforms=['any'],
       keywords=["smartthings", "smartapp"],
@@ -1,5 +1,7 @@
 """Define common test configuraiton."""
 
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 import pytest
 
 from pysmartapp.dispatch import Dispatcher
@@ -44,3 +46,17 @@ def async_handler():
         target.kwargs = kwargs
     target.fired = False
     return target
+
+
+@pytest.fixture(scope='session', name='private_key')
+def private_key_fixture():
+    """Fixture private key used to sign test requests."""
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(scope='session')
+def public_key(private_key) -> str:
+    """Fixture public key matching the private key fixture."""
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
@@ -0,0 +1,204 @@
+"""Tests for the admission module."""
+
+import asyncio
+
+import pytest
+
+from pysmartapp.admission import AdmissionController
+from pysmartapp.const import (
+    LIFECYCLE_CONFIG, LIFECYCLE_EVENT, LIFECYCLE_PING, SHED_APP_HANDLERS,
+    SHED_APP_REQUESTS, SHED_HANDLERS, SHED_REQUESTS)
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.errors import SmartAppOverloadedError
+from pysmartapp.smartapp import SmartAppManager
+
+from .utilities import get_fixture
+
+APP_ID = 'f6c071aa-6ae7-463f-b0ad-8620ac23140f'
+
+
+class TestAdmissionController:
+    """Tests for the AdmissionController class."""
+
+    @staticmethod
+    def test_init():
+        """Tests the limits and counts are initialized."""
+        # Act
+        admission = AdmissionController(
+            max_requests=1, max_app_requests=2, max_handlers=3,
+            max_app_handlers=4)
+        # Assert
+        assert admission.max_requests == 1
+        assert admission.max_app_requests == 2
+        assert admission.max_handlers == 3
+        assert admission.max_app_handlers == 4
+        assert admission.requests == 0
+        assert admission.handlers == 0
+        assert not admission.app_requests
+        assert not admission.app_handlers
+        assert not admission.shed
+
+    @staticmethod
+    def test_unlimited():
+        """Tests every request is admitted without limits."""
+        # Arrange
+        admission = AdmissionController()
+        # Act
+        for _ in range(100):
+            admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Assert
+        assert admission.requests == 100
+        assert admission.app_requests == {APP_ID: 100}
+
+    @staticmethod
+    def test_release():
+        """Tests released requests are no longer counted."""
+        # Arrange
+        admission = AdmissionController(max_requests=1)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Act
+        admission.release(APP_ID)
+        admission.admit('other', LIFECYCLE_EVENT)
+        # Assert
+        assert admission.requests == 1
+        assert admission.app_requests == {'other': 1}
+
+    @staticmethod
+    def test_app_requests_shed():
+        """Tests requests beyond the limit of an app are shed."""
+        # Arrange
+        admission = AdmissionController(max_app_requests=1)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Act
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            admission.admit(APP_ID, LIFECYCLE_EVENT)
+        admission.admit('other', LIFECYCLE_EVENT)
+        # Assert
+        assert ex.value.app_id == APP_ID
+        assert ex.value.reason == SHED_APP_REQUESTS
+        assert ex.value.is_app_limit
+        assert str(ex.value) == F"Request for app '{APP_ID}' was shed: " \
+            "too many app requests in flight."
+        assert admission.shed == {(APP_ID, SHED_APP_REQUESTS): 1}
+        assert admission.requests == 2
+
+    @staticmethod
+    def test_requests_shed():
+        """Tests requests beyond the global limit are shed."""
+        # Arrange
+        admission = AdmissionController(max_requests=1)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Act
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            admission.admit('other', LIFECYCLE_EVENT)
+        # Assert
+        assert ex.value.reason == SHED_REQUESTS
+        assert not ex.value.is_app_limit
+        assert admission.shed == {('other', SHED_REQUESTS): 1}
+
+    @staticmethod
+    @pytest.mark.parametrize('lifecycle', [LIFECYCLE_PING, LIFECYCLE_CONFIG])
+    def test_priority_admitted(lifecycle):
+        """Tests PING and CONFIGURATION are admitted beyond the limits."""
+        # Arrange
+        admission = AdmissionController(max_requests=1, max_app_requests=1)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Act
+        admission.admit(APP_ID, lifecycle)
+        # Assert
+        assert admission.requests == 2
+        assert not admission.shed
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handlers_shed():
+        """Tests requests are shed while handlers are over the limits."""
+        # Arrange
+        loop = asyncio.get_running_loop()
+        admission = AdmissionController(max_handlers=3, max_app_handlers=2)
+        done = loop.create_future()
+        done.set_result(None)
+        app_future = loop.create_future()
+        other_future = loop.create_future()
+        # Act
+        admission.track(APP_ID, [done, app_future, loop.create_future()])
+        with pytest.raises(SmartAppOverloadedError) as app_ex:
+            admission.admit(APP_ID, LIFECYCLE_EVENT)
+        admission.track('other', [other_future])
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            admission.admit('other', LIFECYCLE_EVENT)
+        app_future.set_result(None)
+        other_future.cancel()
+        await asyncio.sleep(0)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        # Assert
+        assert app_ex.value.reason == SHED_APP_HANDLERS
+        assert ex.value.reason == SHED_HANDLERS
+        assert admission.handlers == 1
+        assert admission.app_handlers == {APP_ID: 1}
+
+
+class TestSmartAppAdmission:
+    """Tests for admission control of the SmartAppManager."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_requests_shed(event_loop):
+        """Tests requests are shed while too many are in flight."""
+        # Arrange
+        admission = AdmissionController(max_app_requests=1)
+        manager = SmartAppManager(
+            '/path', dispatcher=Dispatcher(loop=event_loop),
+            wait_for_handlers=True, admission=admission)
+        smartapp = manager.register(APP_ID, None)
+        release = asyncio.Event()
+
+        async def process(*args):
+            await release.wait()
+
+        smartapp.connect_event(process)
+        request = get_fixture('event_request')
+        first = event_loop.create_task(
+            manager.handle_request(request, None, False))
+        await asyncio.sleep(0)
+        # Act
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            await manager.handle_request(request, None, False)
+        await manager.handle_request(get_fixture('ping_request'))
+        release.set()
+        await first
+        # Assert
+        assert smartapp.admission is admission
+        assert ex.value.reason == SHED_APP_REQUESTS
+        assert admission.requests == 0
+        assert admission.shed == {(APP_ID, SHED_APP_REQUESTS): 1}
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handlers_shed(event_loop):
+        """Tests requests are shed while too many handlers are in flight."""
+        # Arrange
+        admission = AdmissionController(max_app_handlers=1)
+        manager = SmartAppManager(
+            '/path', dispatcher=Dispatcher(loop=event_loop),
+            admission=admission)
+        smartapp = manager.register(APP_ID, None)
+        release = asyncio.Event()
+
+        async def process(*args):
+            await release.wait()
+
+        smartapp.connect_event(process)
+        request = get_fixture('event_request')
+        # Act
+        await manager.handle_request(request, None, False)
+        handlers = dict(admission.app_handlers)
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            await manager.handle_request(request, None, False)
+        release.set()
+        await asyncio.gather(*manager.dispatcher.in_flight)
+        await manager.handle_request(request, None, False)
+        # Assert
+        assert handlers == {APP_ID: 1}
+        assert ex.value.reason == SHED_APP_HANDLERS
+        assert admission.shed == {(APP_ID, SHED_APP_HANDLERS): 1}
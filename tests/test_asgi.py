@@ -0,0 +1,280 @@
+"""Tests for the asgi module."""
+
+import json
+
+import pytest
+
+from pysmartapp.asgi import ASGIApp
+from pysmartapp.const import REJECTED_MALFORMED_SIGNATURE
+
+from .utilities import get_fixture, sign_request
+
+PING_BODY = json.dumps(get_fixture('ping_request')).encode()
+INSTALL_BODY = json.dumps(get_fixture('install_request')).encode()
+
+
+def http_scope(headers: dict = None, path: str = '/',
+               method: str = 'POST') -> dict:
+    """Create the scope of an HTTP request."""
+    return {
+        'type': 'http',
+        'path': path,
+        'method': method,
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in (headers or {}).items()]
+    }
+
+
+def body_messages(*chunks: bytes) -> list:
+    """Create the messages that receive the body in chunks."""
+    return [{'type': 'http.request', 'body': chunk,
+             'more_body': index < len(chunks) - 1}
+            for index, chunk in enumerate(chunks)]
+
+
+class Connection:
+    """Records the messages an ASGI application receives and sends."""
+
+    def __init__(self, messages: list):
+        """Create a new instance of the Connection class."""
+        self.messages = list(messages)
+        self.received = 0
+        self.sent = []
+
+    async def receive(self) -> dict:
+        """Receive the next message."""
+        self.received += 1
+        return self.messages.pop(0)
+
+    async def send(self, message: dict):
+        """Record the sent message."""
+        self.sent.append(message)
+
+    @property
+    def status(self) -> int:
+        """Get the status of the response."""
+        return self.sent[0]['status']
+
+    @property
+    def body(self) -> bytes:
+        """Get the body of the response."""
+        return self.sent[1]['body']
+
+
+async def call(app: ASGIApp, scope: dict, messages: list) -> Connection:
+    """Call the application with the scope and messages."""
+    connection = Connection(messages)
+    await app(scope, connection.receive, connection.send)
+    return connection
+
+
+class TestASGIApp:
+    """Tests for the ASGIApp class."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_ping(smartapp):
+        """Tests a lifecycle request is answered with its response."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        # Act
+        connection = await call(app, http_scope(
+            {'Content-Length': str(len(PING_BODY))}), body_messages(PING_BODY))
+        # Assert
+        assert connection.status == 200
+        assert (b'content-type', b'application/json') in \
+            connection.sent[0]['headers']
+        assert json.loads(connection.body) == get_fixture('ping_response')
+        assert app.app == smartapp
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_streamed_body(smartapp):
+        """Tests a body received in chunks is handled once complete."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        chunks = [PING_BODY[index:index + 20]
+                  for index in range(0, len(PING_BODY), 20)]
+        # Act
+        connection = await call(app, http_scope(), body_messages(*chunks))
+        # Assert
+        assert connection.status == 200
+        assert connection.received == len(chunks)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_signed(smartapp, private_key, public_key):
+        """Tests a signed request is verified and handled."""
+        # Arrange
+        smartapp.public_key = public_key
+        app = ASGIApp(smartapp)
+        headers = sign_request(private_key, INSTALL_BODY)
+        # Act
+        connection = await call(app, http_scope(headers), body_messages(
+            INSTALL_BODY[:100], INSTALL_BODY[100:]))
+        # Assert
+        assert connection.status == 200
+        assert json.loads(connection.body) == {'installData': {}}
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_malformed_signature_rejected_first(smartapp):
+        """Tests a malformed signature is rejected before reading the body."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        headers = {'Authorization': 'Bearer token'}
+        # Act
+        connection = await call(app, http_scope(headers), [])
+        # Assert
+        assert connection.status == 401
+        assert connection.received == 0
+        assert app.rejected == 1
+        assert smartapp.verifier.rejections[REJECTED_MALFORMED_SIGNATURE] \
+            == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_non_ascii_signed_header(smartapp, private_key):
+        """Tests a signed header that isn't ASCII is rejected."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        headers = sign_request(private_key, INSTALL_BODY)
+        scope = http_scope(headers)
+        scope['headers'] = [
+            (name, 'caf\xe9'.encode('latin-1') if name == b'date' else value)
+            for name, value in scope['headers']]
+        # Act
+        connection = await call(app, scope, [])
+        # Assert
+        assert connection.status == 401
+        assert connection.received == 0
+        assert smartapp.verifier.rejections[REJECTED_MALFORMED_SIGNATURE] \
+            == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_manager_header_verifier(manager):
+        """Tests a manager checks signature headers without a public key."""
+        # Arrange
+        app = ASGIApp(manager)
+        headers = {'Authorization': 'Bearer token'}
+        # Act
+        connection = await call(
+            app, http_scope(headers, path='/path/to/app'), [])
+        # Assert
+        assert connection.status == 401
+        verifier = app.header_verifier
+        assert verifier.public_key is None
+        assert app.header_verifier is verifier
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unsigned_declared_too_large(smartapp):
+        """Tests an unsigned body larger than a PING is never read."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        headers = {'Content-Length': str(5 * 1024 * 1024)}
+        # Act
+        connection = await call(app, http_scope(headers), [])
+        # Assert
+        assert connection.status == 413
+        assert connection.received == 0
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unsigned_streamed_too_large(smartapp):
+        """Tests reading an unsigned body stops once beyond the limit."""
+        # Arrange
+        app = ASGIApp(smartapp, max_unsigned_body_size=100)
+        chunks = [b'x' * 60] * 10
+        # Act
+        connection = await call(app, http_scope(), body_messages(*chunks))
+        # Assert
+        assert connection.status == 413
+        assert connection.received == 2
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unsigned_not_validated(smartapp):
+        """Tests the unsigned limit doesn't apply without validation."""
+        # Arrange
+        app = ASGIApp(smartapp, validate_signature=False,
+                      max_unsigned_body_size=10)
+        body = json.dumps(get_fixture('event_request')).encode()
+        # Act
+        connection = await call(app, http_scope(), body_messages(body))
+        # Assert
+        assert connection.status == 200
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unsigned_rejected(smartapp):
+        """Tests an unsigned lifecycle other than PING is rejected."""
+        # Arrange
+        app = ASGIApp(smartapp, max_unsigned_body_size=len(INSTALL_BODY))
+        # Act
+        connection = await call(
+            app, http_scope(), body_messages(INSTALL_BODY))
+        # Assert
+        assert connection.status == 401
+        assert connection.body == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('scope,expected', [
+        (http_scope(path='/other'), 404),
+        (http_scope(method='GET'), 405),
+        (http_scope({'Content-Length': 'x'}), 400),
+        ({**http_scope(), 'headers': [(b'content-length', b'\xb2')]}, 400),
+        ({**http_scope(), 'headers': [
+            (b'content-length', b'10'), (b'content-length', b'20')]}, 400)])
+    async def test_rejected(smartapp, scope, expected):
+        """Tests requests that can't be handled are rejected unread."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        # Act
+        connection = await call(app, scope, [])
+        # Assert
+        assert connection.status == expected
+        assert connection.received == 0
+        assert connection.sent[0]['headers'] == [(b'content-length', b'0')]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_disconnect(smartapp):
+        """Tests nothing is sent when the client disconnects."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        messages = body_messages(b'{', b'}')
+        messages[1] = {'type': 'http.disconnect'}
+        # Act
+        first = await call(app, http_scope(), [{'type': 'http.disconnect'}])
+        second = await call(app, http_scope(), messages)
+        # Assert
+        assert not first.sent
+        assert not second.sent
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_lifespan(smartapp):
+        """Tests lifespan startup and shutdown, after draining, are acked."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        # Act
+        connection = await call(app, {'type': 'lifespan'}, messages)
+        # Assert
+        assert connection.sent == [{'type': 'lifespan.startup.complete'},
+                                   {'type': 'lifespan.shutdown.complete'}]
+        assert smartapp.draining
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_websocket(smartapp):
+        """Tests other connection types are not served."""
+        # Arrange
+        app = ASGIApp(smartapp)
+        # Act/Assert
+        with pytest.raises(ValueError):
+            await call(app, {'type': 'websocket'}, [])
@@ -1,11 +1,28 @@
 """Define tests for the Dispatch module."""
 
 import asyncio
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 import functools
+import threading
+import time
 
 import pytest
 
-from pysmartapp.dispatch import Dispatcher
+from pysmartapp.dispatch import (
+    Connection, Dispatcher, TargetPool, is_coroutine_target)
+from pysmartapp.event import EventRequest
+
+from .utilities import get_fixture
+
+
+class InlineExecutor(Executor):
+    """Runs each function as soon as it's submitted."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Run the function and get a future of its result."""
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
 
 
 class TestDispatcher:
@@ -64,6 +81,48 @@ class TestDispatcher:
         # Assert
         assert handler not in dispatcher.signals['TEST']
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_disconnect_reclaims(handler):
+        """Tests disconnected targets are not retained by the dispatcher."""
+        # Arrange
+        dispatcher = Dispatcher()
+        connections = [dispatcher.connect('TEST', handler)
+                       for _ in range(3)]
+        # Act
+        connections[1].disconnect()
+        # Assert
+        assert isinstance(connections[1], Connection)
+        assert not connections[1].connected
+        assert connections[0].connected
+        assert len(dispatcher.signals['TEST']) == 2
+        for connection in connections:
+            connection()
+        assert not dispatcher.signals
+        assert not dispatcher._disconnects  # pylint: disable=protected-access
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_disconnect_while_sending(handler):
+        """Tests targets disconnected during a send are still called once."""
+        # Arrange
+        dispatcher = Dispatcher(executor=InlineExecutor())
+        connections = []
+
+        def target():
+            for connection in connections:
+                connection()
+        dispatcher.connect('TEST', target)
+        connections.append(dispatcher.connect('TEST', handler))
+        # Act
+        sent = dispatcher.send('TEST')
+        # Assert
+        assert len(sent) == 2
+        assert handler.fired
+        assert dispatcher.signals['TEST'] == [target]
+        assert len(dispatcher.send('TEST')) == 1
+        assert not dispatcher.send('UNKNOWN')
+
     @staticmethod
     @pytest.mark.asyncio
     async def test_send_async_handler(async_handler):
@@ -103,6 +162,41 @@ class TestDispatcher:
         assert handler.fired
         assert handler.args[0] == args
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_send_filtered(handler, async_handler):
+        """Tests filtered targets receive only their matching events."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.connect('EVENT', handler, filters={'capability': 'lock'})
+        dispatcher.connect('EVENT', async_handler,
+                           filters={'capability': 'switch'})
+        req = EventRequest(get_fixture('event_request'))
+        # Act
+        await asyncio.gather(*dispatcher.send('EVENT', req, None))
+        # Assert
+        assert handler.fired
+        assert [evt.capability for evt in handler.args[0].events] == [
+            'lock']
+        assert handler.args[1] is None
+        assert not async_handler.fired
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_disconnect_filtered(handler):
+        """Tests disconnecting a filtered target."""
+        # Arrange
+        dispatcher = Dispatcher()
+        disconnect = dispatcher.connect(
+            'EVENT', handler, filters={'capability': 'lock'})
+        req = EventRequest(get_fixture('event_request'))
+        # Act
+        disconnect()
+        sent = dispatcher.send('EVENT', req)
+        # Assert
+        assert not sent
+        assert not handler.fired
+
     @staticmethod
     @pytest.mark.asyncio
     async def test_custom_connect_and_send(handler):
@@ -133,3 +227,443 @@ class TestDispatcher:
         dispatcher.send('TEST')
         # Assert
         assert handler.fired
+
+
+class TestDispatcherTracking:
+    """Define tests for tracking the targets the dispatcher ran."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_asend(handler, async_handler):
+        """Tests asend waits for the targets and returns their results."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.connect('TEST', handler)
+        dispatcher.connect('TEST', async_handler)
+        # Act
+        results = await dispatcher.asend('TEST', 1)
+        # Assert
+        assert results == [None, None]
+        assert handler.fired and async_handler.fired
+        assert not dispatcher.in_flight
+        assert dispatcher.stats.completed == 2
+        assert dispatcher.stats.mean_time >= 0
+        assert not await dispatcher.asend('UNKNOWN')
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_asend_timeout_and_failure(caplog):
+        """Tests targets are cancelled after the timeout and errors kept."""
+        # Arrange
+        dispatcher = Dispatcher()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fail():
+            raise ValueError('failed')
+        dispatcher.connect('TEST', slow)
+        dispatcher.connect('TEST', fail)
+        # Act
+        results = await dispatcher.asend('TEST', timeout=0.01)
+        # Assert
+        assert started.is_set()
+        assert isinstance(results[0], asyncio.TimeoutError)
+        assert isinstance(results[1], ValueError)
+        stats = dispatcher.stats
+        assert (stats.completed, stats.failed, stats.cancelled,
+                stats.timed_out) == (0, 1, 1, 1)
+        assert 'A target of signal TEST raised an exception.' in caplog.text
+        assert not dispatcher.in_flight
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_in_flight(async_handler):
+        """Tests targets are in flight until they finish."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.connect('TEST', async_handler)
+        # Act
+        sent = dispatcher.send('TEST')
+        # Assert
+        assert dispatcher.in_flight == set(sent)
+        await asyncio.gather(*sent)
+        assert not dispatcher.in_flight
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drain():
+        """Tests drain waits for targets, including ones started meanwhile."""
+        # Arrange
+        dispatcher = Dispatcher()
+        finished = []
+
+        async def second():
+            await asyncio.sleep(0)
+            finished.append('second')
+
+        async def first():
+            await asyncio.sleep(0)
+            dispatcher.send('SECOND')
+            finished.append('first')
+        dispatcher.connect('FIRST', first)
+        dispatcher.connect('SECOND', second)
+        dispatcher.send('FIRST')
+        # Act
+        result = await dispatcher.drain(1)
+        # Assert
+        assert finished == ['first', 'second']
+        assert result.finished == 2
+        assert result.drained
+        assert not dispatcher.in_flight
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drain_timeout(async_handler, caplog):
+        """Tests targets still running at the timeout are cancelled."""
+        # Arrange
+        dispatcher = Dispatcher()
+
+        async def slow():
+            await asyncio.sleep(10)
+        dispatcher.connect('SLOW', slow)
+        dispatcher.connect('FAST', async_handler)
+        slow_futures = dispatcher.send('SLOW') + dispatcher.send('SLOW')
+        dispatcher.send('FAST')
+        # Act
+        result = await dispatcher.drain(0.01)
+        await asyncio.gather(*slow_futures, return_exceptions=True)
+        # Assert
+        assert result.finished == 1
+        assert result.cancelled == {'SLOW': 2}
+        assert not result.drained
+        assert all(future.cancelled() for future in slow_futures)
+        assert dispatcher.stats.cancelled == 2
+        assert 'Cancelled 2 targets that were still running after ' \
+            "draining: {'SLOW': 2}" in caplog.text
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drain_nothing_in_flight():
+        """Tests drain returns at once when nothing is in flight."""
+        # Arrange
+        dispatcher = Dispatcher()
+        # Act
+        result = await dispatcher.drain(0)
+        # Assert
+        assert result == (0, {})
+        assert result.drained
+
+
+class Keyed:  # pylint: disable=too-few-public-methods
+    """Define an argument with an installed app id."""
+
+    def __init__(self, installed_app_id, value):
+        """Create a new instance of the Keyed class."""
+        self.installed_app_id = installed_app_id
+        self.value = value
+
+
+class TestOrderedDispatch:
+    """Define tests for dispatching in order by key."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_same_key_in_order():
+        """Tests sends for one key run one after another."""
+        # Arrange
+        dispatcher = Dispatcher(order_key='installed_app_id')
+        calls = []
+
+        async def target(arg):
+            calls.append(('start', arg.installed_app_id, arg.value))
+            await asyncio.sleep(0.01 if arg.value == 1 else 0)
+            calls.append(('end', arg.installed_app_id, arg.value))
+        dispatcher.connect('TEST', target)
+        # Act
+        first = dispatcher.send('TEST', Keyed('a', 1))
+        second = dispatcher.send('TEST', Keyed('a', 2))
+        other = dispatcher.send('TEST', Keyed('b', 1))
+        await asyncio.gather(*first, *second, *other)
+        # Assert
+        app_a = [call for call in calls if call[1] == 'a']
+        assert app_a == [('start', 'a', 1), ('end', 'a', 1),
+                         ('start', 'a', 2), ('end', 'a', 2)]
+        assert calls.index(('start', 'b', 1)) < calls.index(('end', 'a', 1))
+        await asyncio.sleep(0)
+        assert not dispatcher.queues
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_results_and_unkeyed(handler):
+        """Tests ordered results and arguments without a key."""
+        # Arrange
+        dispatcher = Dispatcher(order_key=lambda arg: arg)
+
+        async def target(arg):
+            if arg == 'fail':
+                raise ValueError(arg)
+            return arg
+        dispatcher.connect('TEST', target)
+        dispatcher.connect('TEST', handler)
+        # Act
+        results = await dispatcher.asend('TEST', 'key')
+        failed = await dispatcher.asend('TEST', 'fail')
+        unkeyed = await dispatcher.asend('TEST', None)
+        # Assert
+        assert results == ['key', None]
+        assert isinstance(failed[0], ValueError)
+        assert unkeyed == [None, None]
+        assert dispatcher.stats.failed == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_call_error(handler):
+        """Tests an error calling a target fails only that target."""
+        # Arrange
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.shutdown()
+        dispatcher = Dispatcher(order_key=lambda arg: arg)
+        dispatcher.add_pool('closed', executor)
+        dispatcher.connect('TEST', lambda arg: arg, pool='closed')
+        dispatcher.connect('TEST', handler)
+        # Act
+        results = await dispatcher.asend('TEST', 'key')
+        # Assert
+        assert isinstance(results[0], RuntimeError)
+        assert results[1] is None
+        assert handler.fired
+        assert dispatcher.stats.failed == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_cancel_waiting():
+        """Tests cancelling a waiting send skips its targets."""
+        # Arrange
+        dispatcher = Dispatcher(order_key='installed_app_id')
+        calls = []
+
+        async def target(arg):
+            calls.append(arg.value)
+            await asyncio.sleep(0)
+        dispatcher.connect('TEST', target)
+        first = dispatcher.send('TEST', Keyed('a', 1))
+        second = dispatcher.send('TEST', Keyed('a', 2))
+        # Act
+        second[0].cancel()
+        await asyncio.gather(*first)
+        await asyncio.sleep(0)
+        # Assert
+        assert calls == [1]
+        assert dispatcher.stats.cancelled == 1
+
+
+def count_events(snapshot):
+    """Count the events of the snapshot in a worker process."""
+    return snapshot.installed_app_id, len(snapshot.events)
+
+
+class TestProcessDispatch:
+    """Define tests for running targets in a process pool."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_process_target():
+        """Tests process targets receive a snapshot of the request."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.add_pool('cpu', max_workers=1, processes=True)
+        dispatcher.connect('EVENT', count_events, pool='cpu',
+                           filters={'capability': 'lock'})
+        req = EventRequest(get_fixture('event_request'))
+        # Act
+        results = await dispatcher.asend('EVENT', req, None)
+        # Assert
+        assert results == [(req.installed_app_id, 1)]
+        pool = dispatcher.pools['cpu']
+        assert (pool.active, pool.queued) == (0, 0)
+        dispatcher.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_process_invalid(async_handler):
+        """Tests targets and arguments that can't run in a process."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.connect('TEST', count_events, pool='process')
+        # Act
+        results = await dispatcher.asend('TEST', object())
+        # Assert
+        assert isinstance(results[0], TypeError)
+        assert dispatcher.pools['process'].executor is None
+        with pytest.raises(ValueError):
+            dispatcher.connect('TEST', async_handler, pool='process')
+
+
+def test_is_coroutine_target(handler, async_handler):
+    """Tests classifying targets and partials of them."""
+    assert is_coroutine_target(async_handler)
+    assert is_coroutine_target(functools.partial(
+        functools.partial(async_handler)))
+    assert not is_coroutine_target(handler)
+    assert not is_coroutine_target(functools.partial(handler))
+
+
+class TestTargetPool:
+    """Define tests for the TargetPool class."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_stats_and_rejection(event_loop):
+        """Tests targets beyond the queue are rejected and counted."""
+        # Arrange
+        pool = TargetPool('test', max_workers=1, max_queue=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def target():
+            started.set()
+            release.wait(5)
+        running = pool.submit(event_loop, target)
+        await event_loop.run_in_executor(None, started.wait, 5)
+        # Act
+        queued = pool.submit(event_loop, target)
+        rejected = pool.submit(event_loop, target)
+        # Assert
+        assert rejected is None
+        assert (pool.active, pool.queued, pool.rejected) == (1, 1, 1)
+        release.set()
+        await asyncio.gather(running, queued)
+        assert (pool.active, pool.queued) == (0, 0)
+        pool.shutdown()
+        assert pool.executor is None
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_cancelled_while_queued():
+        """Tests targets cancelled before they run leave the queue."""
+        # Arrange
+        dispatcher = Dispatcher(max_workers=1, max_queue=2)
+        release = threading.Event()
+        dispatcher.connect('TEST', lambda: release.wait(5))
+        pool = dispatcher.pools['default']
+        # Act
+        for _ in range(3):
+            await dispatcher.asend('TEST', timeout=0.01)
+        queued = pool.queued
+        release.set()
+        while pool.active:
+            await asyncio.sleep(0.01)
+        results = await dispatcher.asend('TEST', timeout=1)
+        # Assert
+        assert queued == 0
+        assert pool.active == 0
+        assert results == [True]
+        dispatcher.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_external_executor(event_loop):
+        """Tests an executor passed to the pool is not shut down."""
+        # Arrange
+        executor = ThreadPoolExecutor(max_workers=1)
+        pool = TargetPool('test', executor)
+        # Act
+        result = await pool.submit(event_loop, lambda value: value, 1)
+        pool.shutdown()
+        # Assert
+        assert result == 1
+        assert pool.executor is executor
+        executor.shutdown()
+
+
+class TestDispatcherPools:
+    """Define tests for running synchronous targets in pools."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_default_pool(handler):
+        """Tests synchronous targets run in the dispatcher's own pool."""
+        # Arrange
+        dispatcher = Dispatcher(max_workers=2)
+        dispatcher.connect('TEST', handler)
+        # Act
+        await asyncio.gather(*dispatcher.send('TEST'))
+        # Assert
+        assert handler.fired
+        assert dispatcher.pools['default'].executor is not None
+        dispatcher.disconnect_all(wait=True)
+        assert dispatcher.pools['default'].executor is None
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_assign_pools():
+        """Tests assigning pools to signals and targets."""
+        # Arrange
+        dispatcher = Dispatcher()
+        dispatcher.add_pool('signal', max_workers=1)
+        dispatcher.add_pool('target', max_workers=1)
+        dispatcher.assign_pool('TEST', 'signal')
+        names = []
+
+        def target():
+            names.append(threading.current_thread().name)
+        dispatcher.connect('TEST', target)
+        dispatcher.connect('TEST', functools.partial(target), pool='target')
+        # Act
+        await asyncio.gather(*dispatcher.send('TEST'))
+        # Assert
+        assert sorted(name.split('_')[0] for name in names) == [
+            'pysmartapp-signal', 'pysmartapp-target']
+        dispatcher.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unknown_pool(handler):
+        """Tests assigning a pool that doesn't exist raises."""
+        # Arrange
+        dispatcher = Dispatcher()
+        # Act/Assert
+        with pytest.raises(ValueError):
+            dispatcher.add_pool('default')
+        with pytest.raises(ValueError):
+            dispatcher.assign_pool('TEST', 'unknown')
+        with pytest.raises(ValueError):
+            dispatcher.connect('TEST', handler, pool='unknown')
+        assert not dispatcher.signals['TEST']
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_burst_within_workers():
+        """Tests targets that fit in the idle workers aren't rejected."""
+        # Arrange
+        dispatcher = Dispatcher(max_workers=20, max_queue=2)
+        for _ in range(10):
+            dispatcher.connect('TEST', functools.partial(time.sleep, 0.001))
+        pool = dispatcher.pools['default']
+        # Act
+        sent = []
+        for _ in range(5):
+            futures = dispatcher.send('TEST')
+            sent.append(len(futures))
+            await asyncio.gather(*futures)
+        # Assert
+        assert sent == [10] * 5
+        assert pool.rejected == 0
+        assert (pool.active, pool.queued) == (0, 0)
+        dispatcher.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_rejected_not_sent():
+        """Tests targets rejected by a full pool are left out of send."""
+        # Arrange
+        dispatcher = Dispatcher(max_queue=0)
+        dispatcher.connect('TEST', lambda: None)
+        # Act
+        sent = dispatcher.send('TEST')
+        # Assert
+        assert not sent
+        assert dispatcher.pools['default'].rejected == 1
@@ -1,8 +1,14 @@
 """Tests for the event module."""
 
+import math
+import pickle
+
+import pytest
+
+from pysmartapp import event
 from pysmartapp.const import (
     EVENT_TYPE_DEVICE, EVENT_TYPE_TIMER, LIFECYCLE_EVENT)
-from pysmartapp.event import Event, EventRequest
+from pysmartapp.event import Event, EventBatch, EventList, EventRequest
 
 from .utilities import get_fixture
 
@@ -30,6 +36,195 @@ class TestEventRequest:
         assert req.auth_token == 'f01894ce-013a-434a-b51e-f82126fd72e4'
         assert len(req.events) == 3
 
+    @staticmethod
+    def test_events_lazy():
+        """Tests events are only created when accessed."""
+        # Arrange
+        data = get_fixture('event_request')
+        req = EventRequest(data)
+        raw_events = data['eventData']['events']
+        # Act
+        events = req.events
+        # Assert
+        assert isinstance(events, EventList)
+        assert not any(events._events)  # pylint: disable=protected-access
+        assert events[0] is events[0]
+        assert events[-1].raw_data is raw_events[-1]
+        assert [evt.raw_data for evt in events] == raw_events
+        assert [evt.raw_data for evt in events[1:]] == raw_events[1:]
+
+    @staticmethod
+    def test_batch():
+        """Tests the batch shares the events of the request."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        # Act
+        batch = req.batch
+        mask = batch.mask(attribute='motion')
+        # Assert
+        assert batch is req.batch
+        assert batch.select(mask) == [req.events[0]]
+
+    @staticmethod
+    def test_with_events():
+        """Tests copying the request with a subset of its events."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        batch = req.batch
+        # Act
+        copy = req.with_events(req.events[1:2])
+        # Assert
+        assert list(copy.events) == [req.events[1]]
+        assert len(copy.batch) == 1
+        assert copy.auth_token == req.auth_token
+        assert len(req.events) == len(batch) == 3
+
+    @staticmethod
+    def test_snapshot():
+        """Tests the snapshot holds the fields of the request and events."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        # Act
+        snapshot = pickle.loads(pickle.dumps(req.snapshot()))
+        # Assert
+        assert snapshot.lifecycle == LIFECYCLE_EVENT
+        assert snapshot.installed_app_id == req.installed_app_id
+        assert snapshot.location_id == req.location_id
+        assert snapshot.execution_id == req.execution_id
+        assert len(snapshot.events) == 3
+        assert snapshot.events[0].capability == 'motionSensor'
+        assert snapshot.events[1].data == req.events[1].data
+        assert snapshot.events[2].timer_name == 'lights_off_timeout'
+
+    @staticmethod
+    def test_slots():
+        """Tests requests and events don't carry an instance dict."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        # Act/Assert
+        for obj in (req, req.events, req.events[0]):
+            assert not hasattr(obj, '__dict__')
+
+
+@pytest.fixture(name='batch_data', params=['numpy', 'list'])
+def batch_data_fixture(request, monkeypatch):
+    """Fixture for raw events and whether NumPy builds the columns."""
+    if request.param == 'numpy':
+        monkeypatch.setattr(EventBatch, 'use_numpy', True)
+    raw_events = get_fixture('event_request')['eventData']['events']
+    raw_events[1]['deviceEvent'].update({
+        'capability': 'temperatureMeasurement',
+        'attribute': 'temperature', 'value': 21.5, 'valueType': 'number'})
+    raw_events.append({
+        'eventType': EVENT_TYPE_DEVICE,
+        'deviceEvent': {
+            'capability': 'temperatureMeasurement',
+            'attribute': 'temperature', 'value': 19,
+            'stateChange': False}})
+    return raw_events
+
+
+class TestEventBatch:
+    """Tests for the EventBatch class."""
+
+    @staticmethod
+    def test_columns(batch_data):
+        """Tests the columns hold the field of each event."""
+        # Arrange
+        batch = EventBatch(batch_data)
+        # Act
+        values = list(batch.column('value'))
+        # Assert
+        assert len(batch) == 4
+        assert list(batch.column('event_type')) == [
+            EVENT_TYPE_DEVICE, EVENT_TYPE_DEVICE, EVENT_TYPE_TIMER,
+            EVENT_TYPE_DEVICE]
+        assert list(batch.column('capability')) == [
+            'motionSensor', 'temperatureMeasurement', None,
+            'temperatureMeasurement']
+        assert list(batch.column('state_change')) == [
+            True, True, False, False]
+        assert values[1:4:2] == [21.5, 19.0]
+        assert all(math.isnan(value) for value in values[0:3:2])
+        assert batch.column('device_id') is batch.column('device_id')
+
+    @staticmethod
+    def test_lists_by_default():
+        """Tests columns are lists unless NumPy is asked for."""
+        # Arrange
+        raw_events = get_fixture('event_request')['eventData']['events']
+        # Act
+        batch = EventBatch(raw_events)
+        arrays = EventBatch(raw_events, use_numpy=True)
+        # Assert
+        assert not EventBatch.use_numpy
+        assert isinstance(batch.column('capability'), list)
+        assert isinstance(
+            arrays.column('capability'), event.numpy.ndarray)
+
+    @staticmethod
+    def test_numpy_not_installed(monkeypatch):
+        """Tests asking for NumPy without it installed raises."""
+        # Arrange
+        monkeypatch.setattr(event, 'numpy', None)
+        # Act/Assert
+        with pytest.raises(RuntimeError):
+            EventBatch([], use_numpy=True)
+
+    @staticmethod
+    def test_invalid_column(batch_data):
+        """Tests an unknown column raises."""
+        batch = EventBatch(batch_data)
+        with pytest.raises(ValueError):
+            batch.column('unknown')
+
+    @staticmethod
+    def test_mask(batch_data):
+        """Tests selecting the values of events matching the criteria."""
+        # Arrange
+        batch = EventBatch(batch_data)
+        # Act
+        mask = batch.mask(capability='temperatureMeasurement',
+                          state_change=True)
+        # Assert
+        assert list(mask) == [False, True, False, False]
+        assert list(batch.values(mask)) == [21.5]
+        assert list(batch.compress('attribute', mask)) == ['temperature']
+        assert batch.indices(mask) == [1]
+        assert [evt.raw_data for evt in batch.select(mask)] == [
+            batch_data[1]]
+        assert len(batch.values()) == 4
+
+    @staticmethod
+    def test_empty(batch_data):
+        """Tests a batch without events."""
+        # Arrange
+        batch = EventBatch(batch_data[:0])
+        # Act
+        mask = batch.mask(capability='temperatureMeasurement')
+        # Assert
+        assert not batch
+        assert not list(batch.values(mask))
+        assert not batch.select(mask)
+
+
+class TestEventList:
+    """Tests for the EventList class."""
+
+    @staticmethod
+    def test_empty():
+        """Tests a list without events."""
+        events = EventList([])
+        assert not events
+        assert not list(events)
+
+    @staticmethod
+    def test_index_error():
+        """Tests accessing past the end of the list."""
+        events = EventList([])
+        with pytest.raises(IndexError):
+            events[0]  # pylint: disable=pointless-statement
+
 
 class TestEvent:
     """Tests for the Event class."""
@@ -54,6 +249,10 @@ class TestEvent:
         assert evt.value_type == 'string'
         assert evt.data is None
         assert evt.state_change
+        assert evt.timer_name is None
+        assert evt.timer_type is None
+        assert evt.timer_time is None
+        assert evt.timer_expression is None
 
     @staticmethod
     def test_init_device_event_with_data():
@@ -80,3 +279,6 @@ class TestEvent:
         assert evt.timer_type == 'CRON'
         assert evt.timer_time == '2017-09-13T04:18:12.469Z'
         assert evt.timer_expression == 'string'
+        assert evt.device_id is None
+        assert evt.capability is None
+        assert evt.data is None
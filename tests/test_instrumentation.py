@@ -0,0 +1,83 @@
+"""Tests for the instrumentation module."""
+
+from pysmartapp.instrumentation import (
+    STAGE_PARSE, Histogram, Instrumentation, StageTiming)
+
+
+class TestHistogram:
+    """Tests for the Histogram class."""
+
+    @staticmethod
+    def test_percentile():
+        """Tests percentiles are within the resolution of the buckets."""
+        # Arrange
+        histogram = Histogram()
+        # Act
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+        # Assert
+        assert histogram.count == 1000
+        assert histogram.max == 1000000
+        assert 500000 <= histogram.percentile(50) <= 500000 * 1.125
+        assert 990000 <= histogram.percentile(99) <= 1000000
+        assert histogram.percentile(100) == 1000000
+
+    @staticmethod
+    def test_small_and_large_values():
+        """Tests values at both ends of the bucket range."""
+        # Arrange
+        histogram = Histogram()
+        # Act
+        histogram.record(0)
+        histogram.record(3)
+        histogram.record(2 ** 64 - 1)
+        # Assert
+        assert histogram.percentile(1) == 0
+        assert histogram.percentile(50) == 3
+        assert histogram.percentile(100) == 2 ** 64 - 1
+
+    @staticmethod
+    def test_count_at_most():
+        """Tests counting the durations within a bound."""
+        # Arrange
+        histogram = Histogram()
+        # Act
+        for value in (1, 100, 1000, 10000):
+            histogram.record(value)
+        # Assert
+        assert histogram.count_at_most(0) == 0
+        assert histogram.count_at_most(1) == 1
+        assert histogram.count_at_most(2000) == 3
+        assert histogram.count_at_most(10 ** 9) == 4
+        assert histogram.total == 11101
+
+    @staticmethod
+    def test_empty():
+        """Tests the summary of a histogram without values."""
+        assert Histogram().summary() == StageTiming(0, 0.0, 0, 0, 0)
+
+
+class TestInstrumentation:
+    """Tests for the Instrumentation class."""
+
+    @staticmethod
+    def test_snapshot():
+        """Tests the snapshot summarizes each stage by lifecycle."""
+        # Arrange
+        instrumentation = Instrumentation()
+        # Act
+        instrumentation.record('EVENT', STAGE_PARSE, 100)
+        instrumentation.record('EVENT', STAGE_PARSE, 300)
+        ended = instrumentation.lap('PING', STAGE_PARSE, 0)
+        # Assert
+        snapshot = instrumentation.snapshot()
+        timing = snapshot['EVENT'][STAGE_PARSE]
+        assert (timing.count, timing.mean_ns, timing.p99_ns,
+                timing.max_ns) == (2, 200.0, 300, 300)
+        assert 100 <= timing.p50_ns <= 100 * 1.125
+        assert snapshot['PING'][STAGE_PARSE].max_ns == ended
+        assert instrumentation.stages == [
+            ('EVENT', STAGE_PARSE), ('PING', STAGE_PARSE)]
+        assert instrumentation.histogram('EVENT', STAGE_PARSE).count == 2
+        instrumentation.reset()
+        assert not instrumentation.snapshot()
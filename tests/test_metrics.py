@@ -0,0 +1,121 @@
+"""Tests for the metrics module."""
+
+import asyncio
+import functools
+
+import pytest
+
+from pysmartapp.admission import AdmissionController
+from pysmartapp.const import LIFECYCLE_EVENT
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.errors import (
+    SmartAppNotRegisteredError, SmartAppOverloadedError)
+from pysmartapp.instrumentation import Instrumentation
+from pysmartapp.metrics import DispatchMetrics, get_target_name, render_metrics
+from pysmartapp.smartapp import SmartAppManager
+
+from .utilities import get_fixture
+
+APP_ID = 'f6c071aa-6ae7-463f-b0ad-8620ac23140f'
+
+
+async def succeed(*args):
+    """Target that finishes."""
+    return args
+
+
+async def fail(*args):
+    """Target that raises."""
+    raise ValueError(args)
+
+
+def test_get_target_name():
+    """Tests targets are named after the function they call."""
+    assert get_target_name(functools.partial(succeed)) == \
+        'tests.test_metrics.succeed'
+    assert get_target_name(object()) == 'builtins.object'
+
+
+class TestRenderMetrics:
+    """Tests for the render_metrics function."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_dispatcher():
+        """Tests the counts and latency of targets are rendered."""
+        # Arrange
+        dispatcher = Dispatcher(metrics=DispatchMetrics())
+        dispatcher.connect('TEST', succeed)
+        dispatcher.connect('TEST', fail)
+        # Act
+        await dispatcher.asend('TEST')
+        await dispatcher.asend('TEST')
+        text = render_metrics(dispatcher=dispatcher)
+        # Assert
+        lines = text.splitlines()
+        labels = 'signal="TEST",target="tests.test_metrics.succeed"'
+        assert 'pysmartapp_signals_sent_total{signal="TEST"} 2' in lines
+        assert F'pysmartapp_target_calls_total{{{labels}}} 2' in lines
+        assert F'pysmartapp_target_errors_total{{{labels}}} 0' in lines
+        assert 'pysmartapp_target_errors_total{signal="TEST",' \
+            'target="tests.test_metrics.fail"} 2' in lines
+        assert F'pysmartapp_target_in_flight{{{labels}}} 0' in lines
+        assert F'pysmartapp_target_duration_seconds_bucket{{{labels},' \
+            'le="+Inf"} 2' in lines
+        assert F'pysmartapp_target_duration_seconds_count{{{labels}}} 2' \
+            in lines
+        assert 'pysmartapp_dispatcher_in_flight 0' in lines
+        assert 'pysmartapp_dispatcher_pool_queued{pool="default"} 0' \
+            in lines
+        assert '# TYPE pysmartapp_target_duration_seconds histogram' in lines
+        assert text.endswith('\n')
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_manager_and_instrumentation(event_loop):
+        """Tests the manager counts and stage timings are rendered."""
+        # Arrange
+        instrumentation = Instrumentation()
+        manager = SmartAppManager(
+            '/path', dispatcher=Dispatcher(loop=event_loop),
+            instrumentation=instrumentation)
+        manager.register(APP_ID, None)
+        request = get_fixture('event_request')
+        # Act
+        await manager.handle_request(get_fixture('ping_request'))
+        await manager.handle_request(request, None, False)
+        request['settings']['appId'] = 'other"app'
+        with pytest.raises(SmartAppNotRegisteredError):
+            await manager.handle_request(request, None, False)
+        text = render_metrics(manager=manager,
+                              instrumentation=instrumentation,
+                              prefix='app')
+        # Assert
+        lines = text.splitlines()
+        assert 'app_requests_total{app_id="",lifecycle="PING"} 1' in lines
+        assert 'app_requests_total{app_id="' + APP_ID + \
+            '",lifecycle="EVENT"} 1' in lines
+        assert 'app_requests_unregistered_total{app_id="other\\"app",' \
+            'lifecycle="EVENT"} 1' in lines
+        assert 'app_stage_duration_seconds_count{lifecycle="EVENT",' \
+            'stage="total"} 1' in lines
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_admission():
+        """Tests the admission counts are rendered."""
+        # Arrange
+        admission = AdmissionController(max_app_requests=1)
+        admission.admit(APP_ID, LIFECYCLE_EVENT)
+        with pytest.raises(SmartAppOverloadedError):
+            admission.admit(APP_ID, LIFECYCLE_EVENT)
+        admission.track(APP_ID, [asyncio.get_running_loop().create_future()])
+        # Act
+        lines = render_metrics(admission=admission).splitlines()
+        # Assert
+        assert 'pysmartapp_admission_requests{app_id="' + APP_ID + '"} 1' \
+            in lines
+        assert 'pysmartapp_admission_handlers{app_id="' + APP_ID + '"} 1' \
+            in lines
+        assert 'pysmartapp_requests_shed_total{app_id="' + APP_ID + \
+            '",reason="app_requests"} 1' in lines
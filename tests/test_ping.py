@@ -1,7 +1,9 @@
 """Tests for the ping module."""
 
+import json
+
 from pysmartapp.const import LIFECYCLE_PING
-from pysmartapp.ping import PingRequest
+from pysmartapp.ping import PingRequest, PingResponse
 
 from .utilities import get_fixture
 
@@ -23,3 +25,29 @@ class TestPingRequest:
         assert req.locale == data['locale']
         assert req.version == data['version']
         assert req.ping_challenge == '1a904d57-4fab-4b15-a11e-1c4bfe7cb502'
+
+
+class TestPingResponse:
+    """Tests for the PingResponse class."""
+
+    @staticmethod
+    def test_to_bytes():
+        """Tests the challenge is spliced into the encoded body."""
+        # Arrange
+        resp = PingResponse()
+        resp.ping_challenge = '1a904d57-4fab-4b15-a11e-1c4bfe7cb502'
+        # Act
+        result = resp.to_bytes()
+        # Assert
+        assert json.loads(result) == resp.to_data()
+        assert result == b'{"pingData":{"challenge":' \
+            b'"1a904d57-4fab-4b15-a11e-1c4bfe7cb502"}}'
+
+    @staticmethod
+    def test_to_bytes_escapes():
+        """Tests the challenge is escaped when encoded."""
+        # Arrange
+        resp = PingResponse()
+        resp.ping_challenge = 'a"b'
+        # Act/Assert
+        assert json.loads(resp.to_bytes()) == resp.to_data()
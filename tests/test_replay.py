@@ -0,0 +1,262 @@
+"""Tests for the replay module."""
+
+import asyncio
+import functools
+import json
+import time
+
+import pytest
+
+from pysmartapp import signature
+from pysmartapp.const import REJECTED_CLOCK_SKEW, REJECTED_DIGEST
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.errors import SignatureVerificationError
+from pysmartapp.replay import ReplayCache
+from pysmartapp.signature import create_verifier
+from pysmartapp.smartapp import SmartApp, SmartAppManager
+
+from .utilities import get_dispatch_handler, get_fixture, sign_request
+
+
+class TestReplayCache:
+    """Tests for the ReplayCache class."""
+
+    @staticmethod
+    def test_init():
+        """Tests the init method."""
+        # Act
+        cache = ReplayCache(max_size=10, ttl=5)
+        # Assert
+        assert cache.max_size == 10
+        assert cache.ttl == 5
+        assert not cache
+        assert cache.hits == 0
+        assert cache.misses == 0
+
+    @staticmethod
+    def test_init_invalid_size():
+        """Tests the cache must hold at least one key."""
+        with pytest.raises(ValueError):
+            ReplayCache(max_size=0)
+
+    @staticmethod
+    def test_check():
+        """Tests checking for known and unknown keys."""
+        # Arrange
+        cache = ReplayCache()
+        cache.add('known')
+        # Act/Assert
+        assert cache.check('known')
+        assert not cache.check('unknown')
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    @staticmethod
+    def test_evicts_oldest():
+        """Tests the oldest keys are evicted when full."""
+        # Arrange
+        cache = ReplayCache(max_size=2)
+        # Act
+        cache.add(1)
+        cache.add(2)
+        cache.add(3)
+        # Assert
+        assert len(cache) == 2
+        assert not cache.check(1)
+        assert cache.check(2)
+        assert cache.check(3)
+
+    @staticmethod
+    def test_evicts_expired():
+        """Tests keys are forgotten after the ttl."""
+        # Arrange
+        cache = ReplayCache(ttl=0)
+        cache.add('key')
+        # Act/Assert
+        assert not cache.check('key')
+        assert not cache
+
+    @staticmethod
+    def test_clear():
+        """Tests clearing the cache."""
+        # Arrange
+        cache = ReplayCache()
+        cache.add('key')
+        cache.check('key')
+        # Act
+        cache.clear()
+        # Assert
+        assert not cache
+        assert cache.hits == 0
+
+
+class TestReplay:
+    """Tests for detecting duplicate requests."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_duplicate_skips_verification(monkeypatch):
+        """Tests a duplicate request is not verified again."""
+        # Arrange
+        data = get_fixture('config_init_sig_pass_request')
+        cache = ReplayCache()
+        smartapp = SmartApp(public_key=get_fixture('public_key', 'pem'),
+                            replay_cache=cache)
+        await smartapp.handle_request(data['body'], data['headers'])
+
+        def fail(*args):
+            raise AssertionError('verified twice')
+        monkeypatch.setattr(smartapp.verifier, 'verify_message', fail)
+        # Act
+        resp = await smartapp.handle_request(data['body'], data['headers'])
+        # Assert
+        assert resp
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_changed_body_verified(private_key, public_key):
+        """Tests a different body sent with reused headers is rejected."""
+        # Arrange
+        request = get_fixture('event_request')
+        body = json.dumps(request).encode()
+        headers = sign_request(private_key, body)
+        cache = ReplayCache()
+        smartapp = SmartApp(public_key=public_key, replay_cache=cache)
+        values = []
+
+        async def handler(req, resp, app):
+            values.append(req.events[0].value)
+        smartapp.connect_event(handler)
+        await smartapp.handle_request_bytes(body, headers)
+        request['eventData']['events'][0]['deviceEvent']['value'] = 'forged'
+        # Act
+        with pytest.raises(SignatureVerificationError) as e_info:
+            await smartapp.handle_request_bytes(
+                json.dumps(request).encode(), headers)
+        await smartapp.handle_request_bytes(body, headers)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert e_info.value.reason == REJECTED_DIGEST
+        assert values == ['active', 'active']
+        assert cache.hits == 1
+        assert len(cache) == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('name,value', [
+        ('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'),
+        ('Digest', 'SHA-256=Zm9yZ2Vk')])
+    async def test_changed_signed_header(private_key, public_key, name,
+                                         value):
+        """Tests a signature reused with other signed headers is rejected."""
+        # Arrange
+        request = get_fixture('event_request')
+        headers = sign_request(private_key, json.dumps(request).encode())
+        smartapp = SmartApp(public_key=public_key, replay_cache=ReplayCache())
+        await smartapp.handle_request(request, headers)
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError):
+            await smartapp.handle_request(request, {**headers, name: value})
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_duplicate_parsed(monkeypatch, private_key, public_key):
+        """Tests a duplicate still has its signed headers checked."""
+        # Arrange
+        request = get_fixture('event_request')
+        headers = sign_request(private_key, json.dumps(request).encode())
+        cache = ReplayCache()
+        smartapp = SmartApp(
+            public_key=public_key, replay_cache=cache,
+            verifier_factory=functools.partial(
+                create_verifier, max_clock_skew=300))
+        await smartapp.handle_request(request, headers)
+        now = time.time()
+        monkeypatch.setattr(signature.time, 'time', lambda: now + 600)
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            await smartapp.handle_request(request, headers)
+        assert e_info.value.reason == REJECTED_CLOCK_SKEW
+        assert cache.misses == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_other_app_verified(event_loop, private_key, public_key):
+        """Tests a request seen for one app is verified for another."""
+        # Arrange
+        cache = ReplayCache()
+        manager = SmartAppManager(
+            '/path', dispatcher=Dispatcher(loop=event_loop),
+            replay_cache=cache)
+        manager.register('first', public_key)
+        manager.register('second', get_fixture('public_key', 'pem'))
+        request = get_fixture('event_request')
+        request['settings']['appId'] = 'first'
+        headers = sign_request(
+            private_key, json.dumps(request).encode(), '/path')
+        await manager.handle_request(request, headers)
+        request['settings']['appId'] = 'second'
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError):
+            await manager.handle_request(request, headers)
+        assert cache.hits == 0
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_failed_verification_not_cached():
+        """Tests a request that fails verification is not remembered."""
+        # Arrange
+        data = get_fixture('config_init_sig_fail_request')
+        cache = ReplayCache()
+        smartapp = SmartApp(public_key=get_fixture('public_key', 'pem'),
+                            replay_cache=cache)
+        # Act
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await smartapp.handle_request(data['body'], data['headers'])
+        # Assert
+        assert not cache
+        assert cache.misses == 2
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handlers_told_duplicate(event_loop):
+        """Tests handlers can see the request is a duplicate."""
+        # Arrange
+        smartapp = SmartApp(replay_cache=ReplayCache())
+        duplicates = []
+
+        async def handler(req, resp, app):
+            duplicates.append(req.is_duplicate)
+        smartapp.connect_event(handler)
+        request = get_fixture('event_request')
+        # Act
+        await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert duplicates == [False, True]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drop_duplicates():
+        """Tests duplicates are not dispatched when dropped."""
+        # Arrange
+        smartapp = SmartApp(replay_cache=ReplayCache(), drop_duplicates=True)
+        handler = get_dispatch_handler(smartapp)
+        smartapp.connect_event(handler)
+        request = get_fixture('event_request')
+        expected_response = get_fixture('event_response')
+        await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        handler.fired = False
+        # Act
+        response = await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert smartapp.drop_duplicates
+        assert response == expected_response
+        assert not handler.fired
@@ -17,6 +17,17 @@ class TestResponse:
         with pytest.raises(NotImplementedError):
             resp.to_data()
 
+    @staticmethod
+    def test_to_bytes():
+        """Tests the to_bytes method encodes the data."""
+        class DataResponse(Response):
+            """Response with data."""
+
+            def to_data(self):
+                return {'configurationData': {'page': None}}
+        assert DataResponse().to_bytes() == \
+            b'{"configurationData":{"page":null}}'
+
 
 class TestEmptyDataResponse:
     """Tests for the EmptyDataResponse class."""
@@ -34,6 +45,20 @@ class TestEmptyDataResponse:
         result = resp.to_data()
         assert result == {'tag': {}}
 
+    @staticmethod
+    def test_to_bytes():
+        """Tests the to_bytes method returns the pre-encoded body."""
+        resp = EmptyDataResponse('eventData')
+        result = resp.to_bytes()
+        assert result == b'{"eventData":{}}'
+        assert result is EmptyDataResponse('eventData').to_bytes()
+
+    @staticmethod
+    def test_to_bytes_custom_name():
+        """Tests the to_bytes method for names not pre-encoded."""
+        resp = EmptyDataResponse('tag')
+        assert resp.to_bytes() == b'{"tag":{}}'
+
     @staticmethod
     def test_name():
         """Tests the name setter."""
@@ -0,0 +1,21 @@
+"""Tests for the serialization module."""
+
+import pytest
+
+from pysmartapp import serialization
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_loads(monkeypatch, use_orjson):
+    """Tests decoding bytes with and without orjson."""
+    if not use_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    assert serialization.loads(b'{"eventData": {}}') == {'eventData': {}}
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps(monkeypatch, use_orjson):
+    """Tests encoding to compact bytes with and without orjson."""
+    if not use_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    assert serialization.dumps({'eventData': {}}) == b'{"eventData":{}}'
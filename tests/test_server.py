@@ -0,0 +1,343 @@
+"""Tests for the server module."""
+
+import asyncio
+from contextlib import asynccontextmanager
+import json
+
+import pytest
+
+from pysmartapp.const import SHED_APP_REQUESTS, SHED_REQUESTS
+from pysmartapp.errors import SmartAppOverloadedError
+from pysmartapp.server import HttpProtocol, start_server
+
+from .utilities import get_fixture
+
+PING_BODY = json.dumps(get_fixture('ping_request')).encode()
+
+
+def build_request(body: bytes = PING_BODY, path: str = '/',
+                  method: str = 'POST', headers: str = '') -> bytes:
+    """Build a raw HTTP/1.1 request."""
+    return (F"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+            F"Content-Length: {len(body)}\r\n{headers}\r\n").encode() + body
+
+
+async def read_response(reader: asyncio.StreamReader):
+    """Read the status, headers and body of a response."""
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    lines = head.split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    return status, headers, body
+
+
+@asynccontextmanager
+async def serve(app, **kwargs):
+    """Serve the app on a free port and open a connection to it."""
+    server = await start_server(app, '127.0.0.1', 0, **kwargs)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        yield reader, writer
+    finally:
+        writer.close()
+        server.close()
+        await server.wait_closed()
+
+
+class Transport:
+    """Records what a protocol writes to it."""
+
+    def __init__(self):
+        """Create a new instance of the Transport class."""
+        self.written = b''
+        self.closed = False
+
+    def write(self, data: bytes):
+        """Record the written data."""
+        self.written += data
+
+    def close(self):
+        """Record the transport was closed."""
+        self.closed = True
+
+    def is_closing(self) -> bool:
+        """Get whether the transport was closed."""
+        return self.closed
+
+
+class TestHttpProtocol:
+    """Tests for the HttpProtocol class."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_ping(smartapp):
+        """Tests a lifecycle request is answered with its response."""
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request())
+            status, headers, body = await read_response(reader)
+        # Assert
+        assert status == 200
+        assert headers['content-type'] == 'application/json'
+        assert 'connection' not in headers
+        assert json.loads(body) == get_fixture('ping_response')
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_keep_alive(smartapp):
+        """Tests requests are answered on the same connection."""
+        statuses = []
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            for _ in range(3):
+                writer.write(build_request())
+                statuses.append((await read_response(reader))[0])
+        # Assert
+        assert statuses == [200, 200, 200]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pipelined(smartapp):
+        """Tests pipelined requests are answered in order."""
+        # Arrange
+        data = build_request() * 2 + build_request(path='/other')
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(data)
+            statuses = [(await read_response(reader))[0] for _ in range(3)]
+            remaining = await reader.read()
+        # Assert
+        assert statuses == [200, 200, 404]
+        assert remaining == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_split_request(smartapp):
+        """Tests a request arriving in pieces is answered once complete."""
+        # Arrange
+        data = build_request()
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            for index in range(0, len(data), 20):
+                writer.write(data[index:index + 20])
+                await writer.drain()
+                await asyncio.sleep(0)
+            status, _, body = await read_response(reader)
+        # Assert
+        assert status == 200
+        assert json.loads(body) == get_fixture('ping_response')
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_connection_close(smartapp):
+        """Tests the connection is closed when the client asks."""
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request(headers='Connection: close\r\n'))
+            status, headers, _ = await read_response(reader)
+            remaining = await reader.read()
+        # Assert
+        assert status == 200
+        assert headers['connection'] == 'close'
+        assert remaining == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_half_close(smartapp):
+        """Tests requests sent before the client half-closed are answered."""
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request() * 2)
+            writer.write_eof()
+            statuses = [(await read_response(reader))[0] for _ in range(2)]
+            remaining = await reader.read()
+        # Assert
+        assert statuses == [200, 200]
+        assert remaining == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('data,expected', [
+        (build_request(path='/other'), 404),
+        (build_request(method='PUT'), 405),
+        (b'POST / HTTP/1.1\r\n\r\n', 411),
+        (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n', 501),
+        (b'POST /\r\n\r\n', 400),
+        (b'POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n', 400),
+        (b'POST / HTTP/1.1\r\nContent-Length: \xb2\r\n\r\n', 400),
+        (build_request(headers='Content-Length: 1\r\n'), 400),
+        (b'POST / HTTP/1.1\r\nBad Header\r\n\r\n', 400),
+        (b'POST / HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n', 413),
+        (b'POST / HTTP/1.1\r\nX: ' + b'x' * 70000, 431)])
+    async def test_rejected(smartapp, data, expected):
+        """Tests requests that can't be handled are rejected and closed."""
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(data)
+            status, headers, body = await read_response(reader)
+            remaining = await reader.read()
+        # Assert
+        assert status == expected
+        assert headers['connection'] == 'close'
+        assert body == b''
+        assert remaining == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_repeated_content_length(smartapp):
+        """Tests a Content-Length repeated with the same value is read."""
+        # Arrange
+        data = build_request(
+            headers=F"Content-Length: {len(PING_BODY)}\r\n")
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(data)
+            status, _, _ = await read_response(reader)
+        # Assert
+        assert status == 200
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('body,expected', [
+        (json.dumps(get_fixture('install_request')).encode(), 401),
+        (b'{"lifecycle": "PING"', 400),
+        (b'{"lifecycle": "UNKNOWN"}', 400)])
+    async def test_request_errors(smartapp, body, expected):
+        """Tests errors handling a request are answered with a status."""
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request(body) + build_request())
+            first = await read_response(reader)
+            second = await read_response(reader)
+        # Assert
+        assert first[0] == expected
+        assert second[0] == 200
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_not_registered(manager):
+        """Tests requests for unregistered apps are not found."""
+        # Arrange
+        body = json.dumps(get_fixture('install_request')).encode()
+        async with serve(manager) as (reader, writer):
+            # Act
+            writer.write(build_request(body, path='/path/to/app'))
+            status, _, _ = await read_response(reader)
+        # Assert
+        assert status == 404
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_unexpected_error(smartapp, caplog):
+        """Tests an unexpected error is answered with a server error."""
+        # Arrange
+        async def fail(*args):
+            raise RuntimeError
+
+        smartapp.handle_request_bytes = fail
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request())
+            status, _, _ = await read_response(reader)
+        # Assert
+        assert status == 500
+        assert 'Unable to handle the request.' in caplog.text
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('reason,expected', [
+        (SHED_APP_REQUESTS, 429), (SHED_REQUESTS, 503)])
+    async def test_overloaded(smartapp, reason, expected):
+        """Tests shed requests are answered as too many or unavailable."""
+        # Arrange
+        async def shed(*args):
+            raise SmartAppOverloadedError('app', reason)
+
+        smartapp.handle_request_bytes = shed
+        async with serve(smartapp) as (reader, writer):
+            # Act
+            writer.write(build_request())
+            status, _, _ = await read_response(reader)
+        # Assert
+        assert status == expected
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_keep_alive_timeout(smartapp):
+        """Tests idle connections are closed after the timeout."""
+        async with serve(smartapp, keep_alive_timeout=0.01) \
+                as (reader, writer):
+            # Act
+            writer.write(build_request())
+            status, _, _ = await read_response(reader)
+            remaining = await asyncio.wait_for(reader.read(), 1)
+        # Assert
+        assert status == 200
+        assert remaining == b''
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pause_reading(smartapp):
+        """Tests reading is paused while pipelined data exceeds the limit."""
+        # Arrange
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def handle(*args):
+            started.set()
+            await release.wait()
+            return b'{}'
+
+        smartapp.handle_request_bytes = handle
+        async with serve(smartapp, max_body_size=len(PING_BODY)) \
+                as (reader, writer):
+            writer.write(build_request())
+            await started.wait()
+            # Act
+            writer.write(build_request() * 2)
+            await writer.drain()
+            await asyncio.sleep(0.01)
+            release.set()
+            statuses = [(await read_response(reader))[0] for _ in range(3)]
+        # Assert
+        assert statuses == [200, 200, 200]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_http_10(smartapp):
+        """Tests HTTP/1.0 connections are closed unless kept alive."""
+        # Arrange
+        transport = Transport()
+        protocol = HttpProtocol(smartapp, keep_alive_timeout=None)
+        protocol.connection_made(transport)
+        data = build_request().replace(b'HTTP/1.1', b'HTTP/1.0', 1)
+        # Act
+        protocol.data_received(data)
+        await protocol._task  # pylint: disable=protected-access
+        # Assert
+        assert b'Connection: close' in transport.written
+        assert transport.closed
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_http_10_keep_alive(smartapp):
+        """Tests HTTP/1.0 connections are kept alive when asked."""
+        # Arrange
+        transport = Transport()
+        protocol = HttpProtocol(smartapp, keep_alive_timeout=None)
+        protocol.connection_made(transport)
+        data = build_request(headers='Connection: Keep-Alive\r\n') \
+            .replace(b'HTTP/1.1', b'HTTP/1.0', 1)
+        # Act
+        protocol.data_received(data)
+        await protocol._task  # pylint: disable=protected-access
+        # Assert
+        assert transport.written.startswith(b'HTTP/1.1 200 OK\r\n')
+        assert b'Connection: close' not in transport.written
+        assert not transport.closed
@@ -0,0 +1,364 @@
+"""Tests for the signature module."""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+import threading
+import time
+
+from httpsig import sign
+import pytest
+
+from pysmartapp.const import (
+    REJECTED_CLOCK_SKEW, REJECTED_DIGEST, REJECTED_KEY_ID,
+    REJECTED_MALFORMED_SIGNATURE, REJECTED_MISSING_HEADER,
+    REJECTED_MISSING_SIGNATURE, REJECTED_UNSUPPORTED_ALGORITHM)
+from pysmartapp.errors import SignatureVerificationError
+from pysmartapp.signature import (
+    CryptographyVerifier, HttpSigVerifier, SignatureVerifier, VerificationPool,
+    create_verifier, normalize_headers)
+from pysmartapp.smartapp import SmartApp
+
+from .utilities import get_fixture, sign_request
+
+VERIFIERS = [HttpSigVerifier, CryptographyVerifier]
+
+
+class TestSignatureVerifier:
+    """Tests for the SignatureVerifier classes."""
+
+    @staticmethod
+    def test_init():
+        """Tests the init method."""
+        # Act
+        verifier = SignatureVerifier('key', '/path')
+        # Assert
+        assert verifier.public_key == 'key'
+        assert verifier.path == '/path'
+
+    @staticmethod
+    def test_create_verifier():
+        """Tests cryptography is used by default when installed."""
+        # Act
+        verifier = create_verifier('key', '/path')
+        # Assert
+        assert isinstance(verifier, CryptographyVerifier)
+        assert verifier.path == '/path'
+
+    @staticmethod
+    def test_verify_not_implemented():
+        """Tests the base class requires an engine."""
+        # Arrange
+        data = get_fixture('config_init_sig_pass_request')
+        verifier = SignatureVerifier('key', '/')
+        # Act/Assert
+        with pytest.raises(NotImplementedError):
+            verifier.verify(data['headers'])
+
+    @staticmethod
+    def test_build_message():
+        """Tests building the signing string."""
+        # Arrange
+        verifier = SignatureVerifier('key', '/path')
+        headers = normalize_headers({'Date': 'today', 'Digest': 'abc'})
+        # Act
+        message = verifier.build_message(
+            ['(request-target)', 'digest', 'date'], headers)
+        # Assert
+        assert message == \
+            b'(request-target): post /path\ndigest: abc\ndate: today'
+
+    @staticmethod
+    def test_build_message_missing_header():
+        """Tests building the signing string without a signed header."""
+        # Arrange
+        verifier = SignatureVerifier('key', '/path')
+        # Act/Assert
+        with pytest.raises(ValueError):
+            verifier.build_message(['digest'], {})
+
+    @staticmethod
+    @pytest.mark.parametrize('factory', VERIFIERS)
+    def test_verify(factory):
+        """Tests verifying a valid signature."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        verifier = factory(public_key, '/')
+        # Act/Assert
+        assert verifier.verify(data['headers'])
+
+    @staticmethod
+    @pytest.mark.parametrize('factory', VERIFIERS)
+    def test_verify_fails(factory):
+        """Tests verifying an invalid signature."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_fail_request')
+        verifier = factory(public_key, '/')
+        # Act/Assert
+        assert not verifier.verify(data['headers'])
+
+    @staticmethod
+    @pytest.mark.parametrize('factory', VERIFIERS)
+    def test_verify_missing_headers(factory):
+        """Tests verifying without an authorization header."""
+        # Arrange
+        verifier = factory('key', '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify([])
+        assert e_info.value.reason == REJECTED_MISSING_SIGNATURE
+        assert verifier.rejections == {REJECTED_MISSING_SIGNATURE: 1}
+
+    @staticmethod
+    @pytest.mark.parametrize('factory', VERIFIERS)
+    def test_verify_requires_date(factory):
+        """Tests the date header must be part of the signature."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        headers = data['headers']
+        headers['Authorization'] = headers['Authorization'].replace(
+            'digest date', 'digest')
+        verifier = factory(public_key, '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers)
+        assert e_info.value.reason == REJECTED_MISSING_HEADER
+
+    @staticmethod
+    def test_verify_unsupported_algorithm():
+        """Tests the cryptography engine only supports RSA."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        headers = data['headers']
+        headers['Authorization'] = headers['Authorization'].replace(
+            'rsa-sha256', 'hmac-sha256')
+        verifier = CryptographyVerifier(public_key, '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers)
+        assert e_info.value.reason == REJECTED_UNSUPPORTED_ALGORITHM
+
+    @staticmethod
+    def test_verify_signed_header_missing():
+        """Tests a signed header must be present."""
+        # Arrange
+        data = get_fixture('config_init_sig_pass_request')
+        headers = data['headers']
+        headers.pop('Digest')
+        verifier = CryptographyVerifier('key', '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers)
+        assert e_info.value.reason == REJECTED_MISSING_HEADER
+
+    @staticmethod
+    @pytest.mark.parametrize('authorization', [
+        'Basic dXNlcjpwYXNz',
+        'Signature keyId="abc",algorithm="rsa-sha256"',
+        'Signature keyId="abc" signature="abc" algorithm="rsa-sha256"'])
+    def test_verify_malformed(authorization):
+        """Tests authorization headers that aren't signatures."""
+        # Arrange
+        verifier = CryptographyVerifier('key', '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify({'Authorization': authorization})
+        assert e_info.value.reason == REJECTED_MALFORMED_SIGNATURE
+
+    @staticmethod
+    def test_verify_non_ascii_header():
+        """Tests a signed header that isn't ASCII is malformed."""
+        # Arrange
+        verifier = CryptographyVerifier('key', '/')
+        headers = {
+            'Date': 'caf\xe9',
+            'Authorization': 'Signature keyId="abc",signature="abc",'
+                             'headers="date",algorithm="rsa-sha256"'}
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers)
+        assert e_info.value.reason == REJECTED_MALFORMED_SIGNATURE
+
+    @staticmethod
+    def test_verify_key_id():
+        """Tests the key id must match the configured key id."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        key_id = '/SmartThings/dd:41:39:60:b2:a3:32:0e:d4:79:39:a3:f1:ee:bd:ac'
+        verifier = CryptographyVerifier(public_key, '/', key_id=key_id)
+        other = CryptographyVerifier(public_key, '/', key_id='other')
+        # Act/Assert
+        assert verifier.verify(data['headers'])
+        assert verifier.key_id == key_id
+        with pytest.raises(SignatureVerificationError) as e_info:
+            other.verify(data['headers'])
+        assert e_info.value.reason == REJECTED_KEY_ID
+        assert other.rejections[REJECTED_KEY_ID] == 1
+
+    @staticmethod
+    @pytest.mark.parametrize('date,valid', [
+        (formatdate(usegmt=True), True),
+        (formatdate(time.time() - 600, usegmt=True), False),
+        (formatdate(time.time() + 600, usegmt=True), False),
+        ('not a date', False)])
+    def test_verify_clock_skew(date, valid):
+        """Tests the date header must be within the allowed skew."""
+        # Arrange
+        data = get_fixture('config_init_sig_pass_request')
+        headers = data['headers']
+        headers['Date'] = date
+        verifier = CryptographyVerifier(
+            get_fixture('public_key', 'pem'), '/', max_clock_skew=300)
+        # Act
+        try:
+            verifier.verify(headers)
+            rejected = None
+        except SignatureVerificationError as ex:
+            rejected = ex.reason
+        # Assert
+        assert verifier.max_clock_skew == 300
+        assert (rejected != REJECTED_CLOCK_SKEW) == valid
+
+    @staticmethod
+    def test_verify_digest(private_key, public_key):
+        """Tests the body must match the digest header."""
+        # Arrange
+        body = b'{"lifecycle": "EVENT"}'
+        headers = sign_request(private_key, body)
+        verifier = CryptographyVerifier(public_key, '/')
+        # Act/Assert
+        assert verifier.verify(headers, body)
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers, b'{}')
+        assert e_info.value.reason == REJECTED_DIGEST
+
+    @staticmethod
+    @pytest.mark.parametrize('digest,reason', [
+        (None, REJECTED_MISSING_HEADER),
+        ('MD5=abc', REJECTED_DIGEST),
+        ('SHA-256=not base64!', REJECTED_DIGEST)])
+    def test_verify_digest_invalid(private_key, public_key, digest, reason):
+        """Tests digest headers that can't be checked."""
+        # Arrange
+        body = b'{}'
+        headers = sign_request(private_key, body)
+        headers['Authorization'] = headers['Authorization'].replace(
+            '(request-target) digest date', '(request-target) date')
+        headers.pop('Digest')
+        if digest:
+            headers['Digest'] = digest
+        verifier = CryptographyVerifier(public_key, '/')
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            verifier.verify(headers, body)
+        assert e_info.value.reason == reason
+
+    @staticmethod
+    def test_key_imported_once(monkeypatch):
+        """Tests the public key is only imported on first use."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        verifier = HttpSigVerifier(public_key, '/')
+        import_key = sign.RSA.importKey
+        calls = []
+
+        def counting_import_key(*args, **kwargs):
+            calls.append(args)
+            return import_key(*args, **kwargs)
+        monkeypatch.setattr(sign.RSA, 'importKey', counting_import_key)
+        # Act
+        for _ in range(3):
+            assert verifier.verify(data['headers'])
+        # Assert
+        assert len(calls) == 1
+
+
+class TestVerificationPool:
+    """Tests for the VerificationPool class."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_verify_thread_pool():
+        """Tests verifying in the default thread pool."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        pool = VerificationPool(max_concurrency=2)
+        verifier = create_verifier(public_key, '/')
+        # Act
+        result = await pool.verify(verifier, data['headers'])
+        # Assert
+        assert result
+        assert pool.max_concurrency == 2
+        assert pool.active == 0
+        assert pool.queue_depth == 0
+        pool.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_verify_process_pool():
+        """Tests verifying in a process pool."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        pool = VerificationPool(ProcessPoolExecutor(max_workers=1))
+        verifier = create_verifier(public_key, '/')
+        # Act
+        passed = await pool.verify(
+            verifier, get_fixture('config_init_sig_pass_request')['headers'])
+        failed = await pool.verify(
+            verifier, get_fixture('config_init_sig_fail_request')['headers'])
+        # Assert
+        assert passed
+        assert not failed
+        assert isinstance(pool.executor, ProcessPoolExecutor)
+        pool.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_queue_depth():
+        """Tests verifications wait for a free slot."""
+        # Arrange
+        data = get_fixture('config_init_sig_pass_request')
+        release = threading.Event()
+
+        class BlockingVerifier(SignatureVerifier):
+            """Verifier that blocks until released."""
+
+            def _verify_signature(self, algorithm, message, signature):
+                release.wait()
+                return True
+
+        pool = VerificationPool(max_concurrency=1)
+        verifier = BlockingVerifier('key', '/')
+        # Act
+        tasks = [asyncio.ensure_future(pool.verify(verifier, data['headers']))
+                 for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # Assert
+        assert pool.active == 1
+        assert pool.queue_depth == 2
+        release.set()
+        assert all(await asyncio.gather(*tasks))
+        assert pool.active == 0
+        assert pool.queue_depth == 0
+        pool.shutdown()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_in_pool():
+        """Tests a SmartApp verifies requests in its pool."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_fail_request')
+        pool = VerificationPool(max_concurrency=1)
+        smartapp = SmartApp(public_key=public_key, verification_pool=pool)
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError):
+            await smartapp.handle_request(data['body'], data['headers'])
+        pool.shutdown()
@@ -1,15 +1,27 @@
 """Tests for the SmartApp file."""
 
 import asyncio
+import functools
+import json
 
 import pytest
 
+from pysmartapp.const import (
+    LIFECYCLE_EVENT, LIFECYCLE_PING, REJECTED_CLOCK_SKEW, REJECTED_DIGEST,
+    REJECTED_KEY_ID, SHED_DRAINING)
 from pysmartapp.dispatch import Dispatcher
 from pysmartapp.errors import (
-    SignatureVerificationError, SmartAppNotRegisteredError)
+    SignatureVerificationError, SmartAppNotRegisteredError,
+    SmartAppOverloadedError)
+from pysmartapp.event import EventRequest
+from pysmartapp.instrumentation import (
+    STAGE_DISPATCH, STAGE_ENCODE, STAGE_PARSE, STAGE_PROCESS, STAGE_TOTAL,
+    STAGE_VERIFY, Instrumentation)
+from pysmartapp.request import EmptyDataResponse, Request, Response
+from pysmartapp.signature import HttpSigVerifier, create_verifier
 from pysmartapp.smartapp import SmartApp, SmartAppManager
 
-from .utilities import get_dispatch_handler, get_fixture
+from .utilities import get_dispatch_handler, get_fixture, sign_request
 
 INSTALLED_APP_ID = '8a0dcdc9-1ab4-4c60-9de7-cb78f59a1121'
 APP_ID = 'f6c071aa-6ae7-463f-b0ad-8620ac23140f'
@@ -51,6 +63,67 @@ class TestSmartApp:
         assert app.description == "Description"
         assert app.name == "Name"
 
+    @staticmethod
+    def test_verifier_cached():
+        """Tests the verifier is reused until the public key changes."""
+        # Arrange
+        app = SmartApp(path='/my/test/path', public_key='test')
+        verifier = app.verifier
+        # Act
+        cached = app.verifier
+        app.public_key = 'test2'
+        # Assert
+        assert cached is verifier
+        assert app.verifier is not verifier
+        assert app.verifier.public_key == 'test2'
+        assert app.verifier.path == '/my/test/path'
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_verifier_factory():
+        """Tests handle_request with a custom verifier engine."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        smartapp = SmartApp(public_key=public_key,
+                            verifier_factory=HttpSigVerifier)
+        # Act
+        resp = await smartapp.handle_request(
+            data['body'], data['headers'], True)
+        # Assert
+        assert resp
+        assert isinstance(smartapp.verifier, HttpSigVerifier)
+
+    @staticmethod
+    def test_register_request_type_invalid(smartapp):
+        """Tests a request type must have a lifecycle."""
+        with pytest.raises(ValueError):
+            smartapp.register_request_type('', EventRequest)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_register_request_type(smartapp):
+        """Tests handling a lifecycle with a custom request type."""
+        # Arrange
+        class ConfirmationRequest(Request):
+            """Request for the confirmation lifecycle."""
+
+            async def _process(self, app) -> Response:
+                return EmptyDataResponse('targetUrl')
+
+        request = get_fixture('ping_request')
+        request['lifecycle'] = 'CONFIRMATION'
+        handler = get_dispatch_handler(smartapp)
+        smartapp.register_request_type('CONFIRMATION', ConfirmationRequest)
+        smartapp.dispatcher.connect('CONFIRMATION', handler)
+        # Act
+        response = await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert smartapp.request_types['CONFIRMATION'] is ConfirmationRequest
+        assert handler.fired
+        assert response == {'targetUrl': {}}
+
     @staticmethod
     @pytest.mark.asyncio
     async def test_ping(smartapp):
@@ -153,6 +226,66 @@ class TestSmartApp:
         assert handler.fired
         assert response == expected_response
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_event_filtered(smartapp):
+        """Tests targets connected with filters get their events only."""
+        # Arrange
+        request = get_fixture("event_request")
+        received = []
+
+        async def handler(req, resp, app):
+            received.append([evt.attribute for evt in req.events])
+        smartapp.connect_event(handler, capability='lock')
+        smartapp.connect_event(handler, device_id='unknown')
+        # Act
+        await smartapp.handle_request(request, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert received == [['lock']]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_wait_for_handlers(event_loop):
+        """Tests the response is returned after the handlers finish."""
+        # Arrange
+        smartapp = SmartApp(dispatcher=Dispatcher(loop=event_loop),
+                            wait_for_handlers=True, handler_timeout=5)
+        handler = get_dispatch_handler(smartapp)
+        smartapp.connect_event(handler)
+        # Act
+        await smartapp.handle_request(
+            get_fixture("event_request"), None, False)
+        # Assert
+        assert handler.fired
+        assert smartapp.wait_for_handlers
+        assert smartapp.handler_timeout == 5
+        assert not smartapp.dispatcher.in_flight
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_instrumentation(event_loop):
+        """Tests the duration of each stage is recorded by lifecycle."""
+        # Arrange
+        instrumentation = Instrumentation()
+        smartapp = SmartApp(dispatcher=Dispatcher(loop=event_loop),
+                            instrumentation=instrumentation)
+        body = json.dumps(get_fixture('event_request')).encode()
+        # Act
+        await smartapp.handle_request(get_fixture('ping_request'))
+        await smartapp.handle_request_bytes(body, None, False)
+        # Assert
+        snapshot = instrumentation.snapshot()
+        assert set(snapshot[LIFECYCLE_EVENT]) == {
+            STAGE_PARSE, STAGE_VERIFY, STAGE_PROCESS, STAGE_DISPATCH,
+            STAGE_ENCODE, STAGE_TOTAL}
+        assert set(snapshot[LIFECYCLE_PING]) == {
+            STAGE_PARSE, STAGE_VERIFY, STAGE_PROCESS, STAGE_DISPATCH,
+            STAGE_ENCODE, STAGE_TOTAL}
+        timing = snapshot[LIFECYCLE_EVENT]
+        assert timing[STAGE_TOTAL].max_ns >= timing[STAGE_PARSE].max_ns
+        assert smartapp.instrumentation is instrumentation
+
     @staticmethod
     @pytest.mark.asyncio
     async def test_oauth_callback(smartapp):
@@ -225,6 +358,66 @@ class TestSmartApp:
         with pytest.raises(SignatureVerificationError):
             await smartapp.handle_request(data['body'], data['headers'], True)
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_bytes(smartapp):
+        """Tests handling a request from the raw body."""
+        # Arrange
+        body = json.dumps(get_fixture('event_request')).encode()
+        expected_response = get_fixture('event_response')
+        handler = get_dispatch_handler(smartapp)
+        smartapp.connect_event(handler)
+        # Act
+        response = await smartapp.handle_request_bytes(body, None, False)
+        await asyncio.gather(*smartapp.dispatcher.last_sent)
+        # Assert
+        assert handler.fired
+        assert json.loads(response) == expected_response
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_bytes_signed(private_key, public_key):
+        """Tests the digest of the raw body is checked."""
+        # Arrange
+        body = json.dumps(get_fixture('event_request')).encode()
+        headers = sign_request(private_key, body)
+        smartapp = SmartApp(public_key=public_key)
+        # Act
+        response = await smartapp.handle_request_bytes(body, headers)
+        # Assert
+        assert json.loads(response) == get_fixture('event_response')
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_bytes_digest_mismatch(
+            private_key, public_key):
+        """Tests a body that doesn't match the digest is rejected."""
+        # Arrange
+        body = json.dumps(get_fixture('event_request')).encode()
+        headers = sign_request(private_key, body)
+        smartapp = SmartApp(public_key=public_key)
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            await smartapp.handle_request_bytes(body + b' ', headers)
+        assert e_info.value.reason == REJECTED_DIGEST
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_sig_verification_stale():
+        """Tests handle_request rejects stale requests before verifying."""
+        # Arrange
+        public_key = get_fixture('public_key', 'pem')
+        data = get_fixture('config_init_sig_pass_request')
+        smartapp = SmartApp(
+            public_key=public_key,
+            verifier_factory=functools.partial(
+                create_verifier, max_clock_skew=300))
+        # Act/Assert
+        with pytest.raises(SignatureVerificationError) as e_info:
+            await smartapp.handle_request(data['body'], data['headers'], True)
+        assert e_info.value.reason == REJECTED_CLOCK_SKEW
+        assert smartapp.verifier.rejections == {REJECTED_CLOCK_SKEW: 1}
+
 
 class TestSmartAppManager:
     """Tests for the SmartAppManager class."""
@@ -270,6 +463,30 @@ class TestSmartAppManager:
         # Assert
         assert e_info.value.installed_app_id == INSTALLED_APP_ID
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_register_key_id(manager, private_key, public_key):
+        """Tests each registered app checks its own key id."""
+        # Arrange
+        first = manager.register('first', public_key,
+                                 key_id='/SmartThings/test')
+        second = manager.register('second', public_key, key_id='other')
+        request = get_fixture('event_request')
+        request['settings']['appId'] = 'first'
+        body = json.dumps(request).encode()
+        headers = sign_request(private_key, body, manager.path)
+        other = json.dumps({**request, 'settings': {'appId': 'second'}}) \
+            .encode()
+        # Act
+        await manager.handle_request_bytes(body, headers)
+        with pytest.raises(SignatureVerificationError) as e_info:
+            await manager.handle_request_bytes(
+                other, sign_request(private_key, other, manager.path))
+        # Assert
+        assert first.key_id == first.verifier.key_id == '/SmartThings/test'
+        assert second.verifier.key_id == 'other'
+        assert e_info.value.reason == REJECTED_KEY_ID
+
     @staticmethod
     def test_register(manager: SmartAppManager):
         """Test register."""
@@ -280,8 +497,22 @@ class TestSmartAppManager:
         assert app.app_id == APP_ID
         assert app.public_key == public_key
         assert app.path == manager.path
+        assert app.verifier_factory == manager.verifier_factory
+        assert app.wait_for_handlers == manager.wait_for_handlers
+        assert app.handler_timeout == manager.handler_timeout
         assert APP_ID in manager.smartapps
 
+    @staticmethod
+    def test_register_verifier_factory():
+        """Test registered apps use the manager's verifier engine."""
+        # Arrange
+        manager = SmartAppManager('/path', verifier_factory=HttpSigVerifier)
+        # Act
+        app = manager.register(APP_ID, '123')
+        # Assert
+        assert app.verifier_factory == HttpSigVerifier
+        assert isinstance(app.verifier, HttpSigVerifier)
+
     @staticmethod
     def test_register_no_app_id(manager: SmartAppManager):
         """Test register with no SmartApp app id."""
@@ -331,6 +562,22 @@ class TestSmartAppManager:
         # Assert
         assert str(e_info.value) == 'smartapp was not previously registered.'
 
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_handle_request_bytes(manager: SmartAppManager):
+        """Tests handling a raw request for a registered app."""
+        # Arrange
+        body = json.dumps(get_fixture('install_request')).encode()
+        app = manager.register(APP_ID, 'none')
+        handler = get_dispatch_handler(app)
+        manager.connect_install(handler)
+        # Act
+        response = await manager.handle_request_bytes(body, None, False)
+        await asyncio.gather(*manager.dispatcher.last_sent)
+        # Assert
+        assert handler.fired
+        assert response == b'{"installData":{}}'
+
     @staticmethod
     @pytest.mark.asyncio
     async def test_on_config(manager: SmartAppManager):
@@ -426,3 +673,83 @@ class TestSmartAppManager:
         await asyncio.gather(*manager.dispatcher.last_sent)
         # Assert
         assert handler.fired
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drain(manager: SmartAppManager):
+        """Tests drain sheds new requests and waits for those in flight."""
+        # Arrange
+        manager.register(APP_ID, None)
+        release = asyncio.Event()
+        manager.register_request_type('SLOW', slow_request_type(release))
+        handled = []
+
+        async def handler(req, resp, app):
+            await asyncio.sleep(0)
+            handled.append(req)
+        manager.dispatcher.connect('SLOW', handler)
+        request = get_fixture('event_request')
+        request['lifecycle'] = 'SLOW'
+        in_flight = asyncio.create_task(
+            manager.handle_request(request, None, False))
+        await asyncio.sleep(0)
+        # Act
+        draining = asyncio.create_task(manager.drain(1))
+        await asyncio.sleep(0)
+        with pytest.raises(SmartAppOverloadedError) as ex:
+            await manager.handle_request(request, None, False)
+        requests_in_flight = manager.requests_in_flight
+        release.set()
+        result = await draining
+        # Assert
+        assert ex.value.reason == SHED_DRAINING
+        assert str(ex.value) == \
+            "Request for app '' was shed: the app is draining."
+        assert requests_in_flight == 1
+        assert manager.draining
+        assert manager.requests_in_flight == 0
+        assert len(handled) == 1
+        assert result.finished == 1
+        assert result.drained
+        assert await in_flight == {}
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_drain_timeout(manager: SmartAppManager):
+        """Tests drain stops waiting for requests at the timeout."""
+        # Arrange
+        manager.register(APP_ID, None)
+        release = asyncio.Event()
+        manager.register_request_type('SLOW', slow_request_type(release))
+        request = get_fixture('event_request')
+        request['lifecycle'] = 'SLOW'
+        in_flight = asyncio.create_task(
+            manager.handle_request(request, None, False))
+        await asyncio.sleep(0)
+        # Act
+        result = await manager.drain(0.01)
+        # Assert
+        assert result.drained
+        assert manager.requests_in_flight == 1
+        release.set()
+        await in_flight
+
+
+def slow_request_type(release: asyncio.Event):
+    """Create a request type that's processed once released."""
+    class SlowRequest(Request):
+        """Defines a request processed once released."""
+
+        async def _process(self, app) -> Response:
+            await release.wait()
+            return SlowResponse()
+
+    return SlowRequest
+
+
+class SlowResponse(Response):
+    """Defines an empty response."""
+
+    def to_data(self) -> dict:
+        """Create a data structure for the response."""
+        return {}
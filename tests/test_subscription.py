@@ -0,0 +1,64 @@
+"""Tests for the subscription module."""
+
+import pytest
+
+from pysmartapp.const import EVENT_TYPE_TIMER
+from pysmartapp.event import EventRequest
+from pysmartapp.subscription import EventSubscriptions
+
+from .utilities import get_fixture
+
+
+class TestEventSubscriptions:
+    """Tests for the EventSubscriptions class."""
+
+    @staticmethod
+    def test_add_invalid():
+        """Tests filters must name known event fields."""
+        subscriptions = EventSubscriptions()
+        with pytest.raises(ValueError):
+            subscriptions.add(print, {})
+        with pytest.raises(ValueError):
+            subscriptions.add(print, {'unknown': 'value'})
+
+    @staticmethod
+    def test_match():
+        """Tests targets receive only the events matching every filter."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        subscriptions = EventSubscriptions()
+        subscriptions.add('lock', {'capability': 'lock', 'attribute': 'lock'})
+        subscriptions.add('timer', {'event_type': EVENT_TYPE_TIMER})
+        subscriptions.add('none', {'capability': 'lock',
+                                   'attribute': 'motion'})
+        subscriptions.add('motion', {
+            'subscription_name': 'motion_sensors',
+            'device_id': '6f5ea629-4c05-4a90-a244-cc129b0a80c3'})
+        # Act
+        matches = subscriptions.match(req)
+        # Assert
+        assert len(subscriptions) == 4
+        assert [target for target, _ in matches] == [
+            'lock', 'timer', 'motion']
+        assert [[evt.raw_data for evt in match.events]
+                for _, match in matches] == [
+                    [req.event_data_raw['events'][1]],
+                    [req.event_data_raw['events'][2]],
+                    [req.event_data_raw['events'][0]]]
+        assert matches[0][1].events[0] is req.events[1]
+        assert matches[0][1].installed_app_id == req.installed_app_id
+
+    @staticmethod
+    def test_remove():
+        """Tests removed subscriptions no longer match."""
+        # Arrange
+        req = EventRequest(get_fixture('event_request'))
+        subscriptions = EventSubscriptions()
+        subscription = subscriptions.add(
+            'lock', {'capability': 'lock', 'attribute': 'lock'})
+        # Act
+        subscriptions.remove(subscription)
+        subscriptions.remove(subscription)
+        # Assert
+        assert not subscriptions
+        assert not subscriptions.match(req)
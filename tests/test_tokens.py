@@ -0,0 +1,375 @@
+"""Tests for the tokens module."""
+
+import asyncio
+import threading
+
+import pytest
+
+from pysmartapp.dispatch import Dispatcher
+from pysmartapp.smartapp import SmartAppManager
+from pysmartapp.tokens import (
+    InstalledAppTokens, SQLiteTokenBackend, TokenBackend, TokenStore)
+
+from .test_smartapp import APP_ID, INSTALLED_APP_ID
+from .utilities import get_fixture
+
+LOCATION_ID = 'e675a3d9-2499-406c-86dc-8a492a886494'
+
+
+class RecordingBackend(TokenBackend):
+    """Records the batches written to it."""
+
+    def __init__(self, stored: dict = None):
+        """Create a new instance of the RecordingBackend class."""
+        self.stored = dict(stored or {})
+        self.saved = []
+        self.deleted = []
+        self.loads = 0
+        self.fail = False
+
+    def load(self, installed_app_id: str):
+        """Load the stored tokens."""
+        self.loads += 1
+        return self.stored.get(installed_app_id)
+
+    def save_many(self, tokens):
+        """Record the saved tokens."""
+        if self.fail:
+            raise OSError('failed')
+        self.saved.append(list(tokens))
+        for item in tokens:
+            self.stored[item.installed_app_id] = item
+
+    def delete_many(self, installed_app_ids):
+        """Record the deleted installed apps."""
+        self.deleted.append(list(installed_app_ids))
+        for installed_app_id in installed_app_ids:
+            self.stored.pop(installed_app_id, None)
+
+
+def build_tokens(installed_app_id: str = INSTALLED_APP_ID,
+                 auth_token: str = 'auth', refresh_token: str = 'refresh'):
+    """Create tokens of an installed app."""
+    return InstalledAppTokens(
+        installed_app_id, LOCATION_ID, auth_token, refresh_token, 0.0)
+
+
+class TestTokenBackend:
+    """Tests for the TokenBackend class."""
+
+    @staticmethod
+    def test_not_implemented():
+        """Tests the backend methods must be implemented."""
+        backend = TokenBackend()
+        with pytest.raises(NotImplementedError):
+            backend.load(INSTALLED_APP_ID)
+        with pytest.raises(NotImplementedError):
+            backend.save_many([])
+        with pytest.raises(NotImplementedError):
+            backend.delete_many([])
+
+
+class TestSQLiteTokenBackend:
+    """Tests for the SQLiteTokenBackend class."""
+
+    @staticmethod
+    def test_save_load_delete(tmp_path):
+        """Tests tokens are saved, loaded and deleted."""
+        # Arrange
+        path = str(tmp_path / 'tokens.db')
+        backend = SQLiteTokenBackend(path)
+        # Act
+        backend.save_many([build_tokens(), build_tokens('other')])
+        backend.save_many([
+            build_tokens(auth_token='new', refresh_token=None)])
+        backend.delete_many(['other'])
+        backend.close()
+        reopened = SQLiteTokenBackend(path)
+        # Assert
+        assert reopened.load(INSTALLED_APP_ID) == \
+            build_tokens(auth_token='new')
+        assert reopened.load('other') is None
+        reopened.close()
+
+
+class TestTokenStore:
+    """Tests for the TokenStore class."""
+
+    @staticmethod
+    def test_init():
+        """Tests the store is initialized."""
+        # Arrange
+        backend = RecordingBackend()
+        # Act
+        store = TokenStore(backend, max_size=10, flush_delay=5)
+        # Assert
+        assert store.backend is backend
+        assert store.max_size == 10
+        assert store.flush_delay == 5
+        assert not store.pending
+        assert not store.writes
+        assert not store
+        with pytest.raises(ValueError):
+            TokenStore(max_size=0)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_memory_only():
+        """Tests tokens are kept for the most recently used apps."""
+        # Arrange
+        store = TokenStore(max_size=2)
+        # Act
+        store.update('first', LOCATION_ID, 'auth', 'refresh')
+        store.update('second', LOCATION_ID, 'auth', 'refresh')
+        await store.get('first')
+        store.update('third', LOCATION_ID, 'auth', 'refresh')
+        # Assert
+        assert len(store) == 2
+        assert (await store.get('first')).auth_token == 'auth'
+        assert await store.get('second') is None
+        assert not store.pending
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_coalesced_writes():
+        """Tests unchanged tokens aren't written and changes are batched."""
+        # Arrange
+        backend = RecordingBackend()
+        store = TokenStore(backend, flush_delay=0.01)
+        # Act
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'auth', 'refresh')
+        for _ in range(100):
+            store.update(INSTALLED_APP_ID, LOCATION_ID, 'auth')
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'new')
+        store.update('other', LOCATION_ID, 'auth')
+        pending = store.pending
+        await asyncio.sleep(0.05)
+        # Assert
+        assert pending == 2
+        assert not store.pending
+        assert store.writes == 1
+        saved = {item.installed_app_id: item for item in backend.saved[0]}
+        assert len(backend.saved) == 1
+        assert saved[INSTALLED_APP_ID].auth_token == 'new'
+        assert saved[INSTALLED_APP_ID].refresh_token == 'refresh'
+        assert saved['other'].refresh_token is None
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_get_loads():
+        """Tests tokens not cached are loaded from the backend once."""
+        # Arrange
+        backend = RecordingBackend({INSTALLED_APP_ID: build_tokens()})
+        store = TokenStore(backend)
+        # Act
+        first = await store.get(INSTALLED_APP_ID)
+        second = await store.get(INSTALLED_APP_ID)
+        missing = await store.get('missing')
+        # Assert
+        assert first == second == build_tokens()
+        assert missing is None
+        assert backend.loads == 2
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_get_merges_refresh_token():
+        """Tests tokens seen in an EVENT get the stored refresh token."""
+        # Arrange
+        backend = RecordingBackend({INSTALLED_APP_ID: build_tokens()})
+        store = TokenStore(backend, flush_delay=10)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'new')
+        # Act
+        result = await store.get(INSTALLED_APP_ID)
+        cached = await store.get(INSTALLED_APP_ID)
+        # Assert
+        assert result.auth_token == 'new'
+        assert result.refresh_token == 'refresh'
+        assert cached == result
+        assert backend.loads == 1
+        await store.flush()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_get_pending_after_eviction():
+        """Tests evicted tokens waiting to be written are still found."""
+        # Arrange
+        backend = RecordingBackend()
+        store = TokenStore(backend, max_size=1, flush_delay=10)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'auth', 'refresh')
+        store.update('other', LOCATION_ID, 'auth', 'refresh')
+        # Act
+        result = await store.get(INSTALLED_APP_ID)
+        # Assert
+        assert result.auth_token == 'auth'
+        assert not backend.loads
+        await store.flush()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_get_changed_while_loading():
+        """Tests tokens that change while being loaded are kept."""
+        # Arrange
+        backend = RecordingBackend({INSTALLED_APP_ID: build_tokens()})
+        store = TokenStore(backend, flush_delay=10)
+        # Act
+        loading = asyncio.create_task(store.get(INSTALLED_APP_ID))
+        await asyncio.sleep(0)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'new', 'newer')
+        result = await loading
+        removing = asyncio.create_task(store.get('other'))
+        await asyncio.sleep(0)
+        store.remove('other')
+        removed = await removing
+        # Assert
+        assert result.auth_token == 'new'
+        assert removed is None
+        await store.flush()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_remove():
+        """Tests removed tokens are forgotten and deleted."""
+        # Arrange
+        backend = RecordingBackend({INSTALLED_APP_ID: build_tokens()})
+        store = TokenStore(backend, flush_delay=10)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'new', 'newer')
+        # Act
+        store.remove(INSTALLED_APP_ID)
+        result = await store.get(INSTALLED_APP_ID)
+        await store.flush()
+        # Assert
+        assert result is None
+        assert not backend.saved
+        assert backend.deleted == [[INSTALLED_APP_ID]]
+        assert not backend.loads
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_get_while_deleting():
+        """Tests removed tokens aren't loaded while they're deleted."""
+        # Arrange
+        backend = RecordingBackend({INSTALLED_APP_ID: build_tokens()})
+        started = threading.Event()
+        release = threading.Event()
+        delete_many = backend.delete_many
+
+        def slow_delete(installed_app_ids):
+            started.set()
+            release.wait(5)
+            delete_many(installed_app_ids)
+        backend.delete_many = slow_delete
+        store = TokenStore(backend, flush_delay=10)
+        store.remove(INSTALLED_APP_ID)
+        flushing = asyncio.create_task(store.flush())
+        await asyncio.get_running_loop().run_in_executor(
+            None, started.wait, 5)
+        # Act
+        during = await store.get(INSTALLED_APP_ID)
+        release.set()
+        await flushing
+        after = await store.get(INSTALLED_APP_ID)
+        # Assert
+        assert during is None
+        assert after is None
+        assert not store
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_flush_waits_for_scheduled():
+        """Tests a flush waits for a scheduled flush already writing."""
+        # Arrange
+        backend = RecordingBackend()
+        started = threading.Event()
+        release = threading.Event()
+        save_many = backend.save_many
+
+        def slow_save(tokens):
+            started.set()
+            release.wait(5)
+            save_many(tokens)
+        backend.save_many = slow_save
+        store = TokenStore(backend, flush_delay=0)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'auth', 'refresh')
+        await asyncio.get_running_loop().run_in_executor(
+            None, started.wait, 5)
+        # Act
+        flushing = asyncio.create_task(store.flush())
+        await asyncio.sleep(0.01)
+        waited = not flushing.done()
+        release.set()
+        await flushing
+        # Assert
+        assert waited
+        assert backend.saved
+        assert store.writes == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_flush_failure(caplog):
+        """Tests changes that failed to be written are written later."""
+        # Arrange
+        backend = RecordingBackend()
+        backend.fail = True
+        store = TokenStore(backend, flush_delay=10)
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'auth', 'refresh')
+        store.update('other', LOCATION_ID, 'auth', 'refresh')
+        store.remove('removed')
+        # Act
+        await store.flush()
+        pending = store.pending
+        backend.fail = False
+        store.update(INSTALLED_APP_ID, LOCATION_ID, 'new')
+        await store.flush()
+        # Assert
+        assert pending == 3
+        assert 'Unable to write the tokens of 3 installed apps.' \
+            in caplog.text
+        assert store.writes == 1
+        assert backend.stored[INSTALLED_APP_ID].auth_token == 'new'
+        assert 'other' in backend.stored
+        assert backend.deleted == [['removed']]
+
+
+class TestTokenStoreLifecycles:
+    """Tests for feeding the token store from lifecycle requests."""
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_lifecycles(event_loop):
+        """Tests install, update and event store tokens and uninstall."""
+        # Arrange
+        backend = RecordingBackend()
+        store = TokenStore(backend, flush_delay=10)
+        manager = SmartAppManager(
+            '/path', dispatcher=Dispatcher(loop=event_loop),
+            token_store=store)
+        smartapp = manager.register(APP_ID, None)
+        install = get_fixture('install_request')
+        event = get_fixture('event_request')
+        event['eventData']['authToken'] = 'event'
+        # Act
+        await manager.handle_request(install, None, False)
+        installed = await store.get(INSTALLED_APP_ID)
+        await manager.handle_request(get_fixture('update_request'), None,
+                                     False)
+        await manager.handle_request(event, None, False)
+        updated = await store.get(INSTALLED_APP_ID)
+        await store.flush()
+        flushed = dict(backend.stored)
+        await manager.handle_request(
+            get_fixture('uninstall_request'), None, False)
+        result = await manager.drain(0)
+        # Assert
+        assert smartapp.token_store is store
+        assert installed.auth_token == install['installData']['authToken']
+        assert installed.refresh_token == \
+            install['installData']['refreshToken']
+        assert updated.auth_token == 'event'
+        assert updated.refresh_token == get_fixture(
+            'update_request')['updateData']['refreshToken']
+        assert result.drained
+        assert flushed[INSTALLED_APP_ID] == updated
+        assert backend.saved == [[updated]]
+        assert backend.deleted == [[INSTALLED_APP_ID]]
+        assert not store.pending
+        assert await store.get(INSTALLED_APP_ID) is None
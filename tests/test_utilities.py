@@ -3,6 +3,10 @@
 import pytest
 
 from pysmartapp import utilities
+from pysmartapp.ping import PingRequest
+from pysmartapp.request import Request
+
+from .utilities import get_fixture
 
 
 def test_create_request_invalid():
@@ -12,3 +16,26 @@ def test_create_request_invalid():
     # Act/Assert
     with pytest.raises(ValueError):
         utilities.create_request(data)
+
+
+def test_create_request():
+    """Tests the create_request method uses the registered type."""
+    # Arrange
+    data = get_fixture('ping_request')
+    # Act
+    req = utilities.create_request(data)
+    # Assert
+    assert isinstance(req, PingRequest)
+
+
+def test_create_request_custom_types():
+    """Tests the create_request method with custom request types."""
+    # Arrange
+    data = get_fixture('ping_request')
+    data['lifecycle'] = 'CONFIRMATION'
+    # Act
+    req = utilities.create_request(data, {'CONFIRMATION': Request})
+    # Assert
+    assert type(req) is Request  # pylint: disable=unidiomatic-typecheck
+    with pytest.raises(ValueError):
+        utilities.create_request(data)
@@ -1,6 +1,12 @@
 """Testing utilities."""
+import base64
+from email.utils import formatdate
+import hashlib
 import json
 
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
 
 def get_fixture(file: str, ext: str = 'json'):
     """Load a fixtures file."""
@@ -18,3 +24,23 @@ def get_dispatch_handler(smartapp):
         assert app == smartapp
     handler.fired = False
     return handler
+
+
+def sign_request(private_key, body: bytes, path: str = '/',
+                 date: str = None) -> dict:
+    """Get signed headers for the body the way SmartThings sends them."""
+    digest = base64.b64encode(hashlib.sha256(body).digest()).decode()
+    headers = {
+        'Date': date or formatdate(usegmt=True),
+        'Digest': F"SHA-256={digest}"
+    }
+    message = '\n'.join([
+        F"(request-target): post {path}",
+        F"digest: {headers['Digest']}",
+        F"date: {headers['Date']}"]).encode('ascii')
+    signature = base64.b64encode(private_key.sign(
+        message, padding.PKCS1v15(), hashes.SHA256())).decode()
+    headers['Authorization'] = (
+        'Signature keyId="/SmartThings/test",signature="' + signature +
+        '",headers="(request-target) digest date",algorithm="rsa-sha256"')
+    return headers